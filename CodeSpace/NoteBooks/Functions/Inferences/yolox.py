@@ -3,23 +3,34 @@
 # https://github.com/Megvii-BaseDetection/YOLOX/blob/237e943ac64aa32eb32f875faa93ebb18512d41d/yolox/data/data_augment.py
 # https://github.com/Megvii-BaseDetection/YOLOX/blob/ac379df3c97d1835ebd319afad0c031c36d03f36/yolox/utils/demo_utils.py
 
+import threading
+from typing import Optional
+
 import cv2
 import numpy as np
-import onnxruntime
 from onnxruntime.capi import _pybind_state as C
 from PIL import Image as PILImage
 
 from Functions.Inferences.constants import ElementType, Source
 from Functions.Inferences.layoutelement import LayoutElements
 from Functions.Inferences.unstructuredmodel import (
+    ModelNotInitializedError,
     UnstructuredObjectDetectionModel,
 )
+from Functions import tracing
+from Functions.ort_session import create_session
 from Functions.Inferences.utils import (
     LazyDict,
     LazyEvaluateInfo,
     download_if_needed_and_get_local_path,
 )
 
+# The model was trained and exported with this (height, width) input shape
+YOLOX_INPUT_SHAPE = (1024, 768)
+PAD_VALUE = 114
+# Resize buffers kept per thread; documents rarely mix more page sizes than this
+MAX_RESIZE_BUFFERS = 8
+
 YOLOX_LABEL_MAP = {
     0: ElementType.CAPTION,
     1: ElementType.FOOTNOTE,
@@ -42,6 +53,8 @@ MODEL_TYPES = {
             "yolox_l0.05.onnx",
         ),
         label_map=YOLOX_LABEL_MAP,
+        score_threshold=0.25,
+        nms_threshold=0.1,
     ),
     "yolox_tiny": LazyDict(
         model_path=LazyEvaluateInfo(
@@ -50,6 +63,8 @@ MODEL_TYPES = {
             "yolox_tiny.onnx",
         ),
         label_map=YOLOX_LABEL_MAP,
+        score_threshold=0.25,
+        nms_threshold=0.1,
     ),
     "yolox_quantized": LazyDict(
         model_path=LazyEvaluateInfo(
@@ -58,6 +73,10 @@ MODEL_TYPES = {
             "yolox_l0.05_quantized.onnx",
         ),
         label_map=YOLOX_LABEL_MAP,
+        # Note (Benjamin): Distinct models (quantized and original) requires distincts
+        # levels of thresholds
+        score_threshold=0.07,
+        nms_threshold=0.0,
     ),
 }
 
@@ -68,8 +87,25 @@ class UnstructuredYoloXModel(UnstructuredObjectDetectionModel):
         super().predict(x)
         return self.image_processing(x)
 
-    def initialize(self, model_path: str, label_map: dict):
-        """Start inference session for YoloX model."""
+    def initialize(
+        self,
+        model_path: str,
+        label_map: dict,
+        session_options: Optional[dict] = None,
+        score_threshold: Optional[float] = None,
+        nms_threshold: Optional[float] = None,
+    ):
+        """Start inference session for YoloX model.
+
+        ``score_threshold`` and ``nms_threshold`` are per model; see ``MODEL_TYPES``.
+        When they are not given they follow the model file: those of
+        ``yolox_quantized`` if ``"quantized"`` is in ``model_path``, else those
+        of ``yolox``.
+
+        ``session_options`` (threads, execution mode, optimization level, memory
+        arena, optimized-model cache directory) override the ``ORT_*`` environment
+        variables; see ``Functions.ort_session.resolve_session_config``.
+        """
         self.model_path = model_path
 
         available_providers = C.get_available_providers()
@@ -80,12 +116,45 @@ class UnstructuredYoloXModel(UnstructuredObjectDetectionModel):
         ]
         providers = [provider for provider in ordered_providers if provider in available_providers]
 
-        self.model = onnxruntime.InferenceSession(
-            model_path,
-            providers=providers,
-        )
+        self.model, self.session_info = create_session(model_path, providers, **(session_options or {}))
 
         self.layout_classes = label_map
+        defaults = MODEL_TYPES["yolox_quantized" if "quantized" in model_path else "yolox"]
+        self.score_threshold = defaults["score_threshold"] if score_threshold is None else score_threshold
+        self.nms_threshold = defaults["nms_threshold"] if nms_threshold is None else nms_threshold
+        self.preprocessor = YoloXPreprocessor(YOLOX_INPUT_SHAPE)
+        self.postprocessor = YoloXPostprocessor()
+
+    def predict_batch(self, images, batch_size: int = 8) -> list[LayoutElements]:
+        """Predict using YoloX model on several pages at once.
+
+        Pages are preprocessed in bulk and sent to the session as one
+        ``[N, 3, H, W]`` tensor per chunk of ``batch_size`` pages. Graphs exported with a
+        fixed batch axis are run page by page instead. One ``LayoutElements`` is returned
+        per input image, in input order.
+        """
+        if self.model is None:
+            raise ModelNotInitializedError(
+                "Model has not been initialized. Please call the initialize method with the "
+                "appropriate arguments for loading the model.",
+            )
+        if batch_size < 1:
+            raise ValueError("batch_size must be a positive integer.")
+
+        images = list(images)
+        if not self.supports_batching():
+            batch_size = 1
+
+        results = []
+        for start in range(0, len(images), batch_size):
+            chunk = images[start : start + batch_size]
+            results.extend(self.batch_processing(chunk))
+        return results
+
+    def supports_batching(self) -> bool:
+        """Whether the exported graph accepts more than one image per run."""
+        batch_dim = self.model.get_inputs()[0].shape[0]
+        return not isinstance(batch_dim, int) or batch_dim < 1
 
     def image_processing(
         self,
@@ -103,35 +172,39 @@ class UnstructuredYoloXModel(UnstructuredObjectDetectionModel):
         output_directory
             Boolean indicating if result will be stored
         """
-        # The model was trained and exported with this shape
+        return self.batch_processing([image])[0]
+
+    def batch_processing(self, images: list) -> list[LayoutElements]:
+        """Run YoloX over a list of images in a single session call."""
         # TODO (benjamin): check other shapes for inference
-        input_shape = (1024, 768)
-        origin_img = np.array(image)
-        img, ratio = preprocess(origin_img, input_shape)
+        input_shape = YOLOX_INPUT_SHAPE
+        with tracing.span(tracing.PREPROCESS, pages=len(images)):
+            batch, ratios = self.preprocessor([np.asarray(image) for image in images])
         session = self.model
 
-        ort_inputs = {session.get_inputs()[0].name: img[None, :, :, :]}
-        output = session.run(None, ort_inputs)
-        # TODO(benjamin): check for p6
-        predictions = demo_postprocess(output[0], input_shape, p6=False)[0]
-
-        boxes = predictions[:, :4]
-        scores = predictions[:, 4:5] * predictions[:, 5:]
-
-        boxes_xyxy = np.ones_like(boxes)
-        boxes_xyxy[:, 0] = boxes[:, 0] - boxes[:, 2] / 2.0
-        boxes_xyxy[:, 1] = boxes[:, 1] - boxes[:, 3] / 2.0
-        boxes_xyxy[:, 2] = boxes[:, 0] + boxes[:, 2] / 2.0
-        boxes_xyxy[:, 3] = boxes[:, 1] + boxes[:, 3] / 2.0
-        boxes_xyxy /= ratio
-
-        # Note (Benjamin): Distinct models (quantized and original) requires distincts
-        # levels of thresholds
-        if "quantized" in self.model_path:
-            dets = multiclass_nms(boxes_xyxy, scores, nms_thr=0.0, score_thr=0.07)
-        else:
-            dets = multiclass_nms(boxes_xyxy, scores, nms_thr=0.1, score_thr=0.25)
+        ort_inputs = {session.get_inputs()[0].name: batch}
+        with tracing.span(tracing.LAYOUT, pages=len(images)):
+            output = session.run(None, ort_inputs)
 
+        # TODO(benjamin): check for p6
+        with tracing.span(tracing.NMS, pages=len(images)) as span:
+            layouts = [
+                self._layout_from_detections(
+                    self.postprocessor(
+                        page_predictions,
+                        input_shape,
+                        ratio,
+                        score_thr=self.score_threshold,
+                        nms_thr=self.nms_threshold,
+                    )
+                )
+                for page_predictions, ratio in zip(output[0], ratios)
+            ]
+            span.set(detections=sum(len(layout.element_class_ids) for layout in layouts))
+        return layouts
+
+    def _layout_from_detections(self, dets: np.ndarray) -> LayoutElements:
+        """Turn the detections of one page (``[x1, y1, x2, y2, score, class]``) into ``LayoutElements``."""
         order = np.argsort(dets[:, 1])
         sorted_dets = dets[order]
 
@@ -167,6 +240,145 @@ def preprocess(img, input_size, swap=(2, 0, 1)):
     return padded_img, r
 
 
+class YoloXPreprocessor:
+    """Letterbox pages straight into a reused float32 NCHW input tensor.
+
+    ``preprocess`` allocates a padded canvas, a resized copy and a float copy
+    for every page. Here each thread keeps one ``[N, 3, H, W]`` tensor per batch
+    size and one resize buffer per resized page size, so pages of the same size
+    are preprocessed without new allocations. Only the padding outside the
+    resized page is refilled.
+
+    The returned tensor is a view of the reused buffer: it is only valid until
+    the next call from the same thread (``session.run`` copies its inputs).
+    """
+
+    def __init__(self, input_size=YOLOX_INPUT_SHAPE, pad_value=PAD_VALUE):
+        self.input_size = tuple(input_size)
+        self.pad_value = pad_value
+        self._local = threading.local()
+
+    def _buffers(self):
+        local = self._local
+        if not hasattr(local, "tensor"):
+            local.tensor = np.empty((0, 3, *self.input_size), dtype=np.float32)
+            local.resized = {}
+        return local
+
+    def _tensor(self, batch_size):
+        # One tensor per thread, grown to the largest batch seen; smaller batches use a prefix
+        local = self._buffers()
+        if local.tensor.shape[0] < batch_size:
+            local.tensor = np.empty((batch_size, 3, *self.input_size), dtype=np.float32)
+        return local.tensor[:batch_size]
+
+    def _resize(self, img, r):
+        resized = self._buffers().resized
+        height, width = int(img.shape[0] * r), int(img.shape[1] * r)
+        key = (height, width) + img.shape[2:]
+        if key not in resized:
+            if len(resized) >= MAX_RESIZE_BUFFERS:
+                resized.clear()
+            resized[key] = np.empty(key, dtype=np.uint8)
+        return cv2.resize(img, (width, height), dst=resized[key], interpolation=cv2.INTER_LINEAR)
+
+    def letterbox(self, img, out):
+        """Resize one HWC (or grayscale) uint8 page into ``out`` (``[3, H, W]``); returns the ratio."""
+        input_height, input_width = self.input_size
+        r = min(input_height / img.shape[0], input_width / img.shape[1])
+        resized = self._resize(img, r)
+        height, width = resized.shape[:2]
+
+        if resized.ndim == 2:
+            np.copyto(out[:, :height, :width], resized[None])
+        else:
+            np.copyto(out[:, :height, :width], resized.transpose(2, 0, 1))
+        out[:, height:, :] = self.pad_value
+        out[:, :height, width:] = self.pad_value
+        return r
+
+    def __call__(self, images):
+        """Preprocess a list of pages into one ``[N, 3, H, W]`` tensor.
+
+        Returns:
+            ``(tensor, ratios)`` with one resize ratio per page
+        """
+        tensor = self._tensor(len(images))
+        ratios = [self.letterbox(img, slot) for img, slot in zip(images, tensor)]
+        return tensor, ratios
+
+
+class YoloXPostprocessor:
+    """Threshold-first decoding of raw YoloX outputs.
+
+    ``demo_postprocess`` rebuilds the anchor grids and strides on every call and
+    decodes all anchors (about 16k for a 1024x768 input), most of which are then
+    dropped by the score threshold. Here the grids are built once per input
+    shape, anchors are scored first and only those above ``score_thr`` are
+    decoded to ``[x1, y1, x2, y2]`` boxes and passed to NMS. The detections are
+    the same as ``demo_postprocess`` followed by ``multiclass_nms``.
+    """
+
+    def __init__(self, strides=(8, 16, 32)):
+        self.strides = tuple(strides)
+        self._anchors = {}
+
+    def anchors(self, input_size):
+        """``(grids, strides)`` of all anchors for an input shape, as ``[A, 2]`` and ``[A, 1]`` arrays."""
+        key = tuple(input_size)
+        if key not in self._anchors:
+            grids = []
+            expanded_strides = []
+            for stride in self.strides:
+                hsize, wsize = key[0] // stride, key[1] // stride
+                xv, yv = np.meshgrid(np.arange(wsize), np.arange(hsize))
+                grids.append(np.stack((xv, yv), 2).reshape(-1, 2))
+                expanded_strides.append(np.full((hsize * wsize, 1), stride))
+            self._anchors[key] = (
+                np.concatenate(grids).astype(np.float32),
+                np.concatenate(expanded_strides).astype(np.float32),
+            )
+        return self._anchors[key]
+
+    def __call__(self, predictions, input_size, ratio, score_thr, nms_thr):
+        """Decode and filter the raw predictions of one page.
+
+        Args:
+            predictions: ``[A, 5 + classes]`` raw model output for one image
+            input_size: ``(height, width)`` of the model input
+            ratio: Resize ratio of the page (boxes are scaled back by it)
+            score_thr: Minimum objectness x class score
+            nms_thr: IoU threshold of the class-agnostic NMS
+
+        Returns:
+            ``[D, 6]`` array of ``[x1, y1, x2, y2, score, class]`` rows
+        """
+        grids, strides = self.anchors(input_size)
+
+        # Class probabilities are sigmoid outputs, so no class score exceeds the
+        # objectness: anchors are pre-filtered on objectness alone before any
+        # class is scored
+        candidates = np.flatnonzero(predictions[:, 4] > score_thr)
+        raw = predictions[candidates]
+        best_scores = raw[:, 4] * raw[:, 5:].max(axis=1, initial=0.0)
+        keep = best_scores > score_thr
+        candidates, raw = candidates[keep], raw[keep]
+        if candidates.size == 0:
+            return np.empty((0, 6))
+
+        class_scores = raw[:, 4:5] * raw[:, 5:]
+        class_ids = class_scores.argmax(1)
+        scores = class_scores[np.arange(len(candidates)), class_ids]
+
+        anchor_strides = strides[candidates]
+        centers = (raw[:, :2] + grids[candidates]) * anchor_strides
+        sizes = np.exp(raw[:, 2:4]) * anchor_strides
+        boxes = np.concatenate([centers - sizes / 2.0, centers + sizes / 2.0], axis=1) / ratio
+
+        keep = nms(boxes, scores, nms_thr)
+        return np.concatenate([boxes[keep], scores[keep, None], class_ids[keep, None]], 1)
+
+
 def demo_postprocess(outputs, img_size, p6=False):
     """Postprocessing for YoloX model."""
     grids = []
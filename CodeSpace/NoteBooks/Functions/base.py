@@ -1,21 +1,40 @@
 from __future__ import annotations
 
 import os
-from typing import Dict, Optional
+from typing import Any, Dict, Optional
 
 from Functions.Inferences.yolox import UnstructuredYoloXModel, MODEL_TYPES
+from Functions.model_profile import load_profile, select_model
 
 DEFAULT_MODEL = "yolox"
+AUTO_MODEL = "auto"
 models: Dict[str, UnstructuredYoloXModel] = {}
 
-def get_model(model_name: Optional[str] = None, model_path: Optional[str] = None) -> UnstructuredYoloXModel:
-    """Gets the model object by model name."""
+def get_model(
+    model_name: Optional[str] = None,
+    model_path: Optional[str] = None,
+    session_options: Optional[Dict[str, Any]] = None,
+) -> UnstructuredYoloXModel:
+    """Gets the model object by model name.
+
+    ``session_options`` tune the ONNX Runtime session of a model that is not
+    loaded yet (see ``Functions.ort_session``); by default they come from the
+    ``ORT_*`` environment variables.
+
+    ``"auto"`` picks the fastest model of the profile written by
+    ``benchmarks/layout_models.py`` that meets the accuracy floor
+    (``LAYOUT_MODEL_PROFILE``, ``LAYOUT_MODEL_MIN_F1``), or the default model
+    when there is no profile.
+    """
     global models
 
     if model_name is None:
         default_name_from_env = os.environ.get("DEFAULT_MODEL_NAME")
         model_name = default_name_from_env if default_name_from_env is not None else DEFAULT_MODEL
 
+    if model_name == AUTO_MODEL:
+        model_name = select_model(load_profile()) or DEFAULT_MODEL
+
     if model_name in models:
         return models[model_name]
 
@@ -27,8 +46,19 @@ def get_model(model_name: Optional[str] = None, model_path: Optional[str] = None
         actual_model_path = model_path or model_config["model_path"]
         label_map = model_config["label_map"]
         
+        # A model_path override gets the thresholds of its own file (quantized or not)
+        thresholds = {} if model_path else {
+            "score_threshold": model_config["score_threshold"],
+            "nms_threshold": model_config["nms_threshold"],
+        }
+
         # Initialize the model with the correct parameters
-        model.initialize(model_path=actual_model_path, label_map=label_map)
+        model.initialize(
+            model_path=actual_model_path,
+            label_map=label_map,
+            session_options=session_options,
+            **thresholds,
+        )
         models[model_name] = model
         return model
     else:
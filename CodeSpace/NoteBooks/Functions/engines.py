@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+DEFAULT_POOL_SIZE = 1
+
+
+class EnginePool:
+    """
+    A bounded pool of lazily created, reusable engine instances.
+
+    Engines are only built when a checkout finds no idle instance and the pool
+    is below ``size``; otherwise the caller waits for an engine to be returned.
+    Checkouts are thread-safe, so one engine is never used by two threads at once.
+    """
+
+    def __init__(self, factory: Callable[[], Any], size: int = DEFAULT_POOL_SIZE):
+        if size < 1:
+            raise ValueError("size must be a positive integer.")
+        self.factory = factory
+        self.size = size
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @property
+    def created(self) -> int:
+        """Number of engines built so far."""
+        return self._created
+
+    def _acquire(self, timeout: Optional[float]) -> Any:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            create = self._created < self.size
+            if create:
+                self._created += 1
+
+        if not create:
+            return self._idle.get(timeout=timeout)
+
+        try:
+            return self.factory()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    @contextmanager
+    def checkout(self, timeout: Optional[float] = None) -> Iterator[Any]:
+        """Borrow an engine for the duration of the ``with`` block."""
+        engine = self._acquire(timeout)
+        try:
+            yield engine
+        finally:
+            self._idle.put(engine)
+
+
+factories: Dict[str, Callable[[], Any]] = {}
+pools: Dict[str, EnginePool] = {}
+_pools_lock = threading.Lock()
+
+
+def register_engine(name: str, factory: Callable[[], Any], pool_size: Optional[int] = None) -> None:
+    """Register (or replace) the factory used to build the named engine."""
+    with _pools_lock:
+        factories[name] = factory
+        pools.pop(name, None)
+        if pool_size is not None:
+            pools[name] = EnginePool(factory, pool_size)
+
+
+def get_engine_pool(name: str) -> EnginePool:
+    """Gets the process-wide pool for an engine, creating it on first use.
+
+    The pool size defaults to the ``ENGINE_POOL_SIZE`` environment variable.
+    """
+    with _pools_lock:
+        if name in pools:
+            return pools[name]
+        if name not in factories:
+            raise UnknownEngineException(f"Unknown engine type: {name}")
+
+        pool_size = int(os.environ.get("ENGINE_POOL_SIZE", DEFAULT_POOL_SIZE))
+        pool = EnginePool(factories[name], pool_size)
+        pools[name] = pool
+        return pool
+
+
+@contextmanager
+def checkout_engine(name: str, timeout: Optional[float] = None) -> Iterator[Any]:
+    """Borrow a warm engine from the named pool."""
+    with get_engine_pool(name).checkout(timeout=timeout) as engine:
+        yield engine
+
+
+def _create_paddleocr():
+    from paddleocr import PaddleOCR
+
+    return PaddleOCR(use_angle_cls=True, lang="en")
+
+
+register_engine("paddleocr", _create_paddleocr)
+
+
+class UnknownEngineException(Exception):
+    """An engine was requested with an unrecognized identifier."""
+    pass
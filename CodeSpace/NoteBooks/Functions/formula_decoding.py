@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_NEW_TOKENS = 256
+# The repetition stop is opt-in: periodic LaTeX (zero matrices, "& 0 & 0 ..."
+# rows, \cdots runs, repeated "\\ \hline") looks like a loop to it. When it
+# is enabled, the repeat count is kept well above realistic matrix and table rows
+DEFAULT_REPETITION_NGRAM = None
+DEFAULT_REPETITION_COUNT = 16
+
+
+def default_export_dir(model_name: str) -> str:
+    """Local directory used to keep a cached-decoder ONNX export of ``model_name``."""
+    root = os.environ.get("FORMULA_ONNX_EXPORT_DIR", str(Path.home() / ".cache" / "onnx_exports"))
+    return os.path.join(root, model_name.replace("/", "--") + "-with-past")
+
+
+def load_vision2seq_model(
+    model_name: str,
+    use_cache: bool = True,
+    export_dir: Optional[str] = None,
+) -> Tuple[Any, bool]:
+    """Load an ONNX encoder-decoder model, preferring the cached (past key values) decoder.
+
+    With ``use_cache`` every decoding step only runs the decoder on the newest
+    token instead of the whole prefix. The cached variant is taken from a previous
+    local export if there is one, then from the hub repo, and otherwise exported
+    from the PyTorch weights and saved to ``export_dir``. If none of these work the
+    model is loaded without the cache.
+
+    Returns:
+        ``(model, use_cache)``, where ``use_cache`` tells whether the cache is used
+    """
+    from optimum.onnxruntime import ORTModelForVision2Seq
+
+    if not use_cache:
+        return ORTModelForVision2Seq.from_pretrained(model_name, use_cache=False), False
+
+    export_dir = export_dir or default_export_dir(model_name)
+    if os.path.isdir(export_dir):
+        try:
+            return ORTModelForVision2Seq.from_pretrained(export_dir, use_cache=True), True
+        except Exception as e:
+            logger.warning(f"Could not load cached-decoder export from {export_dir}: {e}")
+
+    try:
+        return ORTModelForVision2Seq.from_pretrained(model_name, use_cache=True), True
+    except Exception as e:
+        logger.info(f"{model_name} has no cached-decoder ONNX files ({e}), exporting them")
+
+    try:
+        model = ORTModelForVision2Seq.from_pretrained(model_name, export=True, use_cache=True)
+        model.save_pretrained(export_dir)
+        return model, True
+    except Exception as e:
+        logger.warning(f"Cached-decoder export of {model_name} failed, decoding without cache: {e}")
+
+    return ORTModelForVision2Seq.from_pretrained(model_name, use_cache=False), False
+
+
+class RepeatedNgramCriteria:
+    """Stop decoding once every sequence ends in the same n-gram repeated ``count`` times.
+
+    Recognition models sometimes fall into a loop (``\\\\ \\\\ \\\\ ...``) on
+    noisy crops; without this they would run until ``max_new_tokens``. Legitimate
+    periodic LaTeX can trigger it too, so it is off by default and a result it
+    stopped counts as truncated (see ``finished_sequences``). It follows
+    the ``transformers.StoppingCriteria`` call signature without subclassing it,
+    so importing this module does not load transformers.
+    """
+
+    def __init__(self, ngram_size: int = 4, count: int = DEFAULT_REPETITION_COUNT):
+        if ngram_size < 1 or count < 2:
+            raise ValueError("ngram_size must be positive and count at least 2.")
+        self.ngram_size = ngram_size
+        self.count = count
+
+    def __call__(self, input_ids, scores, **kwargs):
+        span = self.ngram_size * self.count
+        if input_ids.shape[1] < span:
+            return False
+        tail = input_ids[:, -span:].reshape(input_ids.shape[0], self.count, self.ngram_size)
+        looping = (tail == tail[:, :1]).all(dim=2).all(dim=1)
+        return looping.all()
+
+
+def generation_kwargs(
+    max_new_tokens: int = DEFAULT_MAX_NEW_TOKENS,
+    max_time: Optional[float] = None,
+    repetition_ngram: Optional[int] = DEFAULT_REPETITION_NGRAM,
+    repetition_count: int = DEFAULT_REPETITION_COUNT,
+) -> Dict[str, Any]:
+    """Keyword arguments for ``generate`` implementing the decoder-step budget.
+
+    Args:
+        max_new_tokens: Maximum number of tokens to generate per image
+        max_time: Optional wall-clock budget in seconds for one ``generate`` call
+        repetition_ngram: Size of the n-gram whose repetition stops decoding
+            (None, the default, disables the check)
+        repetition_count: Number of back-to-back repeats that count as a loop
+    """
+    from transformers import StoppingCriteriaList
+
+    kwargs: Dict[str, Any] = {"max_new_tokens": max_new_tokens}
+    if max_time is not None:
+        kwargs["max_time"] = max_time
+    if repetition_ngram:
+        kwargs["stopping_criteria"] = StoppingCriteriaList(
+            [RepeatedNgramCriteria(repetition_ngram, repetition_count)]
+        )
+    return kwargs
+
+
+def finished_sequences(generated_ids, eos_token_id: Optional[int]) -> List[bool]:
+    """Whether each sequence reached the end-of-sequence token.
+
+    Sequences cut off by ``max_new_tokens``, ``max_time`` or the repetition
+    stop are unfinished; their LaTeX is truncated and must not be cached.
+    """
+    if eos_token_id is None:
+        return [True] * generated_ids.shape[0]
+    # The first position is the decoder start token, which may equal EOS
+    return (generated_ids[:, 1:] == eos_token_id).any(dim=1).tolist()
+
+
+def count_generated_tokens(generated_ids, pad_token_id: Optional[int]) -> int:
+    """Number of generated tokens, excluding the decoder start token and padding."""
+    new_ids = generated_ids[:, 1:]
+    if pad_token_id is None:
+        return int(new_ids.numel())
+    return int((new_ids != pad_token_id).sum())
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+# Per-document page -> image reference index, written next to the images
+INDEX_SUFFIX = "-images.json"
+# Hex digits of the SHA-256 content hash used in image file names
+HASH_LENGTH = 16
+
+
+class EmbeddedImageExtractor:
+    """
+    Writes the embedded images of PDFs once each, in their native encoding.
+
+    Within a document images are cached by xref, so a logo placed on every
+    page is decoded once. Across documents they are keyed by content hash:
+    files are named ``<hash>.<ext>`` and an image that is already on disk is
+    never written again, which also holds for other processes and earlier
+    runs sharing the output folder. Every placement is recorded in a page ->
+    image index (``<document>-images.json``) instead of a duplicate file.
+    """
+
+    def __init__(self, output_dir: str, writer=None):
+        """
+        Args:
+            output_dir: Folder for the images and the per-document indexes
+            writer: Optional ``AsyncArtifactWriter``; files are written directly without one
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_dir = output_dir
+        self.writer = writer
+        # Content hash -> file name of every image written or found by this extractor
+        self._stored: Dict[str, str] = {}
+        self._document: Optional[str] = None
+        self._xrefs: Dict[int, Optional[Dict[str, Any]]] = {}
+        self._pages: Dict[int, List[Dict[str, Any]]] = {}
+        self.stats = {"placements": 0, "decoded": 0, "written": 0}
+
+    def index_path(self, document: str) -> str:
+        return os.path.join(self.output_dir, f"{document}{INDEX_SUFFIX}")
+
+    def start_document(self, document: str) -> None:
+        """Reset the xref cache for a new document; pages of an existing index are kept."""
+        self._document = document
+        self._xrefs = {}
+        self._pages = {}
+        path = self.index_path(document)
+        if os.path.exists(path):
+            # A resumed run only re-extracts the pages it processes again
+            with open(path, encoding="utf-8") as f:
+                self._pages = {int(page): entries for page, entries in json.load(f)["pages"].items()}
+
+    def restore_pages(self, pages: Dict[int, List[Dict[str, Any]]]) -> None:
+        """Take over the entries of pages an earlier run recorded (1-based page -> entries)."""
+        for page, entries in pages.items():
+            if entries:
+                self._pages[page] = entries
+            else:
+                self._pages.pop(page, None)
+
+    def page_entries(self, page: int) -> List[Dict[str, Any]]:
+        """Index entries of a 1-based page of the current document."""
+        return self._pages.get(page, [])
+
+    def extract_page(self, pdf_document, page, page_number: int) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """
+        Index the images placed on one page, writing those not stored yet.
+
+        Returns the page's index entries and the paths of the files newly written.
+        """
+        if self._document is None:
+            raise RuntimeError("start_document() must be called before extract_page().")
+
+        entries, written = [], []
+        for img_index, img in enumerate(page.get_images(full=True)):
+            xref = img[0]
+            if xref not in self._xrefs:
+                self._xrefs[xref] = self._store(pdf_document, xref, written)
+            image = self._xrefs[xref]
+            if image is None:
+                continue
+            rects = [[round(v, 2) for v in rect] for rect in page.get_image_rects(xref)]
+            entries.append({"index": img_index + 1, "xref": xref, **image, "rects": rects})
+
+        self.stats["placements"] += len(entries)
+        if entries:
+            self._pages[page_number + 1] = entries
+        else:
+            self._pages.pop(page_number + 1, None)
+        return entries, written
+
+    def _store(self, pdf_document, xref: int, written: List[str]) -> Optional[Dict[str, Any]]:
+        base_image = pdf_document.extract_image(xref)
+        if not base_image:
+            # Not an image PyMuPDF can extract (e.g. a broken stream)
+            return None
+        self.stats["decoded"] += 1
+
+        data = base_image["image"]
+        digest = hashlib.sha256(data).hexdigest()
+        filename = self._stored.get(digest)
+        if filename is None:
+            filename = f"{digest[:HASH_LENGTH]}.{base_image['ext']}"
+            path = os.path.join(self.output_dir, filename)
+            if not os.path.exists(path):
+                self._write(path, data)
+                written.append(path)
+                self.stats["written"] += 1
+            self._stored[digest] = filename
+        return {
+            "image": filename,
+            "sha256": digest,
+            "ext": base_image["ext"],
+            "width": base_image["width"],
+            "height": base_image["height"],
+        }
+
+    def _write(self, path: str, data: bytes) -> None:
+        if self.writer is not None:
+            self.writer.write_bytes(path, data)
+            return
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def document_images(self) -> List[str]:
+        """Paths of the distinct images referenced by the current document."""
+        names = {entry["image"] for entries in self._pages.values() for entry in entries}
+        return [os.path.join(self.output_dir, name) for name in sorted(names)]
+
+    def write_index(self) -> Optional[str]:
+        """Write the current document's page -> image index; returns its path (None without images)."""
+        if self._document is None or not self._pages:
+            return None
+        index = {
+            "document": self._document,
+            "images": len({entry["image"] for entries in self._pages.values() for entry in entries}),
+            "pages": {str(page): self._pages[page] for page in sorted(self._pages)},
+        }
+        path = self.index_path(self._document)
+        text = json.dumps(index, indent=2)
+        if self.writer is not None:
+            self.writer.write_text(path, text)
+        else:
+            self._write(path, text.encode("utf-8"))
+        return path
+
+    def finish_document(self) -> Optional[str]:
+        """Write the index of the current document and forget its xref cache."""
+        path = self.write_index()
+        self._document = None
+        self._xrefs = {}
+        self._pages = {}
+        return path
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+DEFAULT_MANIFEST_NAME = "manifest.sqlite"
+DEFAULT_STAGE = "extract"
+
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def file_hash(path: str, chunk_size: int = 1 << 20) -> str:
+    """SHA-256 of a file's bytes, so renamed or moved documents keep their progress."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BatchManifest:
+    """
+    Persistent record of batch progress per document, page and stage, backed by SQLite.
+
+    Documents are keyed by their content hash. A page is only marked done once
+    its outputs are on disk, so after a crash a rerun skips finished documents
+    and pages and redoes the rest. Several worker processes may update the same
+    manifest; each opens its own connection and writes are serialized by SQLite.
+    """
+
+    def __init__(self, path: str, timeout: float = 30.0):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "doc_hash TEXT PRIMARY KEY, path TEXT NOT NULL, pages INTEGER, status TEXT NOT NULL, "
+            "error TEXT, updated REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "doc_hash TEXT NOT NULL, stage TEXT NOT NULL, page INTEGER NOT NULL, status TEXT NOT NULL, "
+            "info TEXT, error TEXT, seconds REAL, updated REAL NOT NULL, "
+            "PRIMARY KEY (doc_hash, stage, page))"
+        )
+
+    def document(self, doc_hash: str) -> Optional[Dict[str, Any]]:
+        """The document's row (``path``, ``pages``, ``status``, ``error``), or None if it is new."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT path, pages, status, error FROM documents WHERE doc_hash = ?", (doc_hash,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"path": row[0], "pages": row[1], "status": row[2], "error": row[3]}
+
+    def start_document(self, doc_hash: str, path: str, pages: Optional[int] = None) -> None:
+        self._set_document(doc_hash, path, pages, RUNNING, None)
+
+    def finish_document(self, doc_hash: str, path: str, pages: Optional[int], status: str,
+                        error: Optional[str] = None) -> None:
+        self._set_document(doc_hash, path, pages, status, error)
+
+    def _set_document(self, doc_hash: str, path: str, pages: Optional[int], status: str,
+                      error: Optional[str]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (doc_hash, path, pages, status, error, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (doc_hash, path, pages, status, error, time.time()),
+            )
+
+    def pages(self, doc_hash: str, stage: str = DEFAULT_STAGE) -> Dict[int, Dict[str, Any]]:
+        """Recorded pages of a document stage by 1-based page number."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT page, status, info, error, seconds FROM pages WHERE doc_hash = ? AND stage = ?",
+                (doc_hash, stage),
+            ).fetchall()
+        return {
+            page: {"status": status, "info": json.loads(info) if info else {}, "error": error, "seconds": seconds}
+            for page, status, info, error, seconds in rows
+        }
+
+    def mark_page(self, doc_hash: str, page: int, status: str, stage: str = DEFAULT_STAGE,
+                  info: Optional[Dict[str, Any]] = None, error: Optional[str] = None,
+                  seconds: Optional[float] = None) -> None:
+        """Record the outcome of one page; ``info`` holds any JSON-serializable page facts."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (doc_hash, stage, page, status, info, error, seconds, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (doc_hash, stage, page, status, json.dumps(info) if info else None, error, seconds, time.time()),
+            )
+
+    def reset(self) -> None:
+        """Forget all progress, so the next run processes everything again."""
+        with self._lock:
+            self._conn.execute("DELETE FROM pages")
+            self._conn.execute("DELETE FROM documents")
+
+    @property
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Number of documents and pages per status."""
+        with self._lock:
+            documents = dict(self._conn.execute("SELECT status, COUNT(*) FROM documents GROUP BY status").fetchall())
+            pages = dict(self._conn.execute("SELECT status, COUNT(*) FROM pages GROUP BY status").fetchall())
+        return {"documents": documents, "pages": pages}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self) -> BatchManifest:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
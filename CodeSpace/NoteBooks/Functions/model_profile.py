@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Written by benchmarks/layout_models.py and read by get_model("auto")
+PROFILE_ENV = "LAYOUT_MODEL_PROFILE"
+MIN_F1_ENV = "LAYOUT_MODEL_MIN_F1"
+DEFAULT_MIN_F1 = 0.9
+
+
+def default_profile_path() -> str:
+    return os.environ.get(PROFILE_ENV, str(Path.home() / ".cache" / "layout_models" / "profile.json"))
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """``[A, B]`` IoU matrix of ``[x1, y1, x2, y2]`` boxes."""
+    if a.size == 0 or b.size == 0:
+        return np.zeros((a.shape[0], b.shape[0]))
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def match_detections(
+    reference: Tuple[np.ndarray, np.ndarray],
+    candidate: Tuple[np.ndarray, np.ndarray],
+    iou_threshold: float = 0.5,
+) -> int:
+    """Greedily match candidate to reference detections of the same class.
+
+    Args:
+        reference: ``(boxes, class_ids)`` of the reference model on one page
+        candidate: ``(boxes, class_ids)`` of the evaluated model on the same page
+        iou_threshold: Minimum IoU for a match
+
+    Returns:
+        Number of matched (true positive) detections
+    """
+    ref_boxes, ref_classes = (np.asarray(v) for v in reference)
+    cand_boxes, cand_classes = (np.asarray(v) for v in candidate)
+    iou = box_iou(ref_boxes.reshape(-1, 4), cand_boxes.reshape(-1, 4))
+    iou[ref_classes[:, None] != cand_classes[None, :]] = 0.0
+
+    # Visit the qualifying pairs from the highest IoU down, using each box once
+    rows, cols = np.nonzero(iou >= iou_threshold)
+    order = np.argsort(-iou[rows, cols], kind="stable")
+    used_rows, used_cols = set(), set()
+    for r, c in zip(rows[order], cols[order]):
+        if r not in used_rows and c not in used_cols:
+            used_rows.add(r)
+            used_cols.add(c)
+    return len(used_rows)
+
+
+def agreement(
+    reference_pages: Sequence[Tuple[np.ndarray, np.ndarray]],
+    candidate_pages: Sequence[Tuple[np.ndarray, np.ndarray]],
+    iou_threshold: float = 0.5,
+) -> Dict[str, float]:
+    """Precision, recall and F1 of a model against the reference model over all pages."""
+    matched = predicted = expected = 0
+    for reference, candidate in zip(reference_pages, candidate_pages):
+        matched += match_detections(reference, candidate, iou_threshold)
+        predicted += len(candidate[1])
+        expected += len(reference[1])
+    precision = matched / predicted if predicted else 1.0
+    recall = matched / expected if expected else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {"precision": precision, "recall": recall, "f1": f1}
+
+
+def load_profile(path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Load a model profile, or None if there is none."""
+    path = path or default_profile_path()
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_profile(profile: Dict[str, Any], path: Optional[str] = None) -> str:
+    path = path or default_profile_path()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(profile, f, indent=2)
+    return path
+
+
+def select_model(profile: Optional[Dict[str, Any]], min_f1: Optional[float] = None) -> Optional[str]:
+    """Fastest profiled model whose F1 against the reference model meets ``min_f1``.
+
+    ``min_f1`` defaults to the ``LAYOUT_MODEL_MIN_F1`` environment variable. The
+    reference model always qualifies. Returns None without a profile.
+    """
+    if not profile or not profile.get("models"):
+        return None
+    if min_f1 is None:
+        min_f1 = float(os.environ.get(MIN_F1_ENV, DEFAULT_MIN_F1))
+
+    reference = profile.get("reference")
+    eligible = [
+        (stats["pages_per_second"], name)
+        for name, stats in profile["models"].items()
+        if name == reference or stats.get("f1", 0.0) >= min_f1
+    ]
+    return max(eligible)[1] if eligible else reference
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+from typing import Optional, Sequence, Union
+
+import numpy as np
+
+ArrayLike = Union[np.ndarray, Sequence]
+
+
+def box_areas(boxes: np.ndarray) -> np.ndarray:
+    """Areas of an ``[N, 4]`` array of ``x1, y1, x2, y2`` boxes."""
+    return np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+
+
+def pairwise_iou(box: np.ndarray, boxes: np.ndarray, area: Optional[float] = None,
+                 areas: Optional[np.ndarray] = None) -> np.ndarray:
+    """IoU of one box against an ``[N, 4]`` array of boxes."""
+    if area is None:
+        area = box_areas(box[None])[0]
+    if areas is None:
+        areas = box_areas(boxes)
+
+    w = np.clip(np.minimum(box[2], boxes[:, 2]) - np.maximum(box[0], boxes[:, 0]), 0, None)
+    h = np.clip(np.minimum(box[3], boxes[:, 3]) - np.maximum(box[1], boxes[:, 1]), 0, None)
+    inter = w * h
+    return inter / (area + areas - inter + 1e-6)
+
+
+def non_max_suppression(
+    boxes: ArrayLike,
+    scores: ArrayLike,
+    iou_threshold: float,
+    max_output_size: Optional[int] = None,
+) -> np.ndarray:
+    """Greedy non-maximum suppression implemented in NumPy.
+
+    Boxes are sorted by score once; each kept box then suppresses every remaining
+    box whose IoU with it is above ``iou_threshold`` in a single vectorized step.
+    Equal scores keep their input order.
+
+    Args:
+        boxes: Boxes as ``[x1, y1, x2, y2]``
+        scores: One confidence score per box
+        iou_threshold: IoU above which a lower-scored box is suppressed
+        max_output_size: Optional cap on the number of kept boxes
+
+    Returns:
+        Indices of the kept boxes, highest score first
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    scores = np.asarray(scores, dtype=np.float64).reshape(-1)
+    if boxes.shape[0] == 0:
+        return np.empty(0, dtype=np.int64)
+    if scores.shape[0] != boxes.shape[0]:
+        raise ValueError("boxes and scores must have the same length.")
+
+    areas = box_areas(boxes)
+    order = np.argsort(-scores, kind="stable")
+    limit = boxes.shape[0] if max_output_size is None else max_output_size
+
+    keep = []
+    while order.size > 0 and len(keep) < limit:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        overlap = pairwise_iou(boxes[i], boxes[rest], areas[i], areas[rest])
+        order = rest[overlap <= iou_threshold]
+
+    return np.asarray(keep, dtype=np.int64)
+
+
+def batched_non_max_suppression(
+    boxes: ArrayLike,
+    scores: ArrayLike,
+    group_ids: ArrayLike,
+    iou_threshold: float,
+    max_output_size: Optional[int] = None,
+) -> np.ndarray:
+    """Run independent NMS for several groups of boxes in one call.
+
+    Boxes are suppressed only by boxes of the same group (for example the same
+    table, or the horizontal versus vertical bands of one table). Groups are kept
+    apart by shifting each group's coordinates into its own disjoint region, so a
+    single NMS pass handles all of them.
+
+    Args:
+        boxes: Boxes as ``[x1, y1, x2, y2]``
+        scores: One confidence score per box
+        group_ids: Integer group of each box
+        iou_threshold: IoU above which a lower-scored box is suppressed
+        max_output_size: Optional cap on the total number of kept boxes
+
+    Returns:
+        Indices of the kept boxes, highest score first
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    group_ids = np.asarray(group_ids).reshape(-1)
+    if boxes.shape[0] == 0:
+        return np.empty(0, dtype=np.int64)
+    if group_ids.shape[0] != boxes.shape[0]:
+        raise ValueError("boxes and group_ids must have the same length.")
+
+    _, group_index = np.unique(group_ids, return_inverse=True)
+    span = boxes.max() - boxes.min() + 1
+    shifted = boxes + (group_index.astype(np.float64) * span)[:, None]
+    return non_max_suppression(shifted, scores, iou_threshold, max_output_size)
@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import logging
+import os
+import platform
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Environment variables read when an option is not passed explicitly
+ENV_OPTIONS = {
+    "intra_op_threads": "ORT_INTRA_OP_THREADS",
+    "inter_op_threads": "ORT_INTER_OP_THREADS",
+    "execution_mode": "ORT_EXECUTION_MODE",
+    "optimization_level": "ORT_GRAPH_OPTIMIZATION_LEVEL",
+    "enable_cpu_mem_arena": "ORT_ENABLE_CPU_MEM_ARENA",
+    "enable_mem_pattern": "ORT_ENABLE_MEM_PATTERN",
+    "optimized_model_dir": "ORT_OPTIMIZED_MODEL_DIR",
+}
+
+EXECUTION_MODES = ("sequential", "parallel")
+OPTIMIZATION_LEVELS = ("disable", "basic", "extended", "all")
+# ONNX Runtime's own default; its CPU layout optimizations (e.g. NCHWc) are
+# machine-specific, which the optimized-model cache key already covers
+DEFAULT_OPTIMIZATION_LEVEL = "all"
+
+
+def default_optimized_model_dir() -> str:
+    """Directory holding optimized graphs, reused across process starts."""
+    return str(Path.home() / ".cache" / "onnx_optimized")
+
+
+def _parse_bool(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
+def resolve_session_config(**options: Any) -> Dict[str, Any]:
+    """Merge explicit options with ``ORT_*`` environment variables.
+
+    Options left as None fall back to their environment variable and then to
+    ONNX Runtime's defaults. ``optimized_model_dir`` set to ``""`` (or
+    ``ORT_OPTIMIZED_MODEL_DIR=""``) turns the optimized-model cache off.
+    """
+    unknown = set(options) - set(ENV_OPTIONS)
+    if unknown:
+        raise ValueError(f"Unknown session options: {sorted(unknown)}. Expected {sorted(ENV_OPTIONS)}.")
+
+    config: Dict[str, Any] = {}
+    for name, env_var in ENV_OPTIONS.items():
+        value = options.get(name)
+        if value is None:
+            value = os.environ.get(env_var)
+        config[name] = value
+
+    for name in ("intra_op_threads", "inter_op_threads"):
+        if config[name] is not None:
+            config[name] = int(config[name])
+            if config[name] < 0:
+                raise ValueError(f"{name} must be 0 (ONNX Runtime default) or a positive integer.")
+    for name in ("enable_cpu_mem_arena", "enable_mem_pattern"):
+        if config[name] is not None:
+            config[name] = _parse_bool(config[name])
+
+    config["execution_mode"] = (config["execution_mode"] or "sequential").lower()
+    if config["execution_mode"] not in EXECUTION_MODES:
+        raise ValueError(f"execution_mode must be one of {EXECUTION_MODES}.")
+    config["optimization_level"] = (config["optimization_level"] or DEFAULT_OPTIMIZATION_LEVEL).lower()
+    if config["optimization_level"] not in OPTIMIZATION_LEVELS:
+        raise ValueError(f"optimization_level must be one of {OPTIMIZATION_LEVELS}.")
+    if config["optimized_model_dir"] is None:
+        config["optimized_model_dir"] = default_optimized_model_dir()
+    return config
+
+
+def build_session_options(config: Dict[str, Any], optimization_level: Optional[str] = None):
+    """``onnxruntime.SessionOptions`` for a resolved config."""
+    import onnxruntime
+
+    levels = {
+        "disable": onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+        "basic": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        "extended": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+        "all": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+    }
+    options = onnxruntime.SessionOptions()
+    if config["intra_op_threads"] is not None:
+        options.intra_op_num_threads = config["intra_op_threads"]
+    if config["inter_op_threads"] is not None:
+        options.inter_op_num_threads = config["inter_op_threads"]
+    options.execution_mode = (
+        onnxruntime.ExecutionMode.ORT_PARALLEL
+        if config["execution_mode"] == "parallel"
+        else onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+    )
+    options.graph_optimization_level = levels[optimization_level or config["optimization_level"]]
+    if config["enable_cpu_mem_arena"] is not None:
+        options.enable_cpu_mem_arena = config["enable_cpu_mem_arena"]
+    if config["enable_mem_pattern"] is not None:
+        options.enable_mem_pattern = config["enable_mem_pattern"]
+    return options
+
+
+def optimized_model_path(model_path: str, providers: Sequence[str], config: Dict[str, Any]) -> str:
+    """Cache path of the optimized graph of ``model_path``.
+
+    Optimized graphs may contain provider- and CPU-specific kernels, so the key
+    covers the model file (path, size, mtime), the ONNX Runtime version, the
+    providers, the optimization level and the machine architecture.
+    """
+    import onnxruntime
+
+    stat = os.stat(model_path)
+    key = "|".join([
+        os.path.abspath(model_path), str(stat.st_size), str(int(stat.st_mtime)),
+        onnxruntime.__version__, ",".join(providers), config["optimization_level"], platform.machine(),
+    ])
+    digest = hashlib.sha256(key.encode()).hexdigest()[:16]
+    return os.path.join(config["optimized_model_dir"], f"{Path(model_path).stem}-{digest}.onnx")
+
+
+def create_session(model_path: str, providers: Sequence[str], **options: Any):
+    """Create an ``InferenceSession`` with tuned options and a persistent optimized graph.
+
+    On the first start the graph is optimized and saved to the cache directory;
+    later starts load the saved graph with optimizations disabled, which skips
+    the optimization work. See ``resolve_session_config`` for ``options``.
+
+    Returns:
+        ``(session, info)`` where ``info`` holds the resolved config, the load
+        time and whether the optimized graph came from the cache
+    """
+    import onnxruntime
+
+    config = resolve_session_config(**options)
+    providers = list(providers)
+    start = time.perf_counter()
+    cache = "off"
+
+    session = None
+    cached_path = None
+    if config["optimized_model_dir"] and config["optimization_level"] != "disable":
+        cached_path = optimized_model_path(model_path, providers, config)
+        if os.path.exists(cached_path):
+            try:
+                session = onnxruntime.InferenceSession(
+                    cached_path, sess_options=build_session_options(config, "disable"), providers=providers
+                )
+                cache = "hit"
+            except Exception as e:
+                logger.warning(f"Discarding unreadable optimized model {cached_path}: {e}")
+                # Another process may have discarded it already
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(cached_path)
+
+    if session is None:
+        sess_options = build_session_options(config)
+        tmp_path = None
+        if cached_path:
+            os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+            # Workers starting together each write their own file; the rename is atomic
+            tmp_path = f"{cached_path}.{os.getpid()}.tmp"
+            sess_options.optimized_model_filepath = tmp_path
+        try:
+            session = onnxruntime.InferenceSession(model_path, sess_options=sess_options, providers=providers)
+        except BaseException:
+            # A failed load may already have serialized part of the graph
+            if tmp_path:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(tmp_path)
+            raise
+        if tmp_path and os.path.exists(tmp_path):
+            os.replace(tmp_path, cached_path)
+            cache = "miss"
+
+    info = {"config": config, "load_seconds": time.perf_counter() - start, "optimized_cache": cache}
+    logger.info(f"Loaded {model_path} in {info['load_seconds']:.2f}s (optimized graph cache: {cache})")
+    return session, info
@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from Functions import tracing
+
+PageKey = Tuple[str, int, float]
+
+# (height, width) of the YOLOX layout model input
+DETECTION_SIZE = (1024, 768)
+
+# PyMuPDF is not thread-safe, not even across documents: threads that use it
+# at the same time (e.g. a background page renderer) hold this lock around
+# every fitz call
+FITZ_LOCK = threading.Lock()
+
+
+def document_hash(pdf_bytes: bytes) -> str:
+    """Content hash used to identify a PDF across render calls."""
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+def pixmap_to_bgr(pixmap) -> np.ndarray:
+    """Convert a PyMuPDF pixmap into an OpenCV (BGR) image."""
+    img_array = np.frombuffer(pixmap.samples, dtype=np.uint8)
+    img_array = img_array.reshape((pixmap.height, pixmap.width, pixmap.n))
+    if pixmap.n == 4:
+        return cv2.cvtColor(img_array, cv2.COLOR_RGBA2BGR)
+    if pixmap.n == 1:
+        return cv2.cvtColor(img_array, cv2.COLOR_GRAY2BGR)
+    return cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
+
+
+def render_page(page, dpi: float) -> np.ndarray:
+    """Rasterize a PyMuPDF page at the given DPI as a BGR image."""
+    import fitz
+
+    zoom = dpi / 72
+    with tracing.span(tracing.RENDER, dpi=dpi):
+        pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+        return pixmap_to_bgr(pixmap)
+
+
+def fit_dpi(page, target_size: Tuple[int, int] = DETECTION_SIZE, max_dpi: Optional[float] = None) -> float:
+    """Largest DPI at which the page still fits into ``target_size`` (height, width).
+
+    Rendering a page any larger than the layout model input only for the model
+    to shrink it again wastes rasterization time and memory.
+    """
+    rect = page.rect
+    dpi = 72 * min(target_size[0] / rect.height, target_size[1] / rect.width)
+    return min(dpi, max_dpi) if max_dpi else dpi
+
+
+def render_clip(
+    page,
+    bbox: Sequence[float],
+    dpi: float,
+    padding: Tuple[float, float, float, float] = (0, 0, 0, 0),
+) -> np.ndarray:
+    """Render only one region of a page at the given DPI.
+
+    Args:
+        page: PyMuPDF page
+        bbox: ``[x1, y1, x2, y2]`` in pixels of a full-page render at ``dpi``
+        dpi: Resolution of both the coordinates and the output
+        padding: ``(left, top, right, bottom)`` pixels added around ``bbox``
+
+    Returns:
+        BGR image of the region, clipped to the page
+    """
+    import fitz
+
+    scale = 72 / dpi
+    clip = fitz.Rect(
+        (bbox[0] - padding[0]) * scale,
+        (bbox[1] - padding[1]) * scale,
+        (bbox[2] + padding[2]) * scale,
+        (bbox[3] + padding[3]) * scale,
+    ) & page.rect
+    if clip.is_empty:
+        raise ValueError(f"Region {list(bbox)} lies outside the page")
+
+    zoom = dpi / 72
+    with tracing.span(tracing.RENDER, dpi=dpi, clip=True):
+        pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip)
+        return pixmap_to_bgr(pixmap)
+
+
+class PageRenderCache:
+    """
+    LRU cache of rendered pages keyed by (document hash, page number, DPI).
+
+    Cached images are shared between callers and are therefore marked read-only;
+    copy an image before drawing on it. ``max_pages`` bounds how many rasters are
+    held in memory at once.
+    """
+
+    def __init__(self, max_pages: int = 16):
+        if max_pages < 1:
+            raise ValueError("max_pages must be a positive integer.")
+        self.max_pages = max_pages
+        self._pages: OrderedDict[PageKey, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: PageKey) -> Optional[np.ndarray]:
+        """Return the cached image for ``key`` or None."""
+        with self._lock:
+            image = self._pages.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self._pages.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def put(self, key: PageKey, image: np.ndarray) -> np.ndarray:
+        """Store a rendered page, evicting the least recently used ones."""
+        image.flags.writeable = False
+        with self._lock:
+            self._pages[key] = image
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+        return image
+
+    def get_or_render(self, page, doc_hash: str, page_number: int, dpi: float) -> np.ndarray:
+        """Return the cached render of ``page`` or render and cache it."""
+        key = (doc_hash, page_number, dpi)
+        image = self.get(key)
+        if image is None:
+            image = self.put(key, render_page(page, dpi))
+        return image
+
+    def clear(self) -> None:
+        """Drop all cached pages."""
+        with self._lock:
+            self._pages.clear()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and current size."""
+        return {"hits": self.hits, "misses": self.misses, "cached_pages": len(self._pages)}
+
+
+class PDFRenderSession:
+    """
+    An open PDF whose pages are rendered through a shared ``PageRenderCache``.
+
+    Use it as a context manager so that the underlying PyMuPDF document is
+    closed once detection, cropping and visualization are done with it.
+
+    With ``detect_size`` set, pages are rendered just large enough to fit that
+    size and regions are re-rendered at ``dpi`` through ``region_image``.
+    """
+
+    def __init__(
+        self,
+        pdf_path: str,
+        pdf_bytes: bytes,
+        dpi: int,
+        cache: Optional[PageRenderCache] = None,
+        detect_size: Optional[Tuple[int, int]] = None,
+    ):
+        import fitz
+
+        self.pdf_path = pdf_path
+        self.dpi = dpi
+        self.detect_size = detect_size
+        self.cache = cache if cache is not None else PageRenderCache()
+        self.doc_hash = document_hash(pdf_bytes)
+        self.doc = fitz.open(pdf_path) if pdf_path else fitz.open(stream=pdf_bytes, filetype="pdf")
+
+    @property
+    def page_count(self) -> int:
+        return self.doc.page_count
+
+    def page_dpi(self, page_number: int) -> float:
+        """Resolution at which ``page_image`` renders a 1-based page number."""
+        if self.detect_size is None:
+            return self.dpi
+        return fit_dpi(self.doc[page_number - 1], self.detect_size, self.dpi)
+
+    def page_image(self, page_number: int) -> np.ndarray:
+        """Render (or fetch from cache) a 1-based page number."""
+        page = self.doc[page_number - 1]
+        return self.cache.get_or_render(page, self.doc_hash, page_number, self.page_dpi(page_number))
+
+    def region_image(
+        self,
+        page_number: int,
+        bbox: Sequence[float],
+        padding: Tuple[float, float, float, float] = (0, 0, 0, 0),
+    ) -> np.ndarray:
+        """Render a region, given in pixels at the session DPI, at the session DPI."""
+        return render_clip(self.doc[page_number - 1], bbox, self.dpi, padding)
+
+    def iter_pages(self, page_numbers: Optional[range] = None) -> Iterator[Tuple[int, np.ndarray]]:
+        """Yield ``(page_number, image)`` pairs one page at a time."""
+        if page_numbers is None:
+            page_numbers = range(1, self.page_count + 1)
+        for page_number in page_numbers:
+            yield page_number, self.page_image(page_number)
+
+    def close(self) -> None:
+        self.doc.close()
+
+    def __enter__(self) -> PDFRenderSession:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Iterator, List, Optional, Sequence, Tuple
+
+from Functions import tracing
+
+
+def shard_page_ranges(page_count: int, shards: int) -> List[range]:
+    """Split 1-based page numbers into at most ``shards`` contiguous, ordered ranges."""
+    if page_count <= 0:
+        return []
+    shards = max(1, min(shards, page_count))
+    size, extra = divmod(page_count, shards)
+
+    ranges = []
+    start = 1
+    for shard in range(shards):
+        stop = start + size + (1 if shard < extra else 0)
+        ranges.append(range(start, stop))
+        start = stop
+    return ranges
+
+
+def worker_thread_budget(workers: int) -> int:
+    """Intra-op threads per worker when ``workers`` processes share the machine's cores."""
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def _drop_inherited_sessions() -> None:
+    # A forked worker inherits the layout models the parent already loaded (after
+    # a warm-up, say). ONNX Runtime sessions are not fork-safe and would ignore
+    # the worker's thread budget, so they are dropped and loaded again on first
+    # use. Other entries, such as benchmark stubs, are kept.
+    base = sys.modules.get("Functions.base")
+    if base is None:
+        return
+    from Functions.Inferences.yolox import UnstructuredYoloXModel
+
+    for name, model in list(base.models.items()):
+        if isinstance(model, UnstructuredYoloXModel):
+            del base.models[name]
+
+
+def _init_worker(threads: int, initializer: Optional[Callable[..., None]], initargs: Sequence[Any]) -> None:
+    # Split the cores between the workers instead of letting every model session
+    # start one thread per core; explicit ORT_* settings are left alone
+    os.environ.setdefault("ORT_INTRA_OP_THREADS", str(threads))
+    os.environ.setdefault("ORT_INTER_OP_THREADS", "1")
+    _drop_inherited_sessions()
+    tracing.init_worker()
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def map_page_ranges(
+    task: Callable[..., Any],
+    page_count: int,
+    workers: int,
+    initializer: Optional[Callable[..., None]] = None,
+    initargs: Sequence[Any] = (),
+    task_args: Sequence[Any] = (),
+    shards_per_worker: int = 4,
+) -> Iterator[Any]:
+    """Run ``task(page_range, *task_args)`` over page shards in a process pool.
+
+    ``initializer`` runs once per worker process and is where per-worker state such
+    as document handles and model sessions should be created. Results are yielded
+    in page order, regardless of the order in which the shards finish. Splitting
+    into several shards per worker keeps the pool busy when pages differ in cost.
+    Unless ``ORT_INTRA_OP_THREADS`` is set, each worker's ONNX Runtime sessions
+    get an equal share of the cores (``worker_thread_budget``); layout model
+    sessions loaded in the parent before the pool started are not reused.
+    With ``PIPELINE_TRACE`` set, every worker writes its own trace file.
+    """
+    page_ranges = shard_page_ranges(page_count, workers * shards_per_worker)
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(worker_thread_budget(workers), initializer, tuple(initargs)),
+    )
+    try:
+        futures = [executor.submit(task, page_range, *task_args) for page_range in page_ranges]
+        for future in futures:
+            yield future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def map_unordered(
+    task: Callable[[Any], Any],
+    items: Sequence[Any],
+    workers: int,
+    initializer: Optional[Callable[..., None]] = None,
+    initargs: Sequence[Any] = (),
+) -> Iterator[Tuple[Any, Any]]:
+    """Run ``task(item)`` for every item in a process pool, yielding ``(item, result)`` as tasks finish.
+
+    Used for independent units of work such as whole documents, where finishing
+    order does not matter. Workers are set up as in ``map_page_ranges``.
+    """
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(worker_thread_budget(workers), initializer, tuple(initargs)),
+    )
+    try:
+        futures = {executor.submit(task, item): item for item in items}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
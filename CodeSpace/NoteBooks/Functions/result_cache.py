@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+DEFAULT_CACHE_NAME = "ocr_cache.sqlite"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def pixel_hash(image: Any) -> str:
+    """Hash of decoded pixels, so re-encoding a crop does not change its key."""
+    pixels = np.ascontiguousarray(np.asarray(image))
+    digest = hashlib.sha256()
+    digest.update(f"{pixels.dtype.str}{pixels.shape}".encode())
+    digest.update(pixels.data)
+    return digest.hexdigest()
+
+
+def package_version(name: str) -> str:
+    """Installed version of a package, used as the revision of its models."""
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        return version(name)
+    except PackageNotFoundError:
+        return "unknown"
+
+
+class ResultCache:
+    """
+    Persistent, content-addressed cache of model outputs backed by SQLite.
+
+    Entries are keyed by the hash of the input pixels together with the model
+    name, model revision and preprocessing/decoding parameters, and hold any
+    JSON-serializable value (LaTeX strings, table cell arrays). Once the stored
+    values exceed ``max_bytes`` the least recently used entries are evicted.
+    The cache is safe to share between threads.
+    """
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        if max_bytes < 1:
+            raise ValueError("max_bytes must be a positive integer.")
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)")
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+    @staticmethod
+    def make_key(image: Any, model: str, revision: str, params: Optional[Dict[str, Any]] = None) -> str:
+        """Build the cache key of ``image`` processed by ``model`` at ``revision`` with ``params``."""
+        config = json.dumps({"model": model, "revision": revision, "params": params or {}},
+                            sort_keys=True, default=str)
+        return hashlib.sha256(f"{pixel_hash(image)}:{config}".encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for ``key`` or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE results SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, value: Any) -> None:
+        """Store a value, evicting the least recently used entries above ``max_bytes``."""
+        data = json.dumps(value)
+        size = len(data.encode("utf-8"))
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM results WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, data, size, time.time()),
+            )
+            self._total_bytes += size - (old[0] if old else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        rows = self._conn.execute("SELECT key, size FROM results ORDER BY last_access").fetchall()
+        evicted = []
+        for key, size in rows:
+            if self._total_bytes <= self.max_bytes:
+                break
+            evicted.append((key,))
+            self._total_bytes -= size
+        self._conn.executemany("DELETE FROM results WHERE key = ?", evicted)
+
+    def clear(self) -> None:
+        """Drop all cached results."""
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+            self._total_bytes = 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and current size."""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": self._total_bytes}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self) -> ResultCache:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
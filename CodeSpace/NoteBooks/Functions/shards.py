@@ -0,0 +1,335 @@
+from __future__ import annotations
+
+import io
+import json
+import os
+import tarfile
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+import cv2
+import numpy as np
+
+from Functions.utiles import requires_dependencies
+
+SHARD_FORMATS = ("tar", "parquet")
+DEFAULT_MAX_SAMPLES = 10000
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+# Metadata fields stored with every sample, besides the image and the OCR outputs
+METADATA_FIELDS = ("document", "page_number", "type", "bbox", "confidence")
+
+
+def sample_key(name: str) -> str:
+    """WebDataset-safe sample key: dots would split the key from the extension."""
+    return name.replace(".", "_")
+
+
+def encode_image(image: np.ndarray, image_format: str = "png", png_compression: int = 3) -> bytes:
+    """Encode an OpenCV (BGR) image as PNG or lossless WebP."""
+    if image_format == "webp":
+        params = [cv2.IMWRITE_WEBP_QUALITY, 101]
+    else:
+        params = [cv2.IMWRITE_PNG_COMPRESSION, png_compression]
+    ok, buffer = cv2.imencode(f".{image_format}", image, params)
+    if not ok:
+        raise ValueError(f"Could not encode image as {image_format}")
+    return buffer.tobytes()
+
+
+class _ShardWriterBase:
+    """
+    Shared shard rotation and index bookkeeping.
+
+    Samples go to ``{output_dir}/{prefix}-{n:05d}.{ext}``; a new shard starts
+    once the current one holds ``max_samples`` samples or ``max_bytes`` bytes.
+    Every sample gets a line in ``{prefix}-index.jsonl`` with its key, shard
+    and metadata, so readers can find samples without opening every shard.
+    """
+
+    extension = ""
+
+    def __init__(
+        self,
+        output_dir: str,
+        prefix: str,
+        max_samples: int = DEFAULT_MAX_SAMPLES,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        image_format: str = "png",
+        png_compression: int = 3,
+    ):
+        if max_samples < 1 or max_bytes < 1:
+            raise ValueError("max_samples and max_bytes must be positive integers.")
+        if image_format not in ("png", "webp"):
+            raise ValueError("image_format must be 'png' or 'webp'.")
+        os.makedirs(output_dir, exist_ok=True)
+
+        self.output_dir = output_dir
+        self.prefix = prefix
+        self.max_samples = max_samples
+        self.max_bytes = max_bytes
+        self.image_format = image_format
+        self.png_compression = png_compression
+
+        self.shard_paths: List[str] = []
+        self.samples_written = 0
+        self.bytes_written = 0
+        self.write_seconds = 0.0
+        self._shard_samples = 0
+        self._shard_bytes = 0
+        self._index = open(self.index_path, "w", encoding="utf-8")
+        self._closed = False
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.output_dir, f"{self.prefix}-index.jsonl")
+
+    def _next_shard_path(self) -> str:
+        path = os.path.join(self.output_dir, f"{self.prefix}-{len(self.shard_paths):05d}.{self.extension}")
+        self.shard_paths.append(path)
+        self._shard_samples = 0
+        self._shard_bytes = 0
+        return path
+
+    def _shard_full(self) -> bool:
+        return self._shard_samples >= self.max_samples or self._shard_bytes >= self.max_bytes
+
+    def write(
+        self,
+        name: str,
+        image: Optional[np.ndarray] = None,
+        image_bytes: Optional[bytes] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        ocr_text: Optional[str] = None,
+        latex: Optional[str] = None,
+    ) -> str:
+        """Append one sample; returns its key.
+
+        Args:
+            name: Sample name, e.g. the crop file stem
+            image: OpenCV (BGR) image, encoded with the writer's image format
+            image_bytes: Already encoded image (used instead of ``image``)
+            metadata: Values for ``METADATA_FIELDS`` (document, page, type, bbox, confidence)
+            ocr_text: OCR output, e.g. a table as CSV text
+            latex: LaTeX of a formula
+        """
+        if self._closed:
+            raise RuntimeError("Shard writer is closed.")
+        start = time.perf_counter()
+        key = sample_key(name)
+        if image_bytes is None and image is not None:
+            image_bytes = encode_image(image, self.image_format, self.png_compression)
+        metadata = {field: (metadata or {}).get(field) for field in METADATA_FIELDS}
+
+        size, location = self._write_sample(key, image_bytes, metadata, ocr_text, latex)
+
+        self._shard_samples += 1
+        self._shard_bytes += size
+        self.samples_written += 1
+        self.bytes_written += size
+        self._index.write(json.dumps({"key": key, "shard": os.path.basename(self.shard_paths[-1]),
+                                      **location, **metadata}) + "\n")
+        self.write_seconds += time.perf_counter() - start
+        return key
+
+    def _write_sample(self, key, image_bytes, metadata, ocr_text, latex):
+        raise NotImplementedError
+
+    def _close_shard(self) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Finish the open shard and the index."""
+        if self._closed:
+            return
+        self._closed = True
+        self._close_shard()
+        self._index.close()
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        return {
+            "shards": len(self.shard_paths),
+            "samples": self.samples_written,
+            "bytes": self.bytes_written,
+            "write_seconds": self.write_seconds,
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class TarShardWriter(_ShardWriterBase):
+    """
+    WebDataset-style tar shards: each sample is a group of members sharing a key
+    (``key.png``/``key.webp``, ``key.json`` with metadata, ``key.txt`` OCR text,
+    ``key.tex`` LaTeX), written back to back so shards stream sequentially.
+    """
+
+    extension = "tar"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._tar: Optional[tarfile.TarFile] = None
+
+    def _add_member(self, name: str, data: bytes) -> None:
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self._tar.addfile(info, io.BytesIO(data))
+
+    def _write_sample(self, key, image_bytes, metadata, ocr_text, latex):
+        if self._tar is None or self._shard_full():
+            self._close_shard()
+            self._tar = tarfile.open(self._next_shard_path(), "w")
+
+        offset = self._tar.offset
+        members = [(f"{key}.json", json.dumps(metadata).encode("utf-8"))]
+        if image_bytes is not None:
+            members.append((f"{key}.{self.image_format}", image_bytes))
+        if ocr_text is not None:
+            members.append((f"{key}.txt", ocr_text.encode("utf-8")))
+        if latex is not None:
+            members.append((f"{key}.tex", latex.encode("utf-8")))
+        for name, data in members:
+            self._add_member(name, data)
+        return self._tar.offset - offset, {"offset": offset}
+
+    def _close_shard(self) -> None:
+        if self._tar is not None:
+            self._tar.close()
+            self._tar = None
+
+
+class ParquetShardWriter(_ShardWriterBase):
+    """
+    Parquet shards with one row per sample: key, metadata columns, the encoded
+    image bytes, OCR text and LaTeX. Rows are buffered and written as row groups.
+    """
+
+    extension = "parquet"
+
+    @requires_dependencies("pyarrow")
+    def __init__(self, *args, row_group_size: int = 512, **kwargs):
+        import pyarrow as pa
+
+        super().__init__(*args, **kwargs)
+        self.row_group_size = row_group_size
+        self._rows: List[Dict[str, Any]] = []
+        self._parquet = None
+        self._schema = pa.schema([
+            ("key", pa.string()),
+            ("document", pa.string()),
+            ("page_number", pa.int32()),
+            ("type", pa.string()),
+            ("bbox", pa.list_(pa.float64())),
+            ("confidence", pa.float64()),
+            ("image", pa.binary()),
+            ("image_format", pa.string()),
+            ("ocr_text", pa.string()),
+            ("latex", pa.string()),
+        ])
+
+    def _write_sample(self, key, image_bytes, metadata, ocr_text, latex):
+        import pyarrow.parquet as pq
+
+        if self._parquet is None or self._shard_full():
+            self._close_shard()
+            self._parquet = pq.ParquetWriter(self._next_shard_path(), self._schema)
+
+        row = self._shard_samples
+        self._rows.append({
+            "key": key,
+            **metadata,
+            "image": image_bytes,
+            "image_format": self.image_format if image_bytes is not None else None,
+            "ocr_text": ocr_text,
+            "latex": latex,
+        })
+        if len(self._rows) >= self.row_group_size:
+            self._flush_rows()
+        size = len(image_bytes or b"") + len(ocr_text or "") + len(latex or "")
+        return size, {"row": row}
+
+    def _flush_rows(self) -> None:
+        import pyarrow as pa
+
+        if self._rows:
+            self._parquet.write_table(pa.Table.from_pylist(self._rows, schema=self._schema))
+            self._rows = []
+
+    def _close_shard(self) -> None:
+        if self._parquet is not None:
+            self._flush_rows()
+            self._parquet.close()
+            self._parquet = None
+
+
+def open_shard_writer(output_format: str, output_dir: str, prefix: str, **kwargs) -> _ShardWriterBase:
+    """Create a tar or Parquet shard writer."""
+    if output_format == "tar":
+        return TarShardWriter(output_dir, prefix, **kwargs)
+    if output_format == "parquet":
+        return ParquetShardWriter(output_dir, prefix, **kwargs)
+    raise ValueError(f"Unknown shard format: {output_format}. Expected one of {SHARD_FORMATS}.")
+
+
+def read_index(index_path: str) -> List[Dict[str, Any]]:
+    """Load a shard index written next to the shards."""
+    with open(index_path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def iter_tar_samples(shard_path: str) -> Iterator[Dict[str, Any]]:
+    """Stream the samples of a tar shard in order, one dict per key."""
+    sample: Dict[str, Any] = {}
+    with tarfile.open(shard_path, "r|") as tar:
+        for member in tar:
+            key, ext = member.name.split(".", 1)
+            if sample and sample["key"] != key:
+                yield sample
+                sample = {}
+            data = tar.extractfile(member).read()
+            sample["key"] = key
+            if ext == "json":
+                sample.update(json.loads(data))
+            elif ext in ("png", "webp"):
+                sample["image"] = data
+                sample["image_format"] = ext
+            elif ext == "txt":
+                sample["ocr_text"] = data.decode("utf-8")
+            elif ext == "tex":
+                sample["latex"] = data.decode("utf-8")
+    if sample:
+        yield sample
+
+
+@requires_dependencies("pyarrow")
+def iter_parquet_samples(shard_path: str, batch_size: int = 256) -> Iterator[Dict[str, Any]]:
+    """Stream the rows of a Parquet shard in order, batch by batch."""
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(shard_path)
+    for batch in parquet_file.iter_batches(batch_size=batch_size):
+        yield from batch.to_pylist()
+
+
+def iter_shard_samples(index_path: str, decode_images: bool = False) -> Iterator[Dict[str, Any]]:
+    """Read every sample of a sharded output, shard by shard, in write order.
+
+    Args:
+        index_path: The ``{prefix}-index.jsonl`` file of the output
+        decode_images: Decode the image bytes into OpenCV (BGR) arrays
+    """
+    directory = os.path.dirname(index_path)
+    shards = list(dict.fromkeys(entry["shard"] for entry in read_index(index_path)))
+    for shard in shards:
+        shard_path = os.path.join(directory, shard)
+        samples = iter_parquet_samples(shard_path) if shard.endswith(".parquet") else iter_tar_samples(shard_path)
+        for sample in samples:
+            if decode_images and sample.get("image") is not None:
+                sample["image"] = cv2.imdecode(np.frombuffer(sample["image"], np.uint8), cv2.IMREAD_COLOR)
+            yield sample
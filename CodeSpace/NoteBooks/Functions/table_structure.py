@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+from typing import Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from Functions.nms import batched_non_max_suppression
+
+
+def ocr_lines_to_arrays(ocr_lines: Sequence) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Split PaddleOCR lines (``[points, (text, score)]``) into boxes, texts and scores.
+
+    Boxes are ``[x1, y1, x2, y2]`` built from the top-left and bottom-right points.
+    """
+    if not ocr_lines:
+        return np.empty((0, 4)), np.empty(0, dtype=object), np.empty(0)
+
+    boxes = np.array(
+        [[line[0][0][0], line[0][0][1], line[0][2][0], line[0][2][1]] for line in ocr_lines],
+        dtype=np.float64,
+    )
+    texts = np.empty(len(ocr_lines), dtype=object)
+    texts[:] = [line[1][0] for line in ocr_lines]
+    scores = np.array([line[1][1] for line in ocr_lines], dtype=np.float64)
+    return boxes, texts, scores
+
+
+def band_boxes(boxes: np.ndarray, image_shape: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+    """Stretch every OCR box into a full-width row band and a full-height column band."""
+    image_height, image_width = image_shape[:2]
+    x1 = boxes[:, 0].astype(int)
+    y1 = boxes[:, 1].astype(int)
+    widths = (boxes[:, 2] - boxes[:, 0]).astype(int)
+    heights = (boxes[:, 3] - boxes[:, 1]).astype(int)
+
+    zeros = np.zeros_like(x1)
+    horiz = np.stack([zeros, y1, np.full_like(x1, image_width), y1 + heights], axis=1)
+    vert = np.stack([x1, zeros, x1 + widths, np.full_like(x1, image_height)], axis=1)
+    return horiz.astype(np.float64), vert.astype(np.float64)
+
+
+def _interval_overlap(starts: np.ndarray, ends: np.ndarray, box_starts: np.ndarray,
+                      box_ends: np.ndarray) -> np.ndarray:
+    """``[bands, boxes]`` overlap lengths of 1-D intervals."""
+    overlap = np.minimum(ends[:, None], box_ends[None, :]) - np.maximum(starts[:, None], box_starts[None, :])
+    return np.clip(overlap, 0, None)
+
+
+def assign_cells(
+    rows: np.ndarray,
+    cols: np.ndarray,
+    boxes: np.ndarray,
+    cell_iou_threshold: float = 0.1,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Match OCR boxes to the cells of a row/column grid.
+
+    A cell is the intersection of a row band and a column band. Row and column
+    overlaps are computed separately as ``[R, B]`` and ``[C, B]`` interval
+    overlaps, and only (row, column, box) triples that overlap on both axes are
+    scored, so the work follows the number of real matches rather than R x C x B.
+    When several boxes match a cell, the one that comes last in ``boxes`` wins.
+
+    Returns:
+        Arrays of row indices, column indices and box indices, one entry per
+        filled cell
+    """
+    num_boxes = boxes.shape[0]
+    row_overlap = _interval_overlap(rows[:, 1], rows[:, 3], boxes[:, 1], boxes[:, 3])
+    col_overlap = _interval_overlap(cols[:, 0], cols[:, 2], boxes[:, 0], boxes[:, 2])
+
+    # (box, row) and (box, column) candidate pairs, both sorted by box
+    row_b, row_r = np.nonzero(row_overlap.T > 0)
+    col_b, col_c = np.nonzero(col_overlap.T > 0)
+
+    # Join the pairs on the box index
+    col_counts = np.bincount(col_b, minlength=num_boxes)
+    col_starts = np.cumsum(col_counts) - col_counts
+    repeats = col_counts[row_b]
+    pair_r = np.repeat(row_r, repeats)
+    pair_b = np.repeat(row_b, repeats)
+    within = np.arange(repeats.sum()) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    pair_c = col_c[np.repeat(col_starts[row_b], repeats) + within]
+
+    inter = row_overlap[pair_r, pair_b] * col_overlap[pair_c, pair_b]
+    cell_areas = (rows[pair_r, 3] - rows[pair_r, 1]) * (cols[pair_c, 2] - cols[pair_c, 0])
+    box_areas = (boxes[pair_b, 2] - boxes[pair_b, 0]) * (boxes[pair_b, 3] - boxes[pair_b, 1])
+    iou = inter / (cell_areas + box_areas - inter + 1e-6)
+
+    hit = iou > cell_iou_threshold
+    pair_r, pair_c, pair_b = pair_r[hit], pair_c[hit], pair_b[hit]
+
+    # Keep the last matching box of every cell
+    cells = pair_r * cols.shape[0] + pair_c
+    order = np.lexsort((pair_b, cells))
+    cells, pair_b = cells[order], pair_b[order]
+    last = np.r_[cells[1:] != cells[:-1], True] if cells.size else np.empty(0, dtype=bool)
+    cells, pair_b = cells[last], pair_b[last]
+    return cells // cols.shape[0], cells % cols.shape[0], pair_b
+
+
+def table_from_ocr(
+    ocr_lines: Sequence,
+    image_shape: Tuple[int, int],
+    iou_threshold: float = 0.1,
+    cell_iou_threshold: float = 0.1,
+) -> pd.DataFrame:
+    """Rebuild a table grid from PaddleOCR output on a table image.
+
+    Each OCR box is stretched into a row band and a column band; NMS over the
+    bands yields the table's rows and columns, which are ordered top-to-bottom
+    and left-to-right. Every OCR box is then placed into the cells it overlaps.
+
+    Args:
+        ocr_lines: PaddleOCR result for one image (``ocr.ocr(img)[0]``)
+        image_shape: ``(height, width)`` of the table image
+        iou_threshold: IoU threshold for merging row and column bands
+        cell_iou_threshold: Minimum IoU between a cell and a box to fill the cell
+
+    Returns:
+        DataFrame of cell texts without header or index
+    """
+    boxes, texts, scores = ocr_lines_to_arrays(ocr_lines)
+    if boxes.shape[0] == 0:
+        return pd.DataFrame()
+
+    horiz, vert = band_boxes(boxes, image_shape)
+    num_boxes = boxes.shape[0]
+    kept = batched_non_max_suppression(
+        np.concatenate([horiz, vert]),
+        np.concatenate([scores, scores]),
+        np.repeat([0, 1], num_boxes),
+        iou_threshold=iou_threshold,
+    )
+    row_ids = kept[kept < num_boxes]
+    col_ids = kept[kept >= num_boxes] - num_boxes
+    row_ids = row_ids[np.lexsort((row_ids, horiz[row_ids, 1]))]
+    col_ids = col_ids[np.lexsort((col_ids, vert[col_ids, 0]))]
+
+    rows, cols = horiz[row_ids], vert[col_ids]
+    out_array = np.full((rows.shape[0], cols.shape[0]), "", dtype=object)
+    row_idx, col_idx, box_idx = assign_cells(rows, cols, boxes, cell_iou_threshold)
+    out_array[row_idx, col_idx] = texts[box_idx]
+    return pd.DataFrame(out_array)
+
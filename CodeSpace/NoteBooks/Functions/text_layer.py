@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from Functions.table_structure import table_from_ocr
+
+# Thresholds for trusting a page's embedded text instead of running OCR
+DEFAULT_MIN_CHARS = 20
+DEFAULT_MAX_BAD_CHAR_RATIO = 0.05
+DEFAULT_MAX_INVISIBLE_RATIO = 0.5
+# A page mostly covered by images with only a little visible text (a scan with
+# a fax header, stamp or digital footer) still needs OCR for the scanned content
+DEFAULT_SCAN_IMAGE_COVERAGE = 0.7
+DEFAULT_SCAN_MAX_TEXT_COVERAGE = 0.15
+
+# Glyph boxes are scaled to 300 DPI pixels before rebuilding tables, so the
+# grid thresholds behave as they do on OCR boxes from 300 DPI crops
+TABLE_SCALE = 300 / 72
+
+# Words further apart than this many text heights start a new cell
+WORD_GAP_RATIO = 0.6
+
+_REPLACEMENT_CHAR = 0xFFFD
+_PRIVATE_USE = (0xE000, 0xF8FF)
+_INVISIBLE_TEXT = 3
+
+
+def _is_bad_char(code: int) -> bool:
+    """Glyphs without a usable Unicode mapping: replacement, private-use and control chars."""
+    return (
+        code == _REPLACEMENT_CHAR
+        or _PRIVATE_USE[0] <= code <= _PRIVATE_USE[1]
+        or (code < 32 and code not in (9, 10, 13))
+    )
+
+
+def _area(rect: Sequence[float]) -> float:
+    return max(0.0, rect[2] - rect[0]) * max(0.0, rect[3] - rect[1])
+
+
+def text_layer_stats(page) -> Dict[str, float]:
+    """Measure how much of a page is covered by embedded text and how usable it is.
+
+    Returns:
+        Dict with ``chars`` (non-space glyphs), ``bad_char_ratio`` (unmapped
+        glyphs), ``invisible_ratio`` (glyphs drawn invisibly, as in the OCR layer
+        of a scan), ``text_coverage`` and ``image_coverage`` (page area fractions)
+    """
+    page_rect = page.rect
+    page_area = _area(page_rect) or 1.0
+
+    chars = bad = invisible = 0
+    text_area = 0.0
+    for span in page.get_texttrace():
+        codes = [char[0] for char in span["chars"] if not chr(char[0]).isspace()]
+        if not codes:
+            continue
+        chars += len(codes)
+        bad += sum(_is_bad_char(code) for code in codes)
+        if span["type"] == _INVISIBLE_TEXT or span.get("opacity", 1) == 0:
+            invisible += len(codes)
+        text_area += _area(span["bbox"])
+
+    image_area = sum(_area(page_rect & info["bbox"]) for info in page.get_image_info())
+    return {
+        "chars": chars,
+        "bad_char_ratio": bad / chars if chars else 0.0,
+        "invisible_ratio": invisible / chars if chars else 0.0,
+        "text_coverage": min(1.0, text_area / page_area),
+        "image_coverage": min(1.0, image_area / page_area),
+    }
+
+
+def has_usable_text_layer(
+    page,
+    min_chars: int = DEFAULT_MIN_CHARS,
+    max_bad_char_ratio: float = DEFAULT_MAX_BAD_CHAR_RATIO,
+    max_invisible_ratio: float = DEFAULT_MAX_INVISIBLE_RATIO,
+    scan_image_coverage: float = DEFAULT_SCAN_IMAGE_COVERAGE,
+    scan_max_text_coverage: float = DEFAULT_SCAN_MAX_TEXT_COVERAGE,
+) -> Tuple[bool, Dict[str, float]]:
+    """Decide whether a page's embedded text can replace OCR.
+
+    Pages with almost no text (scans, pages of outlined glyphs), with many
+    unmapped glyphs (broken font encodings), whose text is mostly invisible
+    (a scan with a previous OCR layer) or that are mostly image with little
+    text (a scan with a stamped or digital header/footer) are left to the
+    raster/OCR path.
+
+    Returns:
+        ``(usable, stats)`` with the stats from ``text_layer_stats``
+    """
+    stats = text_layer_stats(page)
+    usable = (
+        stats["chars"] >= min_chars
+        and stats["bad_char_ratio"] <= max_bad_char_ratio
+        and stats["invisible_ratio"] <= max_invisible_ratio
+        and not (stats["image_coverage"] >= scan_image_coverage
+                 and stats["text_coverage"] < scan_max_text_coverage)
+    )
+    return usable, stats
+
+
+def route_page(page, **thresholds) -> str:
+    """``"text"`` if the page's text layer is usable, else ``"ocr"``."""
+    usable, _ = has_usable_text_layer(page, **thresholds)
+    return "text" if usable else "ocr"
+
+
+def words_to_ocr_lines(words: Sequence, scale: float = TABLE_SCALE,
+                       origin: Tuple[float, float] = (0.0, 0.0)) -> List:
+    """Group embedded words into PaddleOCR-style lines (``[points, (text, score)]``).
+
+    Neighbouring words of the same text line are merged into one phrase unless
+    the gap between them is wider than ``WORD_GAP_RATIO`` text heights, which
+    separates table columns the way OCR boxes do.
+
+    Args:
+        words: ``page.get_text("words")`` tuples ``(x0, y0, x1, y1, text, block, line, word)``
+        scale: Factor from PDF points to output pixels
+        origin: Top-left corner, in points, of the region the boxes are relative to
+    """
+    phrases: List[List[Any]] = []
+    for x0, y0, x1, y1, text, block, line, _ in sorted(words, key=lambda w: (w[5], w[6], w[7])):
+        last = phrases[-1] if phrases else None
+        if (last is not None and last[5] == (block, line)
+                and x0 - last[2] <= WORD_GAP_RATIO * max(y1 - y0, last[3] - last[1])):
+            last[2] = max(last[2], x1)
+            last[1], last[3] = min(last[1], y0), max(last[3], y1)
+            last[4] += " " + text
+        else:
+            phrases.append([x0, y0, x1, y1, text, (block, line)])
+
+    ox, oy = origin
+    lines = []
+    for x0, y0, x1, y1, text, _ in phrases:
+        x0, y0, x1, y1 = ((x0 - ox) * scale, (y0 - oy) * scale, (x1 - ox) * scale, (y1 - oy) * scale)
+        lines.append([[[x0, y0], [x1, y0], [x1, y1], [x0, y1]], (text, 1.0)])
+    return lines
+
+
+def find_table_regions(page, **find_tables_kwargs) -> List[Tuple[float, float, float, float]]:
+    """Bounding boxes (in points) of the tables PyMuPDF finds from ruling lines and text.
+
+    Header rows PyMuPDF detects above a table's ruling are included in its box.
+    """
+    import fitz
+
+    regions = []
+    for table in page.find_tables(**find_tables_kwargs).tables:
+        rect = fitz.Rect(table.bbox)
+        if table.header.external:
+            rect |= fitz.Rect(table.header.bbox)
+        regions.append(tuple(rect))
+    return regions
+
+
+def table_from_text_layer(page, bbox: Sequence[float], scale: float = TABLE_SCALE,
+                          iou_threshold: float = 0.1, cell_iou_threshold: float = 0.1) -> pd.DataFrame:
+    """Rebuild the table inside ``bbox`` (points) from embedded glyphs.
+
+    The words are grouped into phrases and passed through the same grid
+    reconstruction as PaddleOCR output, so both paths produce comparable CSVs.
+    """
+    import fitz
+
+    rect = fitz.Rect(bbox)
+    words = [w for w in page.get_text("words") if fitz.Rect(w[:4]).intersects(rect)
+             and rect.contains(fitz.Point((w[0] + w[2]) / 2, (w[1] + w[3]) / 2))]
+    lines = words_to_ocr_lines(words, scale, (rect.x0, rect.y0))
+    shape = (int(rect.height * scale) + 1, int(rect.width * scale) + 1)
+    return table_from_ocr(lines, shape, iou_threshold=iou_threshold, cell_iou_threshold=cell_iou_threshold)
+
+
+def extract_text_layer(
+    page,
+    table_regions: Optional[Sequence[Sequence[float]]] = None,
+    **find_tables_kwargs,
+) -> Dict[str, Any]:
+    """Extract a page's text blocks and tables from its embedded text.
+
+    Args:
+        page: PyMuPDF page with a usable text layer
+        table_regions: Table boxes in points; found with ``page.find_tables``
+            (``find_tables_kwargs``) when not given
+
+    Returns:
+        Dict with ``texts`` (text blocks outside tables, in reading order) and
+        ``tables`` (each ``{"bbox": (x0, y0, x1, y1), "dataframe": DataFrame}``)
+    """
+    import fitz
+
+    if table_regions is None:
+        table_regions = find_table_regions(page, **find_tables_kwargs)
+    table_rects = [fitz.Rect(region) for region in table_regions]
+
+    texts = []
+    for x0, y0, x1, y1, text, _, block_type in page.get_text("blocks", sort=True):
+        center = fitz.Point((x0 + x1) / 2, (y0 + y1) / 2)
+        if block_type != 0 or any(rect.contains(center) for rect in table_rects):
+            continue
+        text = text.strip()
+        if text:
+            texts.append(text)
+
+    tables = []
+    for rect in table_rects:
+        table_df = table_from_text_layer(page, rect)
+        if not table_df.empty:
+            tables.append({"bbox": tuple(rect), "dataframe": table_df})
+    return {"texts": texts, "tables": tables}
@@ -0,0 +1,343 @@
+from __future__ import annotations
+
+import contextvars
+import functools
+import itertools
+import json
+import multiprocessing
+import multiprocessing.util
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# PIPELINE_TRACE=trace.json writes a Chrome trace at exit, PIPELINE_TRACE=trace.jsonl
+# JSON lines, and PIPELINE_TRACE=1 only prints the per-stage summary to stderr
+TRACE_ENV = "PIPELINE_TRACE"
+CHROME_SUFFIXES = (".json",)
+# Events kept in memory; later events are counted as dropped
+MAX_EVENTS = 1_000_000
+
+# Stage names used across the pipeline, so traces of different entry points line up
+RENDER = "render"
+PREPROCESS = "preprocess"
+LAYOUT = "layout_inference"
+NMS = "nms"
+CROP = "crop"
+OCR = "ocr"
+FORMULA_DECODE = "formula_decode"
+WRITE = "write"
+
+_document: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("trace_document", default=None)
+_page: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("trace_page", default=None)
+_parent: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("trace_parent", default=None)
+
+
+class Tracer:
+    """
+    Collects spans and counter increments of one process.
+
+    Spans carry the document and page they were recorded under, the thread
+    and the enclosing span, so time can be attributed per stage, per document
+    and per page afterwards.
+    """
+
+    def __init__(self, max_events: int = MAX_EVENTS):
+        self.max_events = max_events
+        self.events: List[Dict[str, Any]] = []
+        self.dropped = 0
+        # Monotonic offsets from a wall-clock origin keep traces of worker processes aligned
+        self._origin_ns = time.perf_counter_ns()
+        self._origin_epoch_us = time.time_ns() / 1000
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def next_id(self) -> int:
+        return next(self._ids)
+
+    def timestamp_us(self) -> float:
+        """Microseconds since the epoch."""
+        return self._origin_epoch_us + (time.perf_counter_ns() - self._origin_ns) / 1000
+
+    def _append(self, event: Dict[str, Any]) -> None:
+        event.update(document=_document.get(), page=_page.get(), pid=os.getpid(), thread=threading.get_ident())
+        with self._lock:
+            if len(self.events) >= self.max_events:
+                self.dropped += 1
+            else:
+                self.events.append(event)
+
+    def record_span(self, name: str, span_id: int, parent_id: Optional[int],
+                    start_us: float, end_us: float, attrs: Dict[str, Any]) -> None:
+        self._append({
+            "kind": "span", "name": name, "id": span_id, "parent": parent_id,
+            "start_us": start_us, "duration_us": end_us - start_us, "attrs": attrs,
+        })
+
+    def record_count(self, name: str, value: float) -> None:
+        self._append({"kind": "counter", "name": name, "start_us": self.timestamp_us(), "value": value})
+
+    def clear(self) -> None:
+        with self._lock:
+            self.events = []
+            self.dropped = 0
+
+    def summary(self) -> Dict[str, Any]:
+        """Per-stage and per-document span totals and counter totals."""
+        with self._lock:
+            events = list(self.events)
+
+        stages: Dict[str, Dict[str, float]] = {}
+        documents: Dict[str, Dict[str, float]] = {}
+        counters: Dict[str, float] = {}
+        for event in events:
+            if event["kind"] == "counter":
+                counters[event["name"]] = counters.get(event["name"], 0) + event["value"]
+                continue
+            seconds = event["duration_us"] / 1e6
+            stage = stages.setdefault(event["name"], {"count": 0, "seconds": 0.0, "max_seconds": 0.0})
+            stage["count"] += 1
+            stage["seconds"] += seconds
+            stage["max_seconds"] = max(stage["max_seconds"], seconds)
+            if event["document"] is not None:
+                per_document = documents.setdefault(event["document"], {})
+                per_document[event["name"]] = per_document.get(event["name"], 0.0) + seconds
+        return {"stages": stages, "documents": documents, "counters": counters, "dropped": self.dropped}
+
+    def format_summary(self) -> str:
+        summary = self.summary()
+        lines = [f"{'stage':<20} {'count':>8} {'total s':>10} {'mean ms':>10} {'max ms':>10}"]
+        for name, stage in sorted(summary["stages"].items(), key=lambda item: -item[1]["seconds"]):
+            lines.append(f"{name:<20} {stage['count']:>8} {stage['seconds']:>10.3f} "
+                         f"{1000 * stage['seconds'] / stage['count']:>10.2f} {1000 * stage['max_seconds']:>10.2f}")
+        for name, value in sorted(summary["counters"].items()):
+            lines.append(f"{name:<20} {value:>8g}")
+        if summary["dropped"]:
+            lines.append(f"{summary['dropped']} events dropped (limit {self.max_events})")
+        return "\n".join(lines)
+
+    def export_jsonl(self, path: str) -> str:
+        """Write one JSON object per span or counter increment, in recording order."""
+        with self._lock:
+            events = list(self.events)
+        with open(path, "w", encoding="utf-8") as f:
+            for event in events:
+                f.write(json.dumps(event, default=str) + "\n")
+        return path
+
+    def export_chrome(self, path: str) -> str:
+        """Write a Chrome trace (chrome://tracing, Perfetto) with one track per thread."""
+        with self._lock:
+            events = list(self.events)
+
+        trace_events = []
+        totals: Dict[str, float] = {}
+        for event in events:
+            args = {"document": event["document"], "page": event["page"]}
+            if event["kind"] == "counter":
+                totals[event["name"]] = totals.get(event["name"], 0) + event["value"]
+                trace_events.append({"name": event["name"], "ph": "C", "ts": event["start_us"],
+                                     "pid": event["pid"], "tid": event["thread"],
+                                     "args": {event["name"]: totals[event["name"]]}})
+            else:
+                args.update(event["attrs"])
+                trace_events.append({"name": event["name"], "cat": event["document"] or "pipeline", "ph": "X",
+                                     "ts": event["start_us"], "dur": event["duration_us"],
+                                     "pid": event["pid"], "tid": event["thread"], "args": args})
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f, default=str)
+        return path
+
+    def export(self, path: str) -> str:
+        """Export as a Chrome trace for ``.json`` paths and as JSON lines otherwise."""
+        if path.lower().endswith(CHROME_SUFFIXES):
+            return self.export_chrome(path)
+        return self.export_jsonl(path)
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "attrs", "id", "_start_us", "_token")
+
+    def __init__(self, tracer: Tracer, name: str, attrs: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs: Any) -> None:
+        """Attach attributes known only once the span is running, e.g. result sizes."""
+        self.attrs.update(attrs)
+
+    def __enter__(self) -> _Span:
+        self.id = self.tracer.next_id()
+        self._token = _parent.set(self.id)
+        self._start_us = self.tracer.timestamp_us()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        end_us = self.tracer.timestamp_us()
+        _parent.reset(self._token)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer.record_span(self.name, self.id, _parent.get(), self._start_us, end_us, self.attrs)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attrs: Any) -> None:
+        pass
+
+    def __enter__(self) -> _NoopSpan:
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+_tracer: Optional[Tracer] = None
+
+
+def is_enabled() -> bool:
+    return _tracer is not None
+
+
+def get_tracer() -> Optional[Tracer]:
+    """The active tracer, or None while tracing is off."""
+    return _tracer
+
+
+def enable(max_events: int = MAX_EVENTS) -> Tracer:
+    """Start recording spans and counters in this process (idempotent)."""
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(max_events)
+    return _tracer
+
+
+def disable() -> Optional[Tracer]:
+    """Stop recording; returns the tracer holding what was recorded so far."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def span(name: str, **attrs: Any):
+    """Time the ``with`` block as a span named ``name``.
+
+    While tracing is off this returns a shared no-op context manager, so spans
+    can stay in hot paths.
+    """
+    tracer = _tracer
+    if tracer is None:
+        return _NOOP_SPAN
+    return _Span(tracer, name, attrs)
+
+
+def traced(name: str) -> Callable[[Callable], Callable]:
+    """Decorator recording every call of the function as a span."""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            with _Span(_tracer, name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name: str, value: float = 1) -> None:
+    """Add ``value`` to the counter ``name`` (attributed to the current document and page)."""
+    tracer = _tracer
+    if tracer is not None:
+        tracer.record_count(name, value)
+
+
+@contextmanager
+def document(name: str) -> Iterator[None]:
+    """Attribute spans and counters recorded inside the block to document ``name``."""
+    token = _document.set(name)
+    try:
+        yield
+    finally:
+        _document.reset(token)
+
+
+@contextmanager
+def page(number: int) -> Iterator[None]:
+    """Attribute spans and counters recorded inside the block to page ``number``."""
+    token = _page.set(number)
+    try:
+        yield
+    finally:
+        _page.reset(token)
+
+
+def bind(func: Callable) -> Callable:
+    """Run ``func`` later (e.g. on another thread) under the current document, page and span."""
+    if _tracer is None:
+        return func
+    return functools.partial(contextvars.copy_context().run, func)
+
+
+def _process_path(path: str) -> str:
+    # Worker processes inherit the variable; each writes its own file next to the parent's
+    if multiprocessing.parent_process() is None:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{os.getpid()}{ext}"
+
+
+def _export_at_exit(target: str) -> None:
+    tracer = _tracer
+    if tracer is None or not tracer.events:
+        return
+    if target.lower() in ("1", "true", "yes", "on"):
+        print(tracer.format_summary(), file=sys.stderr)
+        return
+    path = tracer.export(_process_path(target))
+    print(f"Trace written to {path}", file=sys.stderr)
+
+
+def _env_target() -> Optional[str]:
+    target = os.environ.get(TRACE_ENV, "").strip()
+    if not target or target.lower() in ("0", "false", "no", "off"):
+        return None
+    return target
+
+
+def _register_export(target: str) -> None:
+    # A multiprocessing finalizer runs at interpreter exit and, unlike atexit,
+    # also when a pool worker process exits
+    multiprocessing.util.Finalize(None, _export_at_exit, args=(target,), exitpriority=0)
+
+
+def enable_from_env() -> Optional[Tracer]:
+    """Turn tracing on when ``PIPELINE_TRACE`` is set, exporting at interpreter exit."""
+    target = _env_target()
+    if target is None:
+        return None
+    tracer = enable()
+    _register_export(target)
+    return tracer
+
+
+def init_worker() -> Optional[Tracer]:
+    """Start a fresh trace in a pool worker, exported when the worker exits.
+
+    New processes drop the finalizers they inherit (and forked ones the
+    parent's events), so worker initializers call this once.
+    """
+    global _tracer
+    target = _env_target()
+    if target is None:
+        return None
+    _tracer = Tracer(_tracer.max_events if _tracer is not None else MAX_EVENTS)
+    _register_export(target)
+    return _tracer
+
+
+enable_from_env()
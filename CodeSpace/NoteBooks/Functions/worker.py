@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import contextlib
+import json
+import socketserver
+import sys
+import time
+import traceback
+from typing import Any, Callable, Dict, Optional, TextIO
+
+Handler = Callable[..., Any]
+
+# Tasks every worker answers besides its own handlers
+PING = "ping"
+SHUTDOWN = "shutdown"
+
+
+def handle_request(handlers: Dict[str, Handler], line: str) -> Optional[Dict[str, Any]]:
+    """Run one JSON request line and build its response.
+
+    A request is ``{"id": ..., "task": name, "args": {...}}``; ``task`` may be
+    left out when the worker has a single handler. The response echoes the id
+    with ``ok`` and either ``result`` or ``error``, plus the handling time.
+    Returns None for blank lines.
+    """
+    line = line.strip()
+    if not line:
+        return None
+
+    start = time.perf_counter()
+    request_id = None
+    try:
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise ValueError("Request must be a JSON object")
+        request_id = request.get("id")
+        task = request.get("task")
+        if task is None and len(handlers) == 1:
+            task = next(iter(handlers))
+        if task == PING:
+            result: Any = {"tasks": sorted(handlers)}
+        elif task == SHUTDOWN:
+            result = None
+        elif task in handlers:
+            result = handlers[task](**request.get("args", {}))
+        else:
+            raise ValueError(f"Unknown task: {task}. Expected one of {sorted(handlers)}.")
+        response = {"id": request_id, "ok": True, "result": result}
+    except Exception as e:
+        traceback.print_exc(file=sys.stderr)
+        response = {"id": request_id, "ok": False, "error": f"{type(e).__name__}: {e}"}
+    response["seconds"] = time.perf_counter() - start
+    return response
+
+
+def _is_shutdown(line: str) -> bool:
+    try:
+        return json.loads(line).get("task") == SHUTDOWN
+    except (ValueError, AttributeError):
+        return False
+
+
+def serve_lines(
+    handlers: Dict[str, Handler],
+    input_stream: Optional[TextIO] = None,
+    output_stream: Optional[TextIO] = None,
+) -> int:
+    """Answer JSON-lines requests from ``input_stream`` (stdin) until EOF or ``shutdown``.
+
+    Progress output of the handlers is sent to stderr so that stdout only
+    carries responses. Returns the number of requests handled.
+    """
+    input_stream = input_stream or sys.stdin
+    output_stream = output_stream or sys.stdout
+
+    handled = 0
+    for line in input_stream:
+        with contextlib.redirect_stdout(sys.stderr):
+            response = handle_request(handlers, line)
+        if response is None:
+            continue
+        output_stream.write(json.dumps(response, default=str) + "\n")
+        output_stream.flush()
+        handled += 1
+        if _is_shutdown(line):
+            break
+    return handled
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for raw_line in self.rfile:
+            line = raw_line.decode("utf-8")
+            with contextlib.redirect_stdout(sys.stderr):
+                response = self.server.handle_line(line)
+            if response is None:
+                continue
+            self.wfile.write((json.dumps(response, default=str) + "\n").encode("utf-8"))
+            self.wfile.flush()
+            if _is_shutdown(line):
+                self.server.stop_requested = True
+                break
+
+
+class WorkerServer(socketserver.TCPServer):
+    """Local TCP server answering JSON-lines requests, one connection at a time.
+
+    Connections are served sequentially so the warm models are never used by
+    two requests at once.
+    """
+
+    allow_reuse_address = True
+
+    def __init__(self, handlers: Dict[str, Handler], host: str = "127.0.0.1", port: int = 0):
+        self.handlers = handlers
+        self.stop_requested = False
+        super().__init__((host, port), _RequestHandler)
+
+    def handle_line(self, line: str) -> Optional[Dict[str, Any]]:
+        return handle_request(self.handlers, line)
+
+    def serve_until_shutdown(self) -> None:
+        while not self.stop_requested:
+            self.handle_request()
+
+
+def serve_socket(handlers: Dict[str, Handler], host: str = "127.0.0.1", port: int = 0) -> None:
+    """Answer JSON-lines requests on a local TCP socket until a ``shutdown`` request."""
+    with WorkerServer(handlers, host, port) as server:
+        print(f"Worker listening on {server.server_address[0]}:{server.server_address[1]}", file=sys.stderr)
+        server.serve_until_shutdown()
+
+
+def run_worker(
+    handlers: Dict[str, Handler],
+    warmup: Optional[Callable[[], None]] = None,
+    port: Optional[int] = None,
+    host: str = "127.0.0.1",
+) -> None:
+    """Warm the models once, then serve requests on stdin (default) or a local socket."""
+    if warmup is not None:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(sys.stderr):
+            warmup()
+        print(f"Worker warm in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+    if port is None:
+        serve_lines(handlers)
+    else:
+        serve_socket(handlers, host, port)
@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+import io
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Optional, Set
+
+import cv2
+import numpy as np
+
+from Functions import tracing
+
+FSYNC_POLICIES = ("none", "file", "close")
+# Stats that add up across writers, e.g. the per-process writers of a worker pool
+WRITER_TOTALS = ("files", "bytes", "errors", "write_seconds", "blocked_seconds")
+
+
+def stats_delta(before: Dict[str, float], after: Dict[str, float]) -> Dict[str, float]:
+    """The additive writer stats accrued between two ``stats`` snapshots."""
+    return {key: after[key] - before[key] for key in WRITER_TOTALS}
+
+
+def totals_summary(deltas: Iterable[Dict[str, float]], workers: int) -> str:
+    """One-line description of the summed ``stats_delta`` results of ``workers`` processes."""
+    deltas = list(deltas)
+    totals = {key: sum(delta.get(key, 0) for delta in deltas) for key in WRITER_TOTALS}
+    return (f"{totals['files']} files, {totals['bytes'] / 1e6:.1f} MB written by {workers} workers "
+            f"({totals['write_seconds']:.2f}s writing, {totals['blocked_seconds']:.2f}s blocked, "
+            f"{totals['errors']} errors)")
+
+
+class AsyncArtifactWriter:
+    """
+    Bounded background stage that owns all artifact output (images, CSVs, text).
+
+    ``write_*`` calls return immediately; encoding and disk I/O run on a small
+    thread pool. At most ``max_pending`` artifacts are queued, after which
+    callers block until the disk catches up, so memory stays bounded.
+    Directories are created once per path, and every file is written to a
+    temporary name and renamed into place, so no artifact is ever half written.
+
+    Args:
+        workers: Number of writer threads
+        max_pending: Maximum number of queued artifacts (backpressure bound)
+        png_compression: OpenCV PNG compression level, 0 (fastest) to 9 (smallest)
+        webp_lossless: Save images as lossless WebP instead of PNG
+        fsync: ``"none"`` to leave flushing to the OS, ``"file"`` to fsync every
+            file as it is written, ``"close"`` to sync once when the writer closes
+    """
+
+    def __init__(
+        self,
+        workers: int = 2,
+        max_pending: int = 64,
+        png_compression: int = 3,
+        webp_lossless: bool = False,
+        fsync: str = "none",
+    ):
+        if workers < 1 or max_pending < 1:
+            raise ValueError("workers and max_pending must be positive integers.")
+        if not 0 <= png_compression <= 9:
+            raise ValueError("png_compression must be between 0 and 9.")
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}.")
+
+        self.workers = workers
+        self.max_pending = max_pending
+        self.png_compression = png_compression
+        self.webp_lossless = webp_lossless
+        self.fsync = fsync
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="artifact-writer")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending: Set[Future] = set()
+        self._dirs: Set[str] = set()
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._closed = False
+
+        self.files_written = 0
+        self.bytes_written = 0
+        self.write_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.errors = 0
+
+    @property
+    def options(self) -> Dict[str, Any]:
+        """Constructor arguments, e.g. to build an identical writer in a worker process."""
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "png_compression": self.png_compression,
+            "webp_lossless": self.webp_lossless,
+            "fsync": self.fsync,
+        }
+
+    @property
+    def image_extension(self) -> str:
+        return ".webp" if self.webp_lossless else ".png"
+
+    def image_path(self, path: str) -> str:
+        """The path an image written to ``path`` ends up at (the extension follows the format)."""
+        return os.path.splitext(str(path))[0] + self.image_extension
+
+    def write_image(self, path: str, image: np.ndarray) -> str:
+        """Queue an OpenCV (BGR) image; returns the final path."""
+        path = self.image_path(path)
+        if self.webp_lossless:
+            # OpenCV switches WebP to lossless for quality above 100
+            params = [cv2.IMWRITE_WEBP_QUALITY, 101]
+        else:
+            params = [cv2.IMWRITE_PNG_COMPRESSION, self.png_compression]
+
+        def encode() -> bytes:
+            ok, buffer = cv2.imencode(self.image_extension, image, params)
+            if not ok:
+                raise ValueError(f"Could not encode image for {path}")
+            return buffer.tobytes()
+
+        self._submit(path, encode)
+        return path
+
+    def write_text(self, path: str, text: str, encoding: str = "utf-8") -> str:
+        """Queue a text file (LaTeX, extracted text); returns the path."""
+        self._submit(str(path), lambda: text.encode(encoding))
+        return str(path)
+
+    def write_csv(self, path: str, df, **to_csv_kwargs) -> str:
+        """Queue a DataFrame as CSV; ``to_csv_kwargs`` are passed to ``DataFrame.to_csv``."""
+
+        def encode() -> bytes:
+            buffer = io.StringIO()
+            df.to_csv(buffer, **to_csv_kwargs)
+            return buffer.getvalue().encode("utf-8")
+
+        self._submit(str(path), encode)
+        return str(path)
+
+    def write_bytes(self, path: str, data: bytes) -> str:
+        """Queue already encoded bytes (e.g. an embedded image); returns the path."""
+        self._submit(str(path), lambda: data)
+        return str(path)
+
+    def _ensure_dir(self, path: str) -> None:
+        directory = os.path.dirname(os.path.abspath(path))
+        with self._lock:
+            if directory in self._dirs:
+                return
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self._dirs.add(directory)
+
+    def _submit(self, path: str, encode: Callable[[], bytes]) -> None:
+        if self._closed:
+            raise RuntimeError("Writer is closed.")
+        self._ensure_dir(path)
+
+        start = time.perf_counter()
+        self._slots.acquire()
+        blocked = time.perf_counter() - start
+
+        # The write is traced under the document and page that queued it
+        future = self._executor.submit(tracing.bind(self._write), path, encode)
+        with self._lock:
+            self.blocked_seconds += blocked
+            self._pending.add(future)
+        future.add_done_callback(self._release)
+
+    def _release(self, future: Future) -> None:
+        with self._lock:
+            self._pending.discard(future)
+        self._slots.release()
+
+    def _write(self, path: str, encode: Callable[[], bytes]) -> None:
+        start = time.perf_counter()
+        try:
+            with tracing.span(tracing.WRITE) as span:
+                data = encode()
+                # Write to a temporary file and rename it, so an interrupted run
+                # never leaves a truncated artifact behind
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                try:
+                    with open(tmp_path, "wb") as f:
+                        f.write(data)
+                        if self.fsync == "file":
+                            f.flush()
+                            os.fsync(f.fileno())
+                    os.replace(tmp_path, path)
+                except BaseException:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    raise
+                span.set(bytes=len(data))
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            print(f"Error writing {path}: {str(e)}")
+            return
+
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.files_written += 1
+            self.bytes_written += len(data)
+            self.write_seconds += elapsed
+
+    def flush(self) -> None:
+        """Block until every queued artifact has been written."""
+        with self._lock:
+            pending = list(self._pending)
+        wait(pending)
+
+    def close(self) -> None:
+        """Flush, stop the writer threads and apply the ``close`` fsync policy."""
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        self._executor.shutdown(wait=True)
+        if self.fsync == "close" and hasattr(os, "sync"):
+            os.sync()
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        """Files and bytes written, time spent writing and blocked, and throughput."""
+        elapsed = time.perf_counter() - self._started
+        with self._lock:
+            return {
+                "files": self.files_written,
+                "bytes": self.bytes_written,
+                "errors": self.errors,
+                "pending": len(self._pending),
+                "write_seconds": self.write_seconds,
+                "blocked_seconds": self.blocked_seconds,
+                "files_per_second": self.files_written / elapsed if elapsed > 0 else 0.0,
+                "mb_per_second": self.bytes_written / 1e6 / elapsed if elapsed > 0 else 0.0,
+            }
+
+    def summary(self) -> str:
+        """One-line description of the writer stats for run summaries."""
+        stats = self.stats
+        return (
+            f"{stats['files']} files, {stats['bytes'] / 1e6:.1f} MB written "
+            f"({stats['files_per_second']:.1f} files/s, {stats['mb_per_second']:.1f} MB/s, "
+            f"{stats['blocked_seconds']:.2f}s blocked, {stats['errors']} errors)"
+        )
+
+    def __enter__(self) -> AsyncArtifactWriter:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -1,250 +1,504 @@
+import io
 import os
+import time
+import multiprocessing.util
+import argparse
 import logging
 import warnings
-import pandas as pd
 import fitz
 import cv2
-from unstructured.partition.image import partition_image
 import numpy as np
-import tensorflow as tf
-from paddleocr import PaddleOCR
-
-# Suppress TensorFlow warnings
-os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'  # 0=all, 1=info, 2=warning, 3=error
+from Functions import tracing
+from Functions.engines import checkout_engine, register_engine
+from Functions.image_extractor import EmbeddedImageExtractor
+from Functions.manifest import DEFAULT_MANIFEST_NAME, DONE, FAILED, BatchManifest, file_hash
+from Functions.page_render import render_clip
+from Functions.parallel import map_unordered
+from Functions.table_structure import table_from_ocr
+from Functions.text_layer import extract_text_layer, has_usable_text_layer
+from Functions.writer import AsyncArtifactWriter, stats_delta, totals_summary
 
 # Suppress PaddleOCR debug messages
 logging.getLogger("ppocr").setLevel(logging.ERROR)
 warnings.filterwarnings('ignore')
 
-def process_pdf_documents_update(input_dir, output_base_dir, pad_left=5, pad_top=5, pad_right=14, pad_bottom=7, dpi = 300):
+# Result status of documents a resumed batch finds already done
+SKIPPED = "skipped"
+# Output folders below the base directory
+TEXT_FOLDER = "Extracted Text"
+TABLES_FOLDER = "Extracted Tables"
+TABLES_CSV_FOLDER = "Extracted Tables CSV"
+IMAGES_FOLDER = "Extracted Images"
 
-# def process_pdf_documents(input_dir, output_base_dir, dpi=300):
+def _create_page_ocr():
+    # PaddleOCR is only imported (and its models loaded) once a page needs OCR
+    from paddleocr import PaddleOCR
+    return PaddleOCR(lang='en')
+
+register_engine("page_ocr", _create_page_ocr)
+
+def partition_image(**kwargs):
+    """Lazily imported ``unstructured.partition.image.partition_image``."""
+    from unstructured.partition.image import partition_image as _partition_image
+    return _partition_image(**kwargs)
+
+def warm_up():
+    """Load the layout and OCR models ahead of the first scanned page."""
+    import unstructured.partition.image  # noqa: F401
+    with checkout_engine("page_ocr"):
+        pass
+
+class PDFDocumentProcessor:
     """
-    Process PDFs to extract text, tables, embedded images, and create CSV files in a single pass.
-    
-    Args:
-        input_dir (str): Directory containing PDF files
-        output_base_dir (str): Base directory for outputs
-        dpi (int): DPI for PDF to image conversion
+    Extract text, tables and embedded images of PDFs document by document.
+
+    Born-digital pages are read from their text layer; scanned or low-quality
+    pages are rendered, partitioned with Unstructured (hi_res) and their tables
+    OCR'd. All outputs go through one background writer.
     """
-    # Initialize output directories
-    text_output_folder = os.path.join(output_base_dir, "Extracted Text")
-    tables_output_folder = os.path.join(output_base_dir, "Extracted Tables")
-    tables_csv_folder = os.path.join(output_base_dir, "Extracted Tables CSV")
-    images_output_folder = os.path.join(output_base_dir, "Extracted Images")
-    
-    for folder in [text_output_folder, tables_output_folder, tables_csv_folder, images_output_folder]:
-        os.makedirs(folder, exist_ok=True)
-
-    def intersection(box_1, box_2):
-        """Calculate intersection of two bounding boxes"""
-        return [box_2[0], box_1[1], box_2[2], box_1[3]]
-
-    def iou(box_1, box_2):
-        """Calculate Intersection over Union of two boxes"""
-        x_1 = max(box_1[0], box_2[0])
-        y_1 = max(box_1[1], box_2[1])
-        x_2 = min(box_1[2], box_2[2])
-        y_2 = min(box_1[3], box_2[3])
-
-        inter = abs(max((x_2 - x_1, 0)) * max((y_2 - y_1), 0))
-        if inter == 0:
-            return 0
-
-        box_1_area = abs((box_1[2] - box_1[0]) * (box_1[3] - box_1[1]))
-        box_2_area = abs((box_2[2] - box_2[0]) * (box_2[3] - box_2[1]))
-
-        return inter / float(box_1_area + box_2_area - inter)
-
-    def extract_embedded_images(pdf_document, page, pdf_name, page_number):
-        """Extract embedded images from a PDF page"""
-        images_folder = os.path.join(images_output_folder, f"{pdf_name}-images")
-        os.makedirs(images_folder, exist_ok=True)
-        
-        images = page.get_images(full=True)
-        print(f"  Page {page_number + 1} has {len(images)} embedded image(s).")
-
-        for img_index, img in enumerate(images):
-            xref = img[0]
-            base_image = pdf_document.extract_image(xref)
-            image_bytes = base_image["image"]
-
-            # Construct filename for the image
-            image_filename = f"Page_{page_number + 1}_Image_{img_index + 1}.png"
-            image_path = os.path.join(images_folder, image_filename)
-
-            # Save the image
-            with open(image_path, "wb") as img_file:
-                img_file.write(image_bytes)
+
+    def __init__(self, output_base_dir, pad_left=5, pad_top=5, pad_right=14, pad_bottom=7, dpi=300,
+                 png_compression=3, webp_lossless=False, fsync="none", use_text_layer=True):
+        """
+        Args:
+            output_base_dir (str): Base directory for outputs
+            pad_left, pad_top, pad_right, pad_bottom (int): Padding in pixels around table crops
+            dpi (int): DPI for PDF to image conversion
+            png_compression (int): PNG compression level 0-9 for table crops
+            webp_lossless (bool): Save table crops as lossless WebP instead of PNG
+            fsync (str): When written files are synced to disk ("none", "file" or "close")
+            use_text_layer (bool): Read text and tables of born-digital pages from the
+                embedded text layer; only scanned or low-quality pages are rendered and OCR'd
+        """
+        self.text_output_folder = os.path.join(output_base_dir, TEXT_FOLDER)
+        self.tables_output_folder = os.path.join(output_base_dir, TABLES_FOLDER)
+        self.tables_csv_folder = os.path.join(output_base_dir, TABLES_CSV_FOLDER)
+        self.images_output_folder = os.path.join(output_base_dir, IMAGES_FOLDER)
+        for folder in [self.text_output_folder, self.tables_output_folder,
+                       self.tables_csv_folder, self.images_output_folder]:
+            os.makedirs(folder, exist_ok=True)
+
+        self.padding = (pad_left, pad_top, pad_right, pad_bottom)
+        self.dpi = dpi
+        self.use_text_layer = use_text_layer
+
+        # All outputs are written by a background stage so OCR never waits on disk
+        self.writer = AsyncArtifactWriter(png_compression=png_compression, webp_lossless=webp_lossless, fsync=fsync)
+        # Each distinct embedded image is written once, shared by all documents
+        self.image_extractor = EmbeddedImageExtractor(self.images_output_folder, writer=self.writer)
+        self.table_counts = {}
+        self.page_routes = {"text": 0, "ocr": 0}
+
+    def process_document(self, pdf_path, manifest=None):
+        """
+        Process every page of one PDF; returns its status and page and table counts.
+
+        With a ``BatchManifest`` the document is skipped if it is already done,
+        pages recorded as done are skipped, and every other page is marked done
+        (or failed) once its outputs are on disk. Table numbers continue from
+        the skipped pages, so a resumed document gets the same file names as an
+        uninterrupted run. The image index is written once per document; the
+        manifest keeps each done page's entries, so a resumed run rebuilds it.
+        """
+        pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
+        doc_hash = file_hash(pdf_path) if manifest is not None else None
+        if manifest is not None:
+            record = manifest.document(doc_hash)
+            if record is not None and record["status"] == DONE:
+                print(f"\nSkipping PDF: {os.path.basename(pdf_path)} (already processed)")
+                return self._document_result(pdf_path, SKIPPED, record["pages"], skipped_pages=record["pages"])
+
+        print(f"\nProcessing PDF: {os.path.basename(pdf_path)}")
+        routes_before = dict(self.page_routes)
+        images_before = dict(self.image_extractor.stats)
+        recorded = manifest.pages(doc_hash) if manifest is not None else {}
+        page_tables = {page: row["info"].get("tables", 0) for page, row in recorded.items() if row["status"] == DONE}
+        failed_pages = 0
+
+        with fitz.open(pdf_path) as pdf_document:
+            page_count = pdf_document.page_count
+            if manifest is not None:
+                manifest.start_document(doc_hash, pdf_path, page_count)
+            self.image_extractor.start_document(pdf_name)
+            self.image_extractor.restore_pages({
+                page: row["info"]["images"] for page, row in recorded.items()
+                if row["status"] == DONE and "images" in row["info"]
+            })
+            for page_number in range(page_count):
+                if page_number + 1 in page_tables:
+                    continue
+                # Table numbers continue from the tables of all earlier pages
+                self.table_counts[pdf_name] = sum(count for page, count in page_tables.items() if page <= page_number)
+                tables_before = self.table_counts[pdf_name]
+                with tracing.document(pdf_name), tracing.page(page_number + 1):
+                    if manifest is None:
+                        self.process_page(pdf_document, page_number, pdf_name)
+                    elif not self._process_checkpointed_page(manifest, doc_hash, pdf_document, page_number, pdf_name):
+                        failed_pages += 1
+                page_tables[page_number + 1] = self.table_counts[pdf_name] - tables_before
+        self.image_extractor.finish_document()
+        self.table_counts[pdf_name] = sum(page_tables.values())
+
+        status = FAILED if failed_pages else DONE
+        if manifest is not None:
+            manifest.finish_document(doc_hash, pdf_path, page_count, status,
+                                     f"{failed_pages} page(s) failed" if failed_pages else None)
+        print(f"Finished processing PDF: {os.path.basename(pdf_path)}")
+        return self._document_result(
+            pdf_path, status, page_count,
+            text_layer_pages=self.page_routes["text"] - routes_before["text"],
+            ocr_pages=self.page_routes["ocr"] - routes_before["ocr"],
+            tables=self.table_counts[pdf_name],
+            skipped_pages=sum(1 for row in recorded.values() if row["status"] == DONE),
+            failed_pages=failed_pages,
+            images_written=self.image_extractor.stats["written"] - images_before["written"],
+            image_placements=self.image_extractor.stats["placements"] - images_before["placements"],
+        )
+
+    @staticmethod
+    def _document_result(pdf_path, status, pages, text_layer_pages=0, ocr_pages=0, tables=0,
+                         skipped_pages=0, failed_pages=0, images_written=0, image_placements=0):
+        return {
+            "pdf": pdf_path,
+            "status": status,
+            "pages": pages,
+            "text_layer_pages": text_layer_pages,
+            "ocr_pages": ocr_pages,
+            "tables": tables,
+            "skipped_pages": skipped_pages,
+            "failed_pages": failed_pages,
+            "images_written": images_written,
+            "image_placements": image_placements,
+        }
+
+    def _process_checkpointed_page(self, manifest, doc_hash, pdf_document, page_number, pdf_name):
+        """Process one page and record it in the manifest once its outputs are written."""
+        errors_before = self.writer.errors
+        tables_before = self.table_counts[pdf_name]
+        start = time.perf_counter()
+        try:
+            route = self.process_page(pdf_document, page_number, pdf_name)
+            # Only outputs that reached the disk make a page done
+            self.writer.flush()
+            if self.writer.errors > errors_before:
+                raise IOError(f"{self.writer.errors - errors_before} output file(s) could not be written")
+        except Exception as e:
+            print(f"Error processing page {page_number + 1} of {pdf_name}: {e}")
+            manifest.mark_page(doc_hash, page_number + 1, FAILED, error=f"{type(e).__name__}: {e}",
+                               seconds=time.perf_counter() - start)
+            return False
+
+        manifest.mark_page(doc_hash, page_number + 1, DONE,
+                           info={"route": route, "tables": self.table_counts[pdf_name] - tables_before,
+                                 "images": self.image_extractor.page_entries(page_number + 1)},
+                           seconds=time.perf_counter() - start)
+        return True
+
+    def process_page(self, pdf_document, page_number, pdf_name):
+        """Extract the embedded images, text and tables of one page; returns its route ("text" or "ocr")."""
+        page = pdf_document[page_number]
+        page_name = f'page_{page_number + 1}'
+
+        # Extract embedded images first
+        self.extract_embedded_images(pdf_document, page, pdf_name, page_number)
+
+        # Born-digital pages skip rendering and OCR entirely
+        if self.use_text_layer:
+            usable, stats = has_usable_text_layer(page)
+            if usable:
+                self.page_routes["text"] += 1
+                tracing.count("text_layer_pages")
+                self._write_page_text(self.process_text_layer_page(page, page_name, pdf_name), page_name, pdf_name)
+                print(f"Processed page {page_number + 1}/{pdf_document.page_count} from text layer")
+                return "text"
+            print(f"  Page {page_number + 1} needs OCR ({stats['chars']} chars, "
+                  f"{stats['bad_char_ratio']:.0%} unmapped, {stats['image_coverage']:.0%} images)")
+        self.page_routes["ocr"] += 1
+        tracing.count("ocr_pages")
+
+        # Convert PDF page to image for text and table extraction
+        with tracing.span(tracing.RENDER, dpi=self.dpi):
+            pix = page.get_pixmap(dpi=self.dpi, colorspace=fitz.csRGB)
+            img_array = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, 3)
+            image_cv = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
+
+        # Hand the page to Unstructured in memory; BMP is lossless and
+        # needs no compression, unlike a temporary PNG on disk
+        ok, page_buffer = cv2.imencode(".bmp", image_cv)
+        if not ok:
+            raise RuntimeError(f"Could not encode page {page_number + 1} of {pdf_name}")
+
+        # Extract elements using Unstructured
+        with tracing.span(tracing.LAYOUT, engine="unstructured"):
+            elements = partition_image(file=io.BytesIO(page_buffer.tobytes()),
+                                       infer_table_structure=True,
+                                       strategy='hi_res')
+        element_dict = [el.to_dict() for el in elements]
+
+        # Process each element
+        page_texts = []
+        for element in element_dict:
+            self.process_element(element, page_name, pdf_name, image_cv, page_texts)
+
+        self._write_page_text(page_texts, page_name, pdf_name)
+        print(f"Processed page {page_number + 1}/{pdf_document.page_count}")
+        return "ocr"
+
+    def _write_page_text(self, page_texts, page_name, pdf_name):
+        if page_texts:
+            text_path = os.path.join(self.text_output_folder, f"{pdf_name}-Texts", f"{page_name}_text.txt")
+            self.writer.write_text(text_path, "\n".join(page_texts) + "\n")
+
+    def _next_table_filename(self, page_name, pdf_name):
+        self.table_counts[pdf_name] = self.table_counts.get(pdf_name, 0) + 1
+        return f"{page_name}_Table_{self.table_counts[pdf_name]}.png"
+
+    def extract_embedded_images(self, pdf_document, page, pdf_name, page_number):
+        """Extract embedded images from a PDF page; repeated images are only indexed"""
+        entries, written = self.image_extractor.extract_page(pdf_document, page, page_number)
+        print(f"  Page {page_number + 1} has {len(entries)} embedded image(s).")
+        tracing.count("embedded_images", len(entries))
+
+        for image_path in written:
             print(f"    Saved embedded image: {image_path}")
 
-    def process_element(element, page_name, pdf_name, image_cv):
+    def process_text_layer_page(self, page, page_name, pdf_name):
+        """Extract text and tables of a born-digital page from its embedded glyphs"""
+        extracted = extract_text_layer(page)
+        table_folder = os.path.join(self.tables_output_folder, f"{pdf_name}-Tables")
+        csv_folder = os.path.join(self.tables_csv_folder, f"{pdf_name}-csv")
+
+        for table in extracted["tables"]:
+            # Render only the table region for the table image
+            scale = self.dpi / 72
+            bbox = [coordinate * scale for coordinate in table["bbox"]]
+            cropped_table = render_clip(page, bbox, self.dpi, padding=self.padding)
+            table_filename = self._next_table_filename(page_name, pdf_name)
+            table_path = self.writer.write_image(os.path.join(table_folder, table_filename), cropped_table)
+            print(f"Cropped table saved to: {table_path}")
+
+            csv_filename = f"{os.path.splitext(table_filename)[0]}.csv"
+            self.writer.write_csv(os.path.join(csv_folder, csv_filename), table["dataframe"], index=False, header=False)
+            print(f"Saved CSV: {csv_filename} in {csv_folder}")
+
+        return extracted["texts"]
+
+    def process_element(self, element, page_name, pdf_name, image_cv, page_texts):
         """Process individual elements (text or table) from the page"""
         if element.get("type") == "Table":
             try:
                 coordinates = element["metadata"]["coordinates"]["points"]
-                table_folder = os.path.join(tables_output_folder, f"{pdf_name}-Tables")
-                csv_folder = os.path.join(tables_csv_folder, f"{pdf_name}-csv")
-                
-                # Create necessary folders
-                os.makedirs(table_folder, exist_ok=True)
-                os.makedirs(csv_folder, exist_ok=True)
-                
+                table_folder = os.path.join(self.tables_output_folder, f"{pdf_name}-Tables")
+                csv_folder = os.path.join(self.tables_csv_folder, f"{pdf_name}-csv")
+                pad_left, pad_top, pad_right, pad_bottom = self.padding
+
                 # Crop and save table image
                 x_min = int(min(pt[0] for pt in coordinates))
                 y_min = int(min(pt[1] for pt in coordinates))
                 x_max = int(max(pt[0] for pt in coordinates))
                 y_max = int(max(pt[1] for pt in coordinates))
-                
+
                 # Add padding
                 x_min = max(0, x_min - pad_left)
                 y_min = max(0, y_min - pad_top)
                 x_max = min(image_cv.shape[1], x_max + pad_right)
                 y_max = min(image_cv.shape[0], y_max + pad_bottom)
-                
+
                 cropped_table = image_cv[y_min:y_max, x_min:x_max]
-                table_filename = f"{page_name}_Table_{len(os.listdir(table_folder)) + 1}.png"
-                table_path = os.path.join(table_folder, table_filename)
-                cv2.imwrite(table_path, cropped_table)
+                table_filename = self._next_table_filename(page_name, pdf_name)
+                table_path = self.writer.write_image(os.path.join(table_folder, table_filename), cropped_table)
                 print(f"Cropped table saved to: {table_path}")
-                
-                # Process table with OCR and restructure
-                output = ocr.ocr(table_path)[0]
+
+                # Process table with OCR and restructure (on the crop in memory)
+                with checkout_engine("page_ocr") as ocr, tracing.span(tracing.OCR, table=table_filename):
+                    output = ocr.ocr(cropped_table)[0]
                 if not output:
                     print(f"No OCR output for table: {table_filename}")
                     return
 
-                # Extract bounding boxes and text
-                boxes = [line[0] for line in output]
-                texts = [line[1][0] for line in output]
-                probabilities = [line[1][1] for line in output]
-
-                # Generate horizontal and vertical boxes
-                image_height, image_width = cropped_table.shape[:2]
-                horiz_boxes = []
-                vert_boxes = []
-
-                for box in boxes:
-                    x_h, x_v = 0, int(box[0][0])
-                    y_h, y_v = int(box[0][1]), 0
-                    width_h, width_v = image_width, int(box[2][0] - box[0][0])
-                    height_h, height_v = int(box[2][1] - box[0][1]), image_height
-
-                    horiz_boxes.append([x_h, y_h, x_h + width_h, y_h + height_h])
-                    vert_boxes.append([x_v, y_v, x_v + width_v, y_v + height_v])
-
-                # Apply NMS
-                horiz_out = tf.image.non_max_suppression(
-                    horiz_boxes, probabilities, max_output_size=1000, iou_threshold=0.1
-                )
-                vert_out = tf.image.non_max_suppression(
-                    vert_boxes, probabilities, max_output_size=1000, iou_threshold=0.1
-                )
-
-                horiz_lines = np.sort(np.array(horiz_out))
-                vert_lines = np.sort(np.array(vert_out))
-
-                # Create table structure
-                out_array = [["" for _ in range(len(vert_lines))] for _ in range(len(horiz_lines))]
-                unordered_boxes = [vert_boxes[i][0] for i in vert_lines]
-                ordered_boxes = np.argsort(unordered_boxes)
-
-                # Fill table with text
-                for i in range(len(horiz_lines)):
-                    for j in range(len(vert_lines)):
-                        resultant = intersection(
-                            horiz_boxes[horiz_lines[i]], 
-                            vert_boxes[vert_lines[ordered_boxes[j]]]
-                        )
-
-                        for b in range(len(boxes)):
-                            the_box = [boxes[b][0][0], boxes[b][0][1], boxes[b][2][0], boxes[b][2][1]]
-                            if iou(resultant, the_box) > 0.1:
-                                out_array[i][j] = texts[b]
+                # Rebuild the table grid from the OCR boxes
+                table_df = table_from_ocr(output, cropped_table.shape[:2])
 
                 # Save as CSV
                 csv_filename = f"{os.path.splitext(table_filename)[0]}.csv"
                 csv_path = os.path.join(csv_folder, csv_filename)
-                pd.DataFrame(out_array).to_csv(csv_path, index=False, header=False)
+                self.writer.write_csv(csv_path, table_df, index=False, header=False)
                 print(f"Saved CSV: {csv_filename} in {csv_folder}")
-                
+
             except (KeyError, IndexError) as e:
                 print(f"Error processing table: {e}")
-                
+
         elif element.get("type") != "Table":
-            # Handle text element
+            # Handle text element; the page's text is written once the page is done
             text_content = element.get("text", "")
             if text_content:
-                text_folder = os.path.join(text_output_folder, f"{pdf_name}-Texts")
-                os.makedirs(text_folder, exist_ok=True)
-                text_filename = f"{page_name}_text.txt"
-                text_path = os.path.join(text_folder, text_filename)
-                
-                with open(text_path, "a", encoding="utf-8") as text_file:
-                    text_file.write(text_content + "\n")
-
-    # Initialize OCR
-    ocr = PaddleOCR(lang='en')
-    
+                page_texts.append(text_content)
+
+    def close(self):
+        """Wait for all outputs to be written."""
+        self.writer.close()
+
+    def print_summary(self):
+        print(f"Text extracted to: {self.text_output_folder}")
+        print(f"Tables extracted to: {self.tables_output_folder}")
+        print(f"Table CSVs saved to: {self.tables_csv_folder}")
+        print(f"Embedded images extracted to: {self.images_output_folder}")
+
+def process_with_manifest(processor, manifest, pdf_path):
+    """Process one PDF under a manifest; a document that cannot be read is recorded as failed."""
+    try:
+        return processor.process_document(pdf_path, manifest)
+    except Exception as e:
+        print(f"Error processing {os.path.basename(pdf_path)}: {e}")
+        try:
+            manifest.finish_document(file_hash(pdf_path), pdf_path, None, FAILED, f"{type(e).__name__}: {e}")
+        except OSError:
+            pass
+        return PDFDocumentProcessor._document_result(pdf_path, FAILED, None)
+
+def process_and_flush(processor, manifest, pdf_path):
+    """``process_with_manifest`` with the document's outputs on disk and its writer activity in ``result["writer"]``."""
+    before = processor.writer.stats
+    result = process_with_manifest(processor, manifest, pdf_path)
+    processor.writer.flush()
+    result["writer"] = stats_delta(before, processor.writer.stats)
+    return result
+
+# Per-process processor and manifest used by the batch worker pool
+_batch_processor = None
+_batch_manifest = None
+
+def _close_batch_worker():
+    # Applies the writer's "close" fsync policy before the worker exits
+    if _batch_processor is not None:
+        _batch_processor.close()
+    if _batch_manifest is not None:
+        _batch_manifest.close()
+
+def _init_batch_worker(output_base_dir, manifest_path, options):
+    """Create the processor (models load on first use) and a manifest connection once per worker."""
+    global _batch_processor, _batch_manifest
+    _batch_processor = PDFDocumentProcessor(output_base_dir, **options)
+    _batch_manifest = BatchManifest(manifest_path)
+    # Pool workers skip atexit; a multiprocessing finalizer runs when they exit,
+    # ahead of the trace export (exitpriority 0)
+    multiprocessing.util.Finalize(None, _close_batch_worker, exitpriority=10)
+
+def _process_batch_document(pdf_path):
+    return process_and_flush(_batch_processor, _batch_manifest, pdf_path)
+
+def print_output_folders(output_base_dir):
+    print(f"Text extracted to: {os.path.join(output_base_dir, TEXT_FOLDER)}")
+    print(f"Tables extracted to: {os.path.join(output_base_dir, TABLES_FOLDER)}")
+    print(f"Table CSVs saved to: {os.path.join(output_base_dir, TABLES_CSV_FOLDER)}")
+    print(f"Embedded images extracted to: {os.path.join(output_base_dir, IMAGES_FOLDER)}")
+
+def process_pdf_documents_update(input_dir, output_base_dir, pad_left=5, pad_top=5, pad_right=14, pad_bottom=7, dpi = 300,
+                                 png_compression=3, webp_lossless=False, fsync="none", use_text_layer=True,
+                                 workers=1, manifest_path=None, resume=True):
+
+# def process_pdf_documents(input_dir, output_base_dir, dpi=300):
+    """
+    Process PDFs to extract text, tables, embedded images, and create CSV files in a single pass.
+
+    Progress is kept per document and page in a SQLite manifest, so an
+    interrupted run picks up where it stopped: finished documents and pages are
+    skipped and every output file is rewritten in place rather than appended.
+
+    Args:
+        input_dir (str): Directory containing PDF files
+        output_base_dir (str): Base directory for outputs
+        workers (int): Processes working on different documents at once
+        manifest_path (str): Progress manifest (defaults to ``manifest.sqlite`` in ``output_base_dir``)
+        resume (bool): Skip work the manifest records as done; False starts over
+        See ``PDFDocumentProcessor`` for the remaining options.
+    """
+    options = dict(pad_left=pad_left, pad_top=pad_top, pad_right=pad_right, pad_bottom=pad_bottom, dpi=dpi,
+                   png_compression=png_compression, webp_lossless=webp_lossless, fsync=fsync,
+                   use_text_layer=use_text_layer)
+    manifest_path = manifest_path or os.path.join(output_base_dir, DEFAULT_MANIFEST_NAME)
+    # With several workers each builds its own processor in the pool
+    processor = PDFDocumentProcessor(output_base_dir, **options) if workers <= 1 else None
+    manifest = BatchManifest(manifest_path)
+    if not resume:
+        manifest.reset()
+
     # Process each PDF
-    pdf_files = [f for f in os.listdir(input_dir) if f.lower().endswith('.pdf')]
+    pdf_files = sorted(f for f in os.listdir(input_dir) if f.lower().endswith('.pdf'))
+    pdf_paths = [os.path.join(input_dir, pdf_file) for pdf_file in pdf_files]
     print(f"Found {len(pdf_files)} PDF files to process")
 
-    for pdf_file in pdf_files:
-        pdf_path = os.path.join(input_dir, pdf_file)
-        pdf_name = os.path.splitext(pdf_file)[0]
-        print(f"\nProcessing PDF: {pdf_file}")
-        
-        pdf_document = fitz.open(pdf_path)
-        
-        for page_number in range(pdf_document.page_count):
-            page = pdf_document[page_number]
-            page_name = f'page_{page_number + 1}'
-            
-            # Extract embedded images first
-            extract_embedded_images(pdf_document, page, pdf_name, page_number)
-            
-            # Convert PDF page to image for text and table extraction
-            pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csRGB)
-            img_array = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, 3)
-            image_cv = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-            
-            # Create temporary image file
-            temp_image_path = os.path.join(output_base_dir, "temp_page.png")
-            cv2.imwrite(temp_image_path, image_cv)
-            
-            try:
-                # Extract elements using Unstructured
-                elements = partition_image(filename=temp_image_path, 
-                                        infer_table_structure=True, 
-                                        strategy='hi_res')
-                element_dict = [el.to_dict() for el in elements]
-                
-                # Process each element
-                for element in element_dict:
-                    process_element(element, page_name, pdf_name, image_cv)
-                    
-            finally:
-                if os.path.exists(temp_image_path):
-                    os.remove(temp_image_path)
-            
-            print(f"Processed page {page_number + 1}/{pdf_document.page_count}")
-        
-        pdf_document.close()
-        print(f"Finished processing PDF: {pdf_file}")
+    results = []
+    try:
+        if workers > 1:
+            for _, result in map_unordered(_process_batch_document, pdf_paths, workers,
+                                           initializer=_init_batch_worker,
+                                           initargs=(output_base_dir, manifest_path, options)):
+                results.append(result)
+        else:
+            for pdf_path in pdf_paths:
+                results.append(process_and_flush(processor, manifest, pdf_path))
+    finally:
+        if processor is not None:
+            processor.close()
 
+    statuses = [result["status"] for result in results]
     print("\nProcessing complete!")
-    print(f"Text extracted to: {text_output_folder}")
-    print(f"Tables extracted to: {tables_output_folder}")
-    print(f"Table CSVs saved to: {tables_csv_folder}")
-    print(f"Embedded images extracted to: {images_output_folder}")
-
-input_directory = "TEST INPUT PDF"
-output_dir = "TEST_RESULT_1"
-pad_left=5
-pad_top=5
-pad_right=20
-pad_bottom=7
-
-# process_pdf_documents(input_directory, output_dir)
-process_pdf_documents_update(input_directory, output_dir, pad_left, pad_top, pad_right, pad_bottom)
\ No newline at end of file
+    print(f"Documents: {statuses.count(DONE)} processed, {statuses.count(SKIPPED)} already done, "
+          f"{statuses.count(FAILED)} failed")
+    print(f"Pages: {sum(r['text_layer_pages'] for r in results)} from text layer, "
+          f"{sum(r['ocr_pages'] for r in results)} with OCR, {sum(r['skipped_pages'] for r in results)} skipped, "
+          f"{sum(r['failed_pages'] for r in results)} failed")
+    print(f"Embedded images: {sum(r['images_written'] for r in results)} written, "
+          f"{sum(r['image_placements'] for r in results)} placements indexed")
+    if processor is not None:
+        print(f"Writer: {processor.writer.summary()}")
+    else:
+        print(f"Writer: {totals_summary((r.get('writer', {}) for r in results), workers)}")
+    print(f"Manifest: {manifest_path} {manifest.stats}")
+    manifest.close()
+    print_output_folders(output_base_dir)
+
+def process_pdf_document(pdf, output_dir, **options):
+    """Worker task: process one PDF into ``output_dir``; ``options`` as for ``PDFDocumentProcessor``."""
+    processor = PDFDocumentProcessor(output_dir, **options)
+    try:
+        result = processor.process_document(pdf)
+    finally:
+        processor.close()
+    result["writer"] = processor.writer.stats
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract text, tables and images from PDFs")
+    parser.add_argument("input_dir", nargs="?", default="TEST INPUT PDF", help="Directory containing PDF files")
+    parser.add_argument("output_dir", nargs="?", default="TEST_RESULT_1", help="Base directory for outputs")
+    parser.add_argument("--pad", nargs=4, type=int, default=[5, 5, 20, 7], metavar=("LEFT", "TOP", "RIGHT", "BOTTOM"),
+                        help="Padding in pixels around table crops")
+    parser.add_argument("--dpi", type=int, default=300, help="DPI for PDF to image conversion")
+    parser.add_argument("--png-compression", type=int, default=3, help="PNG compression level 0-9")
+    parser.add_argument("--webp", action="store_true", help="Save table crops as lossless WebP")
+    parser.add_argument("--fsync", default="none", choices=["none", "file", "close"], help="When files are synced to disk")
+    parser.add_argument("--no-text-layer", action="store_true", help="Render and OCR every page")
+    parser.add_argument("--workers", type=int, default=1, help="Documents processed at once")
+    parser.add_argument("--manifest", help="Progress manifest (default: manifest.sqlite in the output directory)")
+    parser.add_argument("--restart", action="store_true", help="Ignore recorded progress and process everything")
+    parser.add_argument("--worker", action="store_true",
+                        help="Keep models warm and process documents sent as JSON lines on stdin")
+    parser.add_argument("--port", type=int, help="With --worker, listen on this local TCP port instead of stdin")
+    args = parser.parse_args()
+
+    if args.worker:
+        from Functions.worker import run_worker
+        # Requests: {"id": 1, "args": {"pdf": "a.pdf", "output_dir": "out", "dpi": 200}}
+        run_worker({"process": process_pdf_document}, warmup=warm_up, port=args.port)
+        return
+
+    pad_left, pad_top, pad_right, pad_bottom = args.pad
+    process_pdf_documents_update(args.input_dir, args.output_dir, pad_left, pad_top, pad_right, pad_bottom,
+                                 dpi=args.dpi, png_compression=args.png_compression, webp_lossless=args.webp,
+                                 fsync=args.fsync, use_text_layer=not args.no_text_layer, workers=args.workers,
+                                 manifest_path=args.manifest, resume=not args.restart)
+
+if __name__ == "__main__":
+    main()
@@ -10,15 +10,18 @@ import os
 # import io
 import sys
 import argparse
+import multiprocessing.util
 import cv2
 import numpy as np
-from typing import List, Dict, Any, Optional
-from PIL import Image as PILImage
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 from pathlib import Path
 
 from Functions.filetype import detect_filetype, FileType
+from Functions.page_render import DETECTION_SIZE, PageRenderCache, PDFRenderSession
+from Functions.parallel import map_page_ranges
 from Functions.pdfminer_utiles import PDFMinerConfig
 from Functions.utiles import requires_dependencies
+from Functions.writer import AsyncArtifactWriter, stats_delta, totals_summary
 
 
 class PDFElementDetectorCV2:
@@ -34,7 +37,12 @@ class PDFElementDetectorCV2:
         languages: List[str] = ["eng"],
         pdfminer_config: Optional[PDFMinerConfig] = None,
         output_dir: str = "output",
-        padding: int = 5  # Padding around detected elements
+        padding: int = 5,  # Padding around detected elements
+        batch_size: int = 8,  # Pages per layout-model run
+        page_cache: Optional[PageRenderCache] = None,
+        workers: int = 1,  # Processes used to render and detect pages
+        two_resolution: bool = False,  # Detect on small renders, crop at full DPI
+        writer: Optional[AsyncArtifactWriter] = None
     ):
         """
         Initialize the PDF element detector with OpenCV support.
@@ -46,6 +54,13 @@ class PDFElementDetectorCV2:
             pdfminer_config: Optional PDFMiner configuration
             output_dir: Directory for saving extracted elements
             padding: Padding pixels around detected elements
+            batch_size: Number of pages sent to the layout model in one run
+            page_cache: Optional render cache shared with other detectors
+            workers: Number of processes to shard pages across
+            two_resolution: Run detection on pages rendered just large enough for
+                the model input and re-render each extracted element at ``dpi``
+            writer: Background writer for crops and visualizations (one is
+                created when not given)
         """
         self.hi_res_model_name = hi_res_model_name
         self.dpi = dpi
@@ -53,6 +68,13 @@ class PDFElementDetectorCV2:
         self.pdfminer_config = pdfminer_config or PDFMinerConfig()
         self.output_dir = Path(output_dir)
         self.padding = padding
+        self.batch_size = batch_size
+        self.page_cache = page_cache if page_cache is not None else PageRenderCache(
+            max_pages=max(batch_size, 16)
+        )
+        self.workers = workers
+        self.two_resolution = two_resolution
+        self.writer = writer if writer is not None else AsyncArtifactWriter()
         
         # Color mapping for visualization
         self.color_map = {
@@ -95,10 +117,20 @@ class PDFElementDetectorCV2:
             file_or_path.seek(0)
             return "", file_bytes
     
+    def _open_render_session(self, pdf_path: str, pdf_bytes: bytes) -> PDFRenderSession:
+        """Open the PDF for rendering through the shared page cache."""
+        return PDFRenderSession(
+            pdf_path, pdf_bytes, self.dpi, cache=self.page_cache,
+            detect_size=DETECTION_SIZE if self.two_resolution else None
+        )
+    
     def _pdf_to_cv2_images(self, pdf_path: str, pdf_bytes: bytes) -> List[np.ndarray]:
         """
         Convert PDF pages to OpenCV images.
         
+        Pages are served from the shared page cache, so pages rendered by an
+        earlier call are not rasterized again.
+        
         Args:
             pdf_path: Path to PDF file
             pdf_bytes: PDF file bytes
@@ -106,26 +138,40 @@ class PDFElementDetectorCV2:
         Returns:
             List of OpenCV images (numpy arrays)
         """
-        import fitz
-        
-        doc = fitz.open(pdf_path) if pdf_path else fitz.open(stream=pdf_bytes, filetype="pdf")
-        zoom = self.dpi / 72
-        images = []
+        with self._open_render_session(pdf_path, pdf_bytes) as session:
+            return [image for _, image in session.iter_pages()]
+    
+    def _iter_detected_pages(
+        self, session: PDFRenderSession, page_numbers: Optional[range] = None
+    ) -> Iterator[Tuple[int, np.ndarray, List[Dict[str, Any]]]]:
+        """
+        Render and detect pages batch by batch.
         
-        for page in doc:
-            matrix = fitz.Matrix(zoom, zoom)
-            pixmap = page.get_pixmap(matrix=matrix)
+        Args:
+            session: Open render session for the PDF
+            page_numbers: Optional range of 1-based pages (defaults to all pages)
             
-            # Convert to numpy array directly
-            img_array = np.frombuffer(pixmap.samples, dtype=np.uint8)
-            img_array = img_array.reshape((pixmap.height, pixmap.width, 3))
+        Yields:
+            Tuples of (page number, page image, detected elements) in page order;
+            element coordinates are in pixels at ``self.dpi`` even when the page
+            image was rendered smaller
+        """
+        model = self._load_detection_model()
+        if page_numbers is None:
+            page_numbers = range(1, session.page_count + 1)
+        
+        for start in range(0, len(page_numbers), self.batch_size):
+            batch = [
+                (page_number, session.page_image(page_number))
+                for page_number in page_numbers[start:start + self.batch_size]
+            ]
+            # Convert BGR to RGB for the model
+            rgb_images = [cv2.cvtColor(page_image, cv2.COLOR_BGR2RGB) for _, page_image in batch]
+            batch_predictions = model.predict_batch(rgb_images, batch_size=self.batch_size)
             
-            # Convert RGB to BGR for OpenCV
-            img_bgr = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-            images.append(img_bgr)
-        
-        doc.close()
-        return images
+            for (page_number, page_image), predictions in zip(batch, batch_predictions):
+                scale = self.dpi / session.page_dpi(page_number)
+                yield page_number, page_image, self._predictions_to_elements(predictions, page_number, scale)
     
     def detect_elements(self, file_or_path) -> List[Dict[str, Any]]:
         """
@@ -137,62 +183,57 @@ class PDFElementDetectorCV2:
         Returns:
             List of detected elements with their properties
         """
-
-
-        from Functions.Inferences.layoutelement import LayoutElements
-
-
-        
-        pdf_path, pdf_bytes = self._verify_pdf(file_or_path)
-        page_images = self._pdf_to_cv2_images(pdf_path, pdf_bytes)
+        return self.process_document(file_or_path, extract=False)["detections"]
+    
+    def _predictions_to_elements(self, predictions, page_number: int, scale: float = 1.0) -> List[Dict[str, Any]]:
+        """
+        Convert layout-model predictions for one page into element dictionaries.
         
-        if not page_images:
-            raise ValueError("No pages rendered from the PDF")
+        Args:
+            predictions: Model output for the page
+            page_number: 1-based page number the predictions belong to
+            scale: Factor mapping prediction coordinates to pixels at ``self.dpi``
+            
+        Returns:
+            List of detected elements with their properties
+        """
+        from Functions.Inferences.layoutelement import LayoutElements
         
-        model = self._load_detection_model()
-        all_elements = []
+        if predictions is None:
+            print(f"Warning: No predictions for page {page_number}")
+            return []
+        
+        page_elements = (
+            list(predictions.iter_elements())
+            if isinstance(predictions, LayoutElements)
+            else predictions if isinstance(predictions, list)
+            else predictions.elements if hasattr(predictions, 'elements')
+            else predictions.as_list() if hasattr(predictions, 'as_list')
+            else []
+        )
         
-        for idx, page_image in enumerate(page_images, 1):
-            # Convert BGR to RGB for the model
-            rgb_image = cv2.cvtColor(page_image, cv2.COLOR_BGR2RGB)
-            pil_image = PILImage.fromarray(rgb_image)
-            
-            predictions = model.predict(pil_image)
-            
-            if predictions is None:
-                print(f"Warning: No predictions for page {idx}")
+        elements = []
+        for element in page_elements:
+            if not hasattr(element, 'bbox') or element.bbox is None:
                 continue
             
-            page_elements = (
-                list(predictions.iter_elements())
-                if isinstance(predictions, LayoutElements)
-                else predictions if isinstance(predictions, list)
-                else predictions.elements if hasattr(predictions, 'elements')
-                else predictions.as_list() if hasattr(predictions, 'as_list')
-                else []
-            )
-            
-            for element in page_elements:
-                if not hasattr(element, 'bbox') or element.bbox is None:
-                    continue
-                
-                element_info = {
-                    "type": element.type if hasattr(element, 'type') and element.type else "Unknown",
-                    "page_number": idx,
-                    "coordinates": {
-                        "bbox": [
-                            element.bbox.x1,
-                            element.bbox.y1,
-                            element.bbox.x2,
-                            element.bbox.y2
-                        ]
-                    },
-                    "confidence": element.prob if hasattr(element, 'prob') else None,
-                    "text": element.text if hasattr(element, 'text') else None
-                }
-                all_elements.append(element_info)
-        
-        return all_elements
+            element_info = {
+                "type": element.type if hasattr(element, 'type') and element.type else "Unknown",
+                "page_number": page_number,
+                "coordinates": {
+                    "bbox": [
+                        element.bbox.x1 * scale,
+                        element.bbox.y1 * scale,
+                        element.bbox.x2 * scale,
+                        element.bbox.y2 * scale
+                    ]
+                },
+                "confidence": element.prob if hasattr(element, 'prob') else None,
+                "text": element.text if hasattr(element, 'text') else None
+            }
+            elements.append(element_info)
+        
+        return elements
     
     def crop_element_cv2(self, image: np.ndarray, bbox: List[float], padding: int = None) -> np.ndarray:
         """
@@ -229,67 +270,264 @@ class PDFElementDetectorCV2:
         
         return cropped
     
-    def extract_elements_cv2(self, file_or_path, types_to_extract: List[str] = None):
+    def process_document(
+        self,
+        file_or_path,
+        extract: bool = True,
+        visualize: bool = False,
+        types_to_extract: List[str] = None,
+        output_path: str = "detections.png",
+        keep_annotated: bool = False
+    ) -> Dict[str, Any]:
         """
-        Extract and save elements using OpenCV for better quality.
+        Detect, extract and visualize elements in a single pass over the pages.
+        
+        Each page is rendered once and shared by detection, cropping and
+        visualization before moving on to the next batch, so only a bounded
+        number of rendered pages is held in memory. With ``workers`` > 1 the
+        page ranges are sharded across a process pool and merged back in
+        page order.
         
         Args:
             file_or_path: PDF file path or file-like object
+            extract: Whether to save crops of the detected elements
+            visualize: Whether to save annotated page images
             types_to_extract: List of element types to extract
+            output_path: Path to save visualization
+            keep_annotated: Whether to also return the annotated images
+            
+        Returns:
+            Dictionary with the detections, saved crop files per type,
+            visualization paths and (optionally) annotated images
         """
         if types_to_extract is None:
             types_to_extract = ["Table", "Formula", "Picture"]
         
-        self.output_dir.mkdir(exist_ok=True)
         type_dirs = {}
-        for elem_type in types_to_extract:
-            type_dir = self.output_dir / elem_type.lower()
-            type_dir.mkdir(exist_ok=True)
-            type_dirs[elem_type] = type_dir
-        
-        detections = self.detect_elements(file_or_path)
-        filtered_detections = [d for d in detections if d.get("type") in types_to_extract]
-        
-        if not filtered_detections:
-            print(f"No elements of types {types_to_extract} found")
-            return {}
+        if extract:
+            self.output_dir.mkdir(exist_ok=True)
+            for elem_type in types_to_extract:
+                type_dir = self.output_dir / elem_type.lower()
+                type_dir.mkdir(exist_ok=True)
+                type_dirs[elem_type] = type_dir
         
         pdf_path, pdf_bytes = self._verify_pdf(file_or_path)
         pdf_filename = Path(pdf_path).stem if pdf_path else "document"
-        page_images = self._pdf_to_cv2_images(pdf_path, pdf_bytes)
         
-        saved_files = {elem_type: [] for elem_type in types_to_extract}
+        result = {
+            "detections": [],
+            "saved_files": {elem_type: [] for elem_type in types_to_extract} if extract else {},
+            "visualizations": [],
+            "annotated_images": []
+        }
         
-        for page_num, page_image in enumerate(page_images, 1):
-            page_elements = [d for d in filtered_detections if d.get("page_number") == page_num]
+        options = {
+            "extract": extract,
+            "visualize": visualize,
+            "types_to_extract": types_to_extract,
+            "type_dirs": type_dirs,
+            "pdf_filename": pdf_filename,
+            "output_path": output_path,
+            "keep_annotated": keep_annotated
+        }
+        
+        if self.workers > 1:
+            # Materialized so the workers' writer stats can be summed afterwards
+            partials = list(self._process_pages_parallel(pdf_path, pdf_bytes, options))
+        else:
+            with self._open_render_session(pdf_path, pdf_bytes) as session:
+                if session.page_count == 0:
+                    raise ValueError("No pages rendered from the PDF")
+                partials = [self._process_pages(session, None, **options)]
+                self.writer.flush()
+        
+        for partial in partials:
+            result["detections"].extend(partial["detections"])
+            for elem_type, files in partial["saved_files"].items():
+                result["saved_files"][elem_type].extend(files)
+            result["visualizations"].extend(partial["visualizations"])
+            result["annotated_images"].extend(partial["annotated_images"])
+        
+        if extract:
+            # Print summary
+            for elem_type, files in result["saved_files"].items():
+                print(f"Extracted {len(files)} {elem_type} elements")
+        if (extract or visualize) and self.workers == 1:
+            print(f"Writer: {self.writer.summary()}")
+        elif extract or visualize:
+            # Each worker writes through its own writer
+            print(f"Writer: {totals_summary((p['writer'] for p in partials), self.workers)}")
+        
+        return result
+    
+    def _process_pages(
+        self,
+        session: PDFRenderSession,
+        page_numbers: Optional[range],
+        extract: bool,
+        visualize: bool,
+        types_to_extract: List[str],
+        type_dirs: Dict[str, Path],
+        pdf_filename: str,
+        output_path: str,
+        keep_annotated: bool
+    ) -> Dict[str, Any]:
+        """Detect, crop and annotate a range of pages of an open session."""
+        result = {
+            "detections": [],
+            "saved_files": {elem_type: [] for elem_type in type_dirs},
+            "visualizations": [],
+            "annotated_images": []
+        }
+        
+        base, ext = os.path.splitext(output_path)
+        for page_num, page_image, page_detections in self._iter_detected_pages(session, page_numbers):
+            result["detections"].extend(page_detections)
             
-            for i, element in enumerate(page_elements):
-                bbox = element.get("coordinates", {}).get("bbox")
-                if not bbox:
-                    continue
-                
-                elem_type = element.get("type")
-                try:
+            if extract:
+                page_elements = [d for d in page_detections if d.get("type") in types_to_extract]
+                self._save_page_crops(
+                    session, page_image, page_num, page_elements, pdf_filename, type_dirs, result["saved_files"]
+                )
+            
+            if visualize:
+                scale = session.page_dpi(page_num) / self.dpi
+                annotated = self._annotate_page(page_image, page_detections, scale)
+                page_path = output_path if session.page_count == 1 else f"{base}_page{page_num}{ext}"
+                page_path = self.writer.write_image(page_path, annotated)
+                result["visualizations"].append(page_path)
+                if keep_annotated:
+                    result["annotated_images"].append(annotated)
+        
+        return result
+    
+    def _process_pages_parallel(
+        self, pdf_path: str, pdf_bytes: bytes, options: Dict[str, Any]
+    ) -> Iterator[Dict[str, Any]]:
+        """Shard the pages across worker processes, yielding partial results in page order."""
+        with self._open_render_session(pdf_path, pdf_bytes) as session:
+            page_count = session.page_count
+        if page_count == 0:
+            raise ValueError("No pages rendered from the PDF")
+        
+        # Workers re-read the file themselves when it is on disk
+        return map_page_ranges(
+            _process_page_range,
+            page_count,
+            self.workers,
+            initializer=_init_detector_worker,
+            initargs=(self._worker_config(),),
+            task_args=(pdf_path, b"" if pdf_path else pdf_bytes, options)
+        )
+    
+    def _worker_config(self) -> Dict[str, Any]:
+        """Constructor arguments for the single-process detector run in each worker."""
+        return {
+            "hi_res_model_name": self.hi_res_model_name,
+            "dpi": self.dpi,
+            "languages": self.languages,
+            "pdfminer_config": self.pdfminer_config,
+            "output_dir": str(self.output_dir),
+            "padding": self.padding,
+            "batch_size": self.batch_size,
+            "two_resolution": self.two_resolution,
+            "writer_options": self.writer.options
+        }
+    
+    def _save_page_crops(
+        self,
+        session: PDFRenderSession,
+        page_image: np.ndarray,
+        page_num: int,
+        page_elements: List[Dict[str, Any]],
+        pdf_filename: str,
+        type_dirs: Dict[str, Path],
+        saved_files: Dict[str, List[str]]
+    ) -> None:
+        """
+        Crop and save the selected elements of one page.
+        
+        In two-resolution mode each element is re-rendered at full DPI from the
+        PDF instead of being cut out of the (smaller) detection render.
+        """
+        for i, element in enumerate(page_elements):
+            bbox = element.get("coordinates", {}).get("bbox")
+            if not bbox:
+                continue
+            
+            elem_type = element.get("type")
+            try:
+                if self.two_resolution:
+                    cropped = session.region_image(page_num, bbox, padding=(self.padding,) * 4)
+                else:
                     # Crop using OpenCV
                     cropped = self.crop_element_cv2(page_image, bbox)
-                    
-                    # Save the cropped image
-                    filename = f"{pdf_filename}_page{page_num}_{elem_type.lower()}_{i+1}.png"
-                    save_path = type_dirs[elem_type] / filename
-                    
-                    cv2.imwrite(str(save_path), cropped)
-                    saved_files[elem_type].append(str(save_path))
-                    print(f"Saved {elem_type} element to {save_path}")
-                    
-                except Exception as e:
-                    print(f"Warning: Failed to crop element on page {page_num}: {str(e)}")
-                    continue
-        
-        # Print summary
-        for elem_type, files in saved_files.items():
-            print(f"Extracted {len(files)} {elem_type} elements")
-        
-        return saved_files
+                
+                # Save the cropped image
+                filename = f"{pdf_filename}_page{page_num}_{elem_type.lower()}_{i+1}.png"
+                save_path = self.writer.write_image(str(type_dirs[elem_type] / filename), cropped)
+                saved_files[elem_type].append(save_path)
+                print(f"Saved {elem_type} element to {save_path}")
+                
+            except Exception as e:
+                print(f"Warning: Failed to crop element on page {page_num}: {str(e)}")
+                continue
+    
+    def _annotate_page(
+        self, page_image: np.ndarray, page_detections: List[Dict[str, Any]], scale: float = 1.0
+    ) -> np.ndarray:
+        """Draw the detections of one page, scaled by ``scale``, on a copy of the page image."""
+        # Create a copy for drawing
+        annotated = page_image.copy()
+        
+        # Draw each detection
+        for detection in page_detections:
+            elem_type = detection.get("type", "Unknown")
+            bbox = detection.get("coordinates", {}).get("bbox")
+            
+            if not bbox:
+                continue
+            
+            # Get color for element type
+            color = self.color_map.get(elem_type, (128, 128, 128))
+            
+            # Draw rectangle
+            x1, y1, x2, y2 = (int(coord * scale) for coord in bbox)
+            cv2.rectangle(annotated, (x1, y1), (x2, y2), color, 2)
+            
+            # Add label
+            label = f"{elem_type}"
+            cv2.putText(
+                annotated,
+                label,
+                (x1, max(y1 - 10, 20)),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                0.5,
+                color,
+                2
+            )
+        
+        return annotated
+    
+    def extract_elements_cv2(self, file_or_path, types_to_extract: List[str] = None):
+        """
+        Extract and save elements using OpenCV for better quality.
+        
+        Args:
+            file_or_path: PDF file path or file-like object
+            types_to_extract: List of element types to extract
+        """
+        result = self.process_document(
+            file_or_path,
+            extract=True,
+            types_to_extract=types_to_extract
+        )
+        
+        if not any(result["saved_files"].values()):
+            print(f"No elements of types {list(result['saved_files'])} found")
+            return {}
+        
+        return result["saved_files"]
     
     def visualize_detections_cv2(self, file_or_path, output_path: str = "detections.png"):
         """
@@ -299,68 +537,54 @@ class PDFElementDetectorCV2:
             file_or_path: PDF file path or file-like object
             output_path: Path to save visualization
         """
-        detections = self.detect_elements(file_or_path)
-        pdf_path, pdf_bytes = self._verify_pdf(file_or_path)
-        page_images = self._pdf_to_cv2_images(pdf_path, pdf_bytes)
-        
-        if not page_images:
-            raise ValueError("No pages rendered from the PDF")
-        
-        # Group detections by page
-        detections_by_page = {}
-        for detection in detections:
-            page_num = detection.get("page_number", 1)
-            if page_num not in detections_by_page:
-                detections_by_page[page_num] = []
-            detections_by_page[page_num].append(detection)
-        
-        # Process each page
-        annotated_images = []
-        for page_num, page_image in enumerate(page_images, 1):
-            page_detections = detections_by_page.get(page_num, [])
-            
-            # Create a copy for drawing
-            annotated = page_image.copy()
-            
-            # Draw each detection
-            for detection in page_detections:
-                elem_type = detection.get("type", "Unknown")
-                bbox = detection.get("coordinates", {}).get("bbox")
-                
-                if not bbox:
-                    continue
-                
-                # Get color for element type
-                color = self.color_map.get(elem_type, (128, 128, 128))
-                
-                # Draw rectangle
-                x1, y1, x2, y2 = map(int, bbox)
-                cv2.rectangle(annotated, (x1, y1), (x2, y2), color, 2)
-                
-                # Add label
-                label = f"{elem_type}"
-                cv2.putText(
-                    annotated,
-                    label,
-                    (x1, max(y1 - 10, 20)),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    0.5,
-                    color,
-                    2
-                )
-            
-            annotated_images.append(annotated)
-        
-        # Save visualizations
-        if len(annotated_images) == 1:
-            cv2.imwrite(output_path, annotated_images[0])
-        else:
-            base, ext = os.path.splitext(output_path)
-            for i, img in enumerate(annotated_images):
-                page_path = f"{base}_page{i+1}{ext}"
-                cv2.imwrite(page_path, img)
-        
-        return annotated_images
+        result = self.process_document(
+            file_or_path,
+            extract=False,
+            visualize=True,
+            output_path=output_path,
+            keep_annotated=True
+        )
+        return result["annotated_images"]
+
+
+# Per-process detector used by the worker pool; each worker loads its own model session
+_worker_detector: Optional[PDFElementDetectorCV2] = None
+
+
+def _close_detector_worker():
+    """Drain and close the worker's writer, syncing it under ``fsync="close"``."""
+    if _worker_detector is not None:
+        _worker_detector.writer.close()
+
+
+def _init_detector_worker(config: Dict[str, Any]):
+    """Create the detector (and its layout model) once per worker process."""
+    global _worker_detector
+    config = dict(config)
+    writer_options = config.pop("writer_options", None)
+    if writer_options:
+        config["writer"] = AsyncArtifactWriter(**writer_options)
+    _worker_detector = PDFElementDetectorCV2(**config)
+    _worker_detector._load_detection_model()
+    # Runs at worker exit (atexit does not), before the trace export
+    multiprocessing.util.Finalize(None, _close_detector_worker, exitpriority=10)
+
+
+def _process_page_range(
+    page_numbers: range, pdf_path: str, pdf_bytes: bytes, options: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Detect, crop and annotate one shard of pages inside a worker process.
+
+    The result carries the shard's writer activity in ``writer``.
+    """
+    before = _worker_detector.writer.stats
+    if pdf_path:
+        pdf_path, pdf_bytes = _worker_detector._verify_pdf(pdf_path)
+    with _worker_detector._open_render_session(pdf_path, pdf_bytes) as session:
+        result = _worker_detector._process_pages(session, page_numbers, **options)
+    _worker_detector.writer.flush()
+    result["writer"] = stats_delta(before, _worker_detector.writer.stats)
+    return result
 
 
 def main():
@@ -381,6 +605,18 @@ def main():
                       help="Padding around extracted elements (default: 5)")
     parser.add_argument("--visualize", "-v", action="store_true",
                       help="Create visualization of detected elements")
+    parser.add_argument("--batch-size", "-b", type=int, default=8,
+                      help="Pages per layout-model run (default: 8)")
+    parser.add_argument("--workers", "-w", type=int, default=1,
+                      help="Processes used to render and detect pages (default: 1)")
+    parser.add_argument("--two-resolution", action="store_true",
+                      help="Detect on small page renders and re-render crops at --dpi")
+    parser.add_argument("--png-compression", type=int, default=3,
+                      help="PNG compression level 0-9 for saved images (default: 3)")
+    parser.add_argument("--webp", action="store_true",
+                      help="Save images as lossless WebP instead of PNG")
+    parser.add_argument("--fsync", choices=["none", "file", "close"], default="none",
+                      help="When written files are synced to disk (default: none)")
     
     args = parser.parse_args()
     
@@ -395,27 +631,31 @@ def main():
         detector = PDFElementDetectorCV2(
             dpi=args.dpi,
             output_dir=args.output_dir,
-            padding=args.padding
+            padding=args.padding,
+            batch_size=args.batch_size,
+            workers=args.workers,
+            two_resolution=args.two_resolution,
+            writer=AsyncArtifactWriter(
+                png_compression=args.png_compression,
+                webp_lossless=args.webp,
+                fsync=args.fsync
+            )
         )
         
         # Process the PDF
         print(f"Processing {pdf_path}...")
         
-        # Extract elements if requested
-        if args.extract:
-            print("\nExtracting elements...")
-            detector.extract_elements_cv2(
-                str(pdf_path),
-                types_to_extract=args.filter_types
-            )
-        
-        # Create visualization if requested
-        if args.visualize:
-            print("\nCreating visualization...")
-            detector.visualize_detections_cv2(
+        # Detect, extract and visualize in one pass over the pages
+        if args.extract or args.visualize:
+            print("\nProcessing elements...")
+            detector.process_document(
                 str(pdf_path),
+                extract=args.extract,
+                visualize=args.visualize,
+                types_to_extract=args.filter_types,
                 output_path=str(Path(args.output_dir) / "detections.png")
             )
+        detector.writer.close()
         
     except Exception as e:
         print(f"Error: {str(e)}")
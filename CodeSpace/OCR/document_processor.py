@@ -1,4 +1,6 @@
 import os
+import sys
+import bisect
 import fitz
 import pdfplumber
 import pandas as pd
@@ -12,6 +14,42 @@ import torch
 import torchvision.transforms as T
 from torchvision.transforms.functional import InterpolationMode
 
+# The shared Functions package lives under CodeSpace/NoteBooks/
+_NOTEBOOKS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "NoteBooks")
+if _NOTEBOOKS_DIR not in sys.path:
+    sys.path.insert(0, _NOTEBOOKS_DIR)
+
+from Functions.image_extractor import EmbeddedImageExtractor
+
+def _chars_outside(chars, bboxes):
+    """Characters whose (x0, top) lies outside every bbox, sorted by (top, x0).
+
+    Sweeps the characters in reading order and bisects the regions sorted by
+    top, so each character is only tested against the regions spanning its
+    line rather than against every table on the page.
+    """
+    chars = sorted(chars, key=lambda c: (float(c["top"]), float(c["x0"])))
+    if not bboxes:
+        return chars
+
+    regions = sorted(bboxes, key=lambda b: b[1])
+    tops = [b[1] for b in regions]
+    kept = []
+    active = []
+    entered = 0
+    for char in chars:
+        top = float(char["top"])
+        x0 = float(char["x0"])
+        reached = bisect.bisect_right(tops, top)
+        if reached > entered:
+            active.extend(regions[entered:reached])
+            entered = reached
+        if active:
+            active = [b for b in active if b[3] >= top]
+        if not any(b[0] <= x0 <= b[2] for b in active):
+            kept.append(char)
+    return kept
+
 class DocumentProcessor:
     def __init__(self, device="cpu", input_size=448):
         # Set Tesseract path
@@ -104,8 +142,8 @@ class DocumentProcessor:
         except Exception as e:
             raise RuntimeError(f"Handwritten processing failed: {str(e)}")
 
-    def process_pdf(self, pdf_path):
-        """Process PDF document"""
+    def process_pdf(self, pdf_path, debug_tables=False):
+        """Process PDF document; ``debug_tables`` also saves a render of the detected table edges per page"""
         try:
             temp_dir = tempfile.mkdtemp()
             images_dir = os.path.join(temp_dir, "images")
@@ -117,8 +155,9 @@ class DocumentProcessor:
 
             # Extract content
             extracted_images = self._extract_images(pdf_path, images_dir)
-            extracted_tables = self._extract_tables(pdf_path, tables_dir)
-            extracted_texts = self._extract_text(pdf_path, texts_dir)
+            extracted_tables, extracted_texts = self._extract_tables_and_text(
+                pdf_path, tables_dir, texts_dir, debug_tables=debug_tables
+            )
 
             # Create zip file
             zip_path = os.path.join(temp_dir, "extracted_content.zip")
@@ -134,86 +173,57 @@ class DocumentProcessor:
             raise RuntimeError(f"Error processing PDF: {str(e)}")
 
     def _extract_images(self, pdf_path, output_dir):
-        """Extract images from PDF"""
-        extracted_images = []
-        pdf_document = fitz.open(pdf_path)
-
-        for page_number in range(pdf_document.page_count):
-            page = pdf_document[page_number]
-            images = page.get_images(full=True)
+        """Extract each distinct image of the PDF once, plus a page -> image index"""
+        extractor = EmbeddedImageExtractor(output_dir)
 
-            for img_index, img in enumerate(images):
-                xref = img[0]
-                base_image = pdf_document.extract_image(xref)
-                image_bytes = base_image["image"]
+        with fitz.open(pdf_path) as pdf_document:
+            extractor.start_document(Path(pdf_path).stem)
+            for page_number in range(pdf_document.page_count):
+                extractor.extract_page(pdf_document, pdf_document[page_number], page_number)
+            extracted_images = extractor.document_images()
+            extractor.finish_document()
 
-                image_path = os.path.join(
-                    output_dir,
-                    f"page_{page_number + 1}_image_{img_index + 1}.png"
-                )
-                
-                with open(image_path, "wb") as img_file:
-                    img_file.write(image_bytes)
-                extracted_images.append(image_path)
-
-        pdf_document.close()
         return extracted_images
 
-    def _extract_tables(self, pdf_path, output_dir):
-        """Extract tables from PDF"""
+    def _extract_tables_and_text(self, pdf_path, tables_dir, texts_dir, debug_tables=False):
+        """Extract tables and the text outside them in a single pass over the pages"""
         extracted_tables = []
+        extracted_texts = []
 
         with pdfplumber.open(pdf_path) as pdf:
-            for i, page in enumerate(pdf.pages, start=1):
-                # Debug table detection
-                debug_image = page.to_image()
-                debug_image.draw_rects(page.debug_tablefinder().edges)
-                debug_image_path = os.path.join(output_dir, f"page_{i}_tables_debug.png")
-                debug_image.save(debug_image_path)
+            for page_number, page in enumerate(pdf.pages, start=1):
+                # Find tables once; the finder also holds the edges for the debug render
+                finder = page.debug_tablefinder()
+                tables = finder.tables
 
-                # Extract tables
-                tables = page.extract_tables()
-                if tables:
-                    for j, table in enumerate(tables, start=1):
-                        df = pd.DataFrame(table[1:], columns=table[0])
-                        output_csv = os.path.join(output_dir, f"page_{i}_table_{j}.csv")
-                        df.to_csv(output_csv, index=False)
-                        extracted_tables.append(output_csv)
-
-        return extracted_tables
-
-    def _extract_text(self, pdf_path, output_dir):
-        """Extract text with positioning from PDF"""
-        extracted_texts = []
-        
-        with pdfplumber.open(pdf_path) as pdf:
-            for page_number, page in enumerate(pdf.pages):
-                # Get table regions to exclude
-                tables = page.find_tables()
-                table_bboxes = [table.bbox for table in tables]
+                if debug_tables:
+                    debug_image = page.to_image()
+                    debug_image.draw_rects(finder.edges)
+                    debug_image.save(os.path.join(tables_dir, f"page_{page_number}_tables_debug.png"))
 
-                # Extract characters excluding table regions
-                characters = page.chars
-                non_table_chars = [
-                    char for char in characters
-                    if not any(
-                        bbox[0] <= float(char["x0"]) <= bbox[2]
-                        and bbox[1] <= float(char["top"]) <= bbox[3]
-                        for bbox in table_bboxes
-                    )
-                ]
+                # Extract tables
+                for j, table in enumerate(tables, start=1):
+                    rows = table.extract()
+                    if not rows:
+                        continue
+                    df = pd.DataFrame(rows[1:], columns=rows[0])
+                    output_csv = os.path.join(tables_dir, f"page_{page_number}_table_{j}.csv")
+                    df.to_csv(output_csv, index=False)
+                    extracted_tables.append(output_csv)
 
-                # Sort and reconstruct text
-                non_table_chars.sort(key=lambda c: (float(c["top"]), float(c["x0"])))
+                # Reconstruct the text from the characters outside the table regions
+                non_table_chars = _chars_outside(page.chars, [table.bbox for table in tables])
                 reconstructed_text = self._reconstruct_text(non_table_chars)
 
-                # Save text
-                text_file_path = os.path.join(output_dir, f"page_{page_number + 1}.txt")
+                text_file_path = os.path.join(texts_dir, f"page_{page_number}.txt")
                 with open(text_file_path, "w", encoding="utf-8") as text_file:
                     text_file.write(reconstructed_text)
                 extracted_texts.append(text_file_path)
 
-        return extracted_texts
+                # Drop the page's cached layout objects before the next page
+                page.flush_cache()
+
+        return extracted_tables, extracted_texts
 
     def _reconstruct_text(self, chars, new_line_threshold=5, space_gap_threshold=1):
         """Reconstruct text from characters with proper spacing"""
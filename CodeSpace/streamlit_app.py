@@ -2,24 +2,41 @@ import streamlit as st
 import os
 import fitz
 import cv2
-from unstructured.partition.image import partition_image
 import numpy as np
-import tensorflow as tf
-from paddleocr import PaddleOCR
 import pandas as pd
 import tempfile
 import logging
 import warnings
+import sys
 from pathlib import Path
 
+# The Functions package lives under NoteBooks/
+_NOTEBOOKS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "NoteBooks")
+if _NOTEBOOKS_DIR not in sys.path:
+    sys.path.insert(0, _NOTEBOOKS_DIR)
+
+from Functions.page_render import render_clip
+from Functions.table_structure import table_from_ocr
+from Functions.text_layer import extract_text_layer, has_usable_text_layer
+
 # Suppress warnings and logging
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
 logging.getLogger("ppocr").setLevel(logging.ERROR)
 warnings.filterwarnings('ignore')
 
 class PDFProcessor:
-    def __init__(self):
-        self.ocr = PaddleOCR(lang='en')
+    def __init__(self, use_text_layer=True):
+        # Born-digital pages are read from their text layer; OCR is loaded on first need
+        self.use_text_layer = use_text_layer
+        self._ocr = None
+
+    @property
+    def ocr(self):
+        if self._ocr is None:
+            # Imported here so the app starts without loading PaddleOCR
+            from paddleocr import PaddleOCR
+            self._ocr = PaddleOCR(lang='en')
+        return self._ocr
 
     def process_pdf(self, pdf_file, progress_bar=None):
         """Process PDF and extract content"""
@@ -61,6 +78,10 @@ class PDFProcessor:
 
     def _process_page(self, page, page_name, output_dirs, results):
         """Process a single PDF page"""
+        if self.use_text_layer and has_usable_text_layer(page)[0]:
+            self._process_text_layer_page(page, page_name, output_dirs, results)
+            return
+
         # Convert page to image
         pix = page.get_pixmap(dpi=300, colorspace=fitz.csRGB)
         img_array = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, 3)
@@ -71,6 +92,7 @@ class PDFProcessor:
             cv2.imwrite(tmp_file.name, image_cv)
             
             # Extract elements
+            from unstructured.partition.image import partition_image
             elements = partition_image(filename=tmp_file.name, infer_table_structure=True, strategy='hi_res')
             
             # Process elements
@@ -83,6 +105,25 @@ class PDFProcessor:
 
             os.unlink(tmp_file.name)
 
+    def _process_text_layer_page(self, page, page_name, output_dirs, results):
+        """Extract text and tables from the page's embedded glyphs"""
+        extracted = extract_text_layer(page)
+        for table in extracted["tables"]:
+            # Render only the table region for display
+            bbox = [coordinate * 300 / 72 for coordinate in table["bbox"]]
+            table_filename = f"{page_name}_Table_{len(results['tables']) + 1}.png"
+            table_path = os.path.join(output_dirs['tables'], table_filename)
+            cv2.imwrite(table_path, render_clip(page, bbox, 300))
+            results['tables'].append(table_path)
+
+            csv_filename = f"{page_name}_Table_{len(results['csvs']) + 1}.csv"
+            csv_path = os.path.join(output_dirs['tables_csv'], csv_filename)
+            table["dataframe"].to_csv(csv_path, index=False, header=False)
+            results['csvs'].append(csv_path)
+
+        for text_content in extracted["texts"]:
+            self._process_text({"text": text_content}, page_name, output_dirs, results)
+
     def _process_table(self, element_dict, image_cv, page_name, output_dirs, results):
         """Process and save table"""
         try:
@@ -114,15 +155,11 @@ class PDFProcessor:
         if not output:
             return
 
-        # Extract text and positions
-        boxes = [line[0] for line in output]
-        texts = [line[1][0] for line in output]
-        
-        # Create DataFrame and save CSV
-        df = pd.DataFrame({'text': texts})
+        # Rebuild the table grid from the OCR boxes and save CSV
+        df = table_from_ocr(output, table_image.shape[:2])
         csv_filename = f"{page_name}_Table_{len(results['csvs']) + 1}.csv"
         csv_path = os.path.join(output_dirs['tables_csv'], csv_filename)
-        df.to_csv(csv_path, index=False)
+        df.to_csv(csv_path, index=False, header=False)
         results['csvs'].append(csv_path)
 
     def _process_text(self, element_dict, page_name, output_dirs, results):
@@ -0,0 +1,126 @@
+"""
+Benchmark pix2text-mfr decoding on CPU with and without the KV cache.
+
+Short and long formulas are timed separately because the cost of decoding
+without the cache grows with the square of the output length. Use folders of
+real formula crops when available; otherwise formula-like images are rendered.
+
+    python benchmarks/formula_decoding.py --short crops/short --long crops/long
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, List
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+sys.path.insert(0, str(REPO_ROOT / "CodeSpace" / "NoteBooks"))
+
+from PIL import Image, ImageDraw, ImageFont
+
+from formula import FormulaProcessor
+
+SHORT_FORMULAS = ["x^2+y^2=z^2", "e^{i\\pi}+1=0", "a_n=a_{n-1}+d"]
+LONG_FORMULAS = [
+    "f(x)=\\sum_{n=0}^{\\infty}\\frac{f^{(n)}(a)}{n!}(x-a)^n=f(a)+f'(a)(x-a)+\\frac{f''(a)}{2}(x-a)^2",
+    "\\int_0^1\\int_0^1\\frac{dx\\,dy}{1-xy}=\\sum_{k=1}^{\\infty}\\frac{1}{k^2}=\\frac{\\pi^2}{6}\\approx1.6449",
+    "L(\\theta)=-\\frac{1}{N}\\sum_{i=1}^{N}\\left[y_i\\log\\sigma(w^Tx_i+b)+(1-y_i)\\log(1-\\sigma(w^Tx_i+b))\\right]",
+]
+
+
+def render_formula_images(formulas: List[str], folder: str) -> List[str]:
+    """Render formula strings as black-on-white images."""
+    font = ImageFont.load_default()
+    paths = []
+    for i, formula in enumerate(formulas):
+        width = 12 + 7 * len(formula)
+        image = Image.new("RGB", (width, 32), "white")
+        ImageDraw.Draw(image).text((6, 10), formula, fill="black", font=font)
+        path = os.path.join(folder, f"formula_{i}.png")
+        image.save(path)
+        paths.append(path)
+    return paths
+
+
+def list_images(folder: str) -> List[str]:
+    return sorted(
+        str(path) for path in Path(folder).iterdir()
+        if path.suffix.lower() in (".png", ".jpg", ".jpeg")
+    )
+
+
+def time_decoding(processor: FormulaProcessor, image_paths: List[str], repeats: int) -> Dict[str, float]:
+    """Decode every image ``repeats`` times and aggregate tokens and inference time."""
+    tokens, inference_time, runs = 0, 0.0, 0
+    for _ in range(repeats):
+        for image_path in image_paths:
+            latex_text, timing = processor.process_single_formula(image_path)
+            if latex_text is None:
+                continue
+            tokens += timing['tokens']
+            inference_time += timing['inference']
+            runs += 1
+    return {
+        'images': runs,
+        'tokens': tokens,
+        'inference_time': inference_time,
+        'avg_latency': inference_time / runs if runs else 0.0,
+        'avg_tokens': tokens / runs if runs else 0.0,
+        'tokens_per_second': tokens / inference_time if inference_time > 0 else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark formula decoding with and without the KV cache")
+    parser.add_argument("--short", help="Folder of short formula crops")
+    parser.add_argument("--long", help="Folder of long formula crops")
+    parser.add_argument("--repeats", type=int, default=3, help="Times each image is decoded per mode")
+    parser.add_argument("--max-new-tokens", type=int, default=256, help="Decoder step budget per image")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        image_sets = {}
+        for name, folder, formulas in (("short", args.short, SHORT_FORMULAS), ("long", args.long, LONG_FORMULAS)):
+            if folder:
+                image_sets[name] = list_images(folder)
+            else:
+                os.makedirs(os.path.join(tmp_dir, name))
+                image_sets[name] = render_formula_images(formulas, os.path.join(tmp_dir, name))
+
+        results = {}
+        for use_cache in (False, True):
+            processor = FormulaProcessor(use_cache=use_cache, max_new_tokens=args.max_new_tokens)
+            mode = "kv_cache" if processor.use_cache else "no_cache"
+            if mode in results:
+                print("KV cache is unavailable for this model, skipping the cached run")
+                break
+
+            # Warm up the ONNX sessions before timing
+            processor.process_single_formula(image_sets["short"][0])
+            results[mode] = {name: time_decoding(processor, paths, args.repeats)
+                             for name, paths in image_sets.items()}
+
+    print(f"\n{'mode':<10} {'set':<6} {'images':>7} {'avg tokens':>11} {'avg latency':>12} {'tokens/s':>10}")
+    for mode, sets in results.items():
+        for name, stats in sets.items():
+            print(f"{mode:<10} {name:<6} {stats['images']:>7} {stats['avg_tokens']:>11.1f} "
+                  f"{stats['avg_latency']:>11.3f}s {stats['tokens_per_second']:>10.1f}")
+
+    if "kv_cache" in results and "no_cache" in results:
+        for name in image_sets:
+            baseline = results["no_cache"][name]['tokens_per_second']
+            if baseline > 0:
+                print(f"KV cache speedup ({name}): {results['kv_cache'][name]['tokens_per_second'] / baseline:.2f}x")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Benchmark the registered YOLOX layout models and write the profile used by
+``get_model("auto")``.
+
+Every model in ``MODEL_TYPES`` runs over the same pages in its own process,
+so peak RSS is measured per model. For each model the benchmark records
+pages/sec, p50/p95 latency per page, peak RSS and its agreement with the
+reference model: detections of the same class with IoU >= --iou count as
+matches, and precision, recall and F1 are computed from those matches.
+Pages come from the given PDFs, or from the bundled paper plus synthetic pages.
+
+    python benchmarks/layout_models.py --pdf paper.pdf --synthetic 8 --profile profile.json
+"""
+import argparse
+import multiprocessing
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+NOTEBOOKS = REPO_ROOT / "CodeSpace" / "NoteBooks"
+sys.path.insert(0, str(NOTEBOOKS))
+
+import numpy as np
+
+from Functions.model_profile import agreement, default_profile_path, select_model, write_profile
+
+BUNDLED_PDF = NOTEBOOKS / "2501.00663v1.pdf"
+
+
+def make_synthetic_pdf(path: str, pages: int) -> str:
+    """Write a PDF with titles, text columns, a ruled table and formula lines on every page."""
+    import fitz
+
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 80), f"Section {number + 1}: Synthetic layout", fontsize=18)
+        body = "Layout detection benchmark text. " * 12
+        page.insert_textbox(fitz.Rect(72, 100, 290, 330), body, fontsize=9)
+        page.insert_textbox(fitz.Rect(310, 100, 540, 330), body, fontsize=9)
+
+        # Ruled 4 x 5 table
+        top, left, cell_w, cell_h = 360, 90, 85, 22
+        for row in range(5):
+            for col in range(5):
+                rect = fitz.Rect(left + col * cell_w, top + row * cell_h,
+                                 left + (col + 1) * cell_w, top + (row + 1) * cell_h)
+                page.draw_rect(rect, width=0.5)
+                page.insert_text((rect.x0 + 4, rect.y1 - 7), f"{row * 5 + col:.2f}", fontsize=8)
+
+        page.insert_text((200, 520), "E = m c^2 + sum_i alpha_i x_i / (1 + beta)", fontsize=12)
+        page.insert_textbox(fitz.Rect(72, 560, 540, 740), body * 2, fontsize=9)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def render_pages(pdf_paths: List[str], dpi: int, max_pages: Optional[int]) -> List[np.ndarray]:
+    """Render the pages of every PDF as RGB arrays."""
+    import fitz
+
+    pages = []
+    for pdf_path in pdf_paths:
+        with fitz.open(pdf_path) as doc:
+            for page in doc:
+                pixmap = page.get_pixmap(dpi=dpi, colorspace=fitz.csRGB)
+                pages.append(np.frombuffer(pixmap.samples, dtype=np.uint8)
+                             .reshape(pixmap.height, pixmap.width, 3).copy())
+                if max_pages and len(pages) >= max_pages:
+                    return pages
+    return pages
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process, where the platform reports it."""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / 1e6
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+def run_model(name: str, pdf_paths: List[str], dpi: int, max_pages: Optional[int], warmup: int) -> Dict[str, Any]:
+    """Load one model in this (fresh) process and time it page by page."""
+    from Functions.base import get_model
+
+    pages = render_pages(pdf_paths, dpi, max_pages)
+    start = time.perf_counter()
+    model = get_model(name)
+    load_seconds = time.perf_counter() - start
+    for page in pages[:warmup]:
+        model.predict(page)
+
+    latencies, detections = [], []
+    for page in pages:
+        start = time.perf_counter()
+        layout = model.predict(page)
+        latencies.append(time.perf_counter() - start)
+        detections.append((np.asarray(layout.element_coords).reshape(-1, 4).tolist(),
+                           np.asarray(layout.element_class_ids).tolist()))
+
+    return {
+        "pages": len(pages),
+        "load_seconds": load_seconds,
+        "pages_per_second": len(pages) / sum(latencies) if latencies else 0.0,
+        "p50_ms": 1000 * float(np.percentile(latencies, 50)) if latencies else 0.0,
+        "p95_ms": 1000 * float(np.percentile(latencies, 95)) if latencies else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        "detections": detections,
+    }
+
+
+def main():
+    from Functions.Inferences.yolox import MODEL_TYPES
+
+    parser = argparse.ArgumentParser(description="Benchmark layout models and write the get_model('auto') profile")
+    parser.add_argument("--pdf", action="append", default=[], help="PDF to benchmark on (repeatable)")
+    parser.add_argument("--synthetic", type=int, default=4, help="Synthetic pages added to the page set")
+    parser.add_argument("--max-pages", type=int, help="Use at most this many pages")
+    parser.add_argument("--dpi", type=int, default=200, help="Render DPI of the pages")
+    parser.add_argument("--models", nargs="+", default=list(MODEL_TYPES), help="Models to benchmark")
+    parser.add_argument("--reference", default="yolox", help="Model whose detections count as ground truth")
+    parser.add_argument("--iou", type=float, default=0.5, help="IoU needed to match two detections")
+    parser.add_argument("--warmup", type=int, default=2, help="Untimed pages run before timing")
+    parser.add_argument("--min-f1", type=float, help="Accuracy floor used to report the auto selection")
+    parser.add_argument("--profile", default=default_profile_path(), help="Where to write the profile")
+    args = parser.parse_args()
+
+    models = list(dict.fromkeys([args.reference] + args.models))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdf_paths = list(args.pdf) or [str(BUNDLED_PDF)]
+        if args.synthetic:
+            pdf_paths.append(make_synthetic_pdf(str(Path(tmp_dir) / "synthetic.pdf"), args.synthetic))
+
+        # A fresh process per model keeps sessions and peak RSS apart
+        context = multiprocessing.get_context("spawn")
+        results = {}
+        for name in models:
+            print(f"Benchmarking {name}...")
+            with context.Pool(1) as pool:
+                results[name] = pool.apply(run_model, (name, pdf_paths, args.dpi, args.max_pages, args.warmup))
+
+    reference_pages = [(np.array(boxes), np.array(classes)) for boxes, classes in results[args.reference]["detections"]]
+    profile_models = {}
+    for name, stats in results.items():
+        candidate_pages = [(np.array(boxes), np.array(classes)) for boxes, classes in stats.pop("detections")]
+        profile_models[name] = {**stats, **agreement(reference_pages, candidate_pages, args.iou)}
+
+    profile = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "reference": args.reference,
+        "iou_threshold": args.iou,
+        "dpi": args.dpi,
+        "pdfs": [Path(path).name for path in pdf_paths],
+        "models": profile_models,
+    }
+
+    print(f"\n{'model':<16} {'pages/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'RSS MB':>8} "
+          f"{'precision':>10} {'recall':>8} {'F1':>6}")
+    for name, stats in profile_models.items():
+        rss = f"{stats['peak_rss_mb']:.0f}" if stats["peak_rss_mb"] is not None else "n/a"
+        print(f"{name:<16} {stats['pages_per_second']:>8.2f} {stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} "
+              f"{rss:>8} {stats['precision']:>10.3f} {stats['recall']:>8.3f} {stats['f1']:>6.3f}")
+
+    path = write_profile(profile, args.profile)
+    print(f"Profile written to {path}")
+    print(f"get_model('auto') would pick: {select_model(profile, args.min_f1)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,515 @@
+"""
+End-to-end benchmark of the document pipeline on synthetic PDFs.
+
+A deterministic corpus is generated offline: born-digital and scanned
+documents with a configurable number of pages, tables and formulas per page.
+Each stage runs in its own process over every document:
+
+    render      rasterize every page (page_render.render_page)
+    text_layer  route pages and read born-digital ones from the text layer
+    cropper     PDFElementCropper.iter_pages (render, layout, crop, write)
+    detector    PDFElementDetectorCV2.process_document
+    table_ocr   process_table_with_ocr on the table regions
+    formula     process_formula_with_ocr on the formula regions
+    pipeline    the partition.py flow: cropper plus table OCR and formulas
+
+For every document and stage the benchmark records pages/sec, elements/sec,
+peak RSS, page latency percentiles and the p50/p95 of every traced stage
+(see Functions.tracing). Models whose weights are not available are stubbed:
+the layout stub returns the known element boxes of the synthetic pages, the
+OCR stub boxes the text blobs of a table image and the formula stub returns a
+fixed LaTeX string, so the numbers measure the pipeline around the models.
+Stages whose scripts cannot be imported (crop_elements.py and partition.py
+need Functions.pdf_partitioner) are reported as skipped.
+
+    python benchmarks/pipeline.py --output baseline.json
+    python benchmarks/pipeline.py --compare baseline.json --output current.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+NOTEBOOKS = REPO_ROOT / "CodeSpace" / "NoteBooks"
+sys.path.insert(0, str(REPO_ROOT))
+sys.path.insert(0, str(NOTEBOOKS))
+
+import numpy as np
+
+from layout_models import peak_rss_mb
+
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792
+MARGIN_X, TOP, BOTTOM = 72, 50, 742
+GAP = 10
+HEIGHTS = {"Title": 28, "Text": 48, "Table": 110, "Formula": 26}
+# YOLOX label ids, so stubbed and real layout results look the same downstream
+CLASS_IDS = {"Formula": 2, "Table": 8, "Text": 9, "Title": 10}
+
+CORPUS = [
+    {"name": "digital_text", "pages": 8, "tables": 0, "formulas": 0, "scanned": False},
+    {"name": "digital_tables", "pages": 8, "tables": 2, "formulas": 1, "scanned": False},
+    {"name": "digital_formulas", "pages": 8, "tables": 0, "formulas": 3, "scanned": False},
+    {"name": "scanned_mixed", "pages": 8, "tables": 1, "formulas": 2, "scanned": True},
+]
+STAGES = ["render", "text_layer", "cropper", "detector", "table_ocr", "formula", "pipeline"]
+# Top-level scripts a stage needs. They import Functions.pdf_partitioner, so a
+# stage whose modules cannot be imported is reported as skipped instead of failing
+STAGE_MODULES = {
+    "cropper": ("crop_elements",),
+    "table_ocr": ("partition",),
+    "formula": ("partition",),
+    "pipeline": ("partition", "crop_elements"),
+}
+
+WORDS = ("layout detection table formula page document model render crop text benchmark "
+         "synthetic region column value result").split()
+FORMULAS = [
+    "E = m c^2 + sum_i alpha_i x_i",
+    "f(x) = integral_0^1 g(t) dt / (1 + beta)",
+    "L(theta) = -1/N sum_i log p(y_i | x_i)",
+    "a_n = a_(n-1) + d,  n >= 1",
+]
+
+
+def page_layout(tables: int, formulas: int) -> List[Tuple[str, Tuple[float, float, float, float]]]:
+    """Element types and rectangles (in points) shared by every page of a document."""
+    sequence = ["Title", "Text"]
+    for index in range(max(tables, formulas)):
+        if index < tables:
+            sequence.append("Table")
+        if index < formulas:
+            sequence.append("Formula")
+        sequence.append("Text")
+
+    layout = []
+    y = TOP
+    for element_type in sequence:
+        height = HEIGHTS[element_type]
+        if y + height > BOTTOM:
+            raise ValueError(f"{tables} tables and {formulas} formulas do not fit on one page")
+        x0, x1 = (160, 452) if element_type == "Formula" else (MARGIN_X, PAGE_WIDTH - MARGIN_X)
+        layout.append((element_type, (x0, y, x1, y + height)))
+        y += height + GAP
+    return layout
+
+
+def make_corpus_pdf(spec: Dict[str, Any], path: str, seed: int, scan_dpi: int = 150) -> str:
+    """Write the synthetic PDF of one corpus entry; the same seed gives the same file content."""
+    import fitz
+
+    rng = np.random.default_rng([seed, spec["pages"], spec["tables"], spec["formulas"], int(spec["scanned"])])
+    layout = page_layout(spec["tables"], spec["formulas"])
+    doc = fitz.open()
+    for number in range(spec["pages"]):
+        page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        for element_type, rect in layout:
+            rect = fitz.Rect(rect)
+            if element_type == "Title":
+                page.insert_text((rect.x0, rect.y1 - 6), f"{spec['name']} page {number + 1}", fontsize=18)
+            elif element_type == "Text":
+                words = " ".join(rng.choice(WORDS, size=60))
+                page.insert_textbox(rect, words.capitalize() + ".", fontsize=9)
+            elif element_type == "Formula":
+                page.insert_text((rect.x0 + 4, rect.y1 - 8), FORMULAS[rng.integers(len(FORMULAS))], fontsize=12)
+            else:
+                rows, cols = 5, 4
+                cell_w, cell_h = rect.width / cols, rect.height / rows
+                for row in range(rows):
+                    for col in range(cols):
+                        cell = fitz.Rect(rect.x0 + col * cell_w, rect.y0 + row * cell_h,
+                                         rect.x0 + (col + 1) * cell_w, rect.y0 + (row + 1) * cell_h)
+                        page.draw_rect(cell, width=0.5)
+                        value = "Header" if row == 0 else f"{rng.uniform(0, 1000):.2f}"
+                        page.insert_text((cell.x0 + 4, cell.y1 - 7), value, fontsize=8)
+
+    if spec["scanned"]:
+        # Replace every page by a noisy grayscale scan of itself, without a text layer
+        scanned = fitz.open()
+        for page in doc:
+            pixmap = page.get_pixmap(dpi=scan_dpi, colorspace=fitz.csGRAY)
+            pixels = np.frombuffer(pixmap.samples, dtype=np.uint8).reshape(pixmap.height, pixmap.width)
+            noise = rng.normal(0, 8, pixels.shape)
+            noisy = np.clip(pixels.astype(np.float32) + noise, 0, 255).astype(np.uint8)
+            image = fitz.Pixmap(fitz.csGRAY, pixmap.width, pixmap.height, noisy.tobytes(), False)
+            scan_page = scanned.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+            scan_page.insert_image(scan_page.rect, pixmap=image)
+        doc.close()
+        doc = scanned
+
+    # No creation dates or random file ids, so reruns write identical files
+    doc.set_metadata({"title": spec["name"]})
+    doc.save(path, garbage=3, deflate=True, no_new_id=True)
+    doc.close()
+    return path
+
+
+class StubLayoutModel:
+    """Layout model returning the known element boxes of the synthetic pages."""
+
+    def __init__(self, layout: List[Tuple[str, Tuple[float, float, float, float]]]):
+        self.types = [element_type for element_type, _ in layout]
+        self.boxes = np.array([rect for _, rect in layout], dtype=np.float64)
+        self.boxes /= [PAGE_WIDTH, PAGE_HEIGHT, PAGE_WIDTH, PAGE_HEIGHT]
+
+    def predict(self, image):
+        from Functions import tracing
+        from Functions.Inferences.layoutelement import LayoutElements
+
+        height, width = np.asarray(image).shape[:2]
+        with tracing.span(tracing.LAYOUT, engine="stub"):
+            return LayoutElements(
+                element_coords=self.boxes * [width, height, width, height],
+                element_probs=np.full(len(self.types), 0.9),
+                element_class_ids=np.array([CLASS_IDS[t] for t in self.types]),
+                element_class_id_map={class_id: name for name, class_id in CLASS_IDS.items()},
+            )
+
+    def predict_batch(self, images, batch_size: int = 8):
+        return [self.predict(image) for image in images]
+
+
+class StubTableOCR:
+    """PaddleOCR stand-in boxing the text blobs of a table image."""
+
+    def ocr(self, image):
+        import cv2
+
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+        # Drop the ruling lines, then merge the glyphs of a cell into one blob
+        lines = cv2.morphologyEx(binary, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (25, 1)))
+        lines |= cv2.morphologyEx(binary, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (1, 25)))
+        text = cv2.dilate(binary & ~lines, cv2.getStructuringElement(cv2.MORPH_RECT, (9, 3)))
+        contours, _ = cv2.findContours(text, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        lines_out = []
+        for contour in contours:
+            x, y, w, h = cv2.boundingRect(contour)
+            if w * h < 20:
+                continue
+            box = [[x, y], [x + w, y], [x + w, y + h], [x, y + h]]
+            lines_out.append([box, (f"{w}x{h}", 0.99)])
+        return [lines_out]
+
+
+class StubFormulaProcessor:
+    """FormulaProcessor stand-in returning a fixed LaTeX string."""
+
+    def process_single_formula(self, image_or_path):
+        from Functions import tracing
+
+        with tracing.span(tracing.FORMULA_DECODE, engine="stub"):
+            return "x^2 + y^2 = z^2", {"tokens": 9}
+
+
+def install_models(layout_model: str, layout, real_ocr: bool, real_formula: bool) -> None:
+    """Register stubs for the models that are not benchmarked for real.
+
+    Call after importing the stage's modules: partition registers the real
+    engines when imported.
+    """
+    from Functions import base
+    from Functions.engines import register_engine
+
+    if layout_model == "stub":
+        base.models["yolox"] = StubLayoutModel(layout)
+    if not real_ocr:
+        register_engine("paddleocr", StubTableOCR)
+    if not real_formula:
+        register_engine("formula", StubFormulaProcessor)
+
+
+def region_crops(pdf_path: str, layout, element_type: str, dpi: int) -> List[np.ndarray]:
+    """Full-DPI renders of every region of one element type, on every page."""
+    import fitz
+    from Functions.page_render import render_clip
+
+    scale = dpi / 72
+    crops = []
+    with fitz.open(pdf_path) as doc:
+        for page in doc:
+            for region_type, rect in layout:
+                if region_type == element_type:
+                    crops.append(render_clip(page, [v * scale for v in rect], dpi))
+    return crops
+
+
+def _timed_pages(pages) -> Tuple[int, int, List[float]]:
+    """Consume (page, elements) items, timing the gap between consecutive pages."""
+    count = elements = 0
+    latencies = []
+    last = time.perf_counter()
+    for page_elements in pages:
+        now = time.perf_counter()
+        latencies.append(now - last)
+        last = now
+        count += 1
+        elements += page_elements
+    return count, elements, latencies
+
+
+def _run_render(pdf_path, layout, options, work_dir):
+    import fitz
+    from Functions.page_render import render_page
+
+    def pages():
+        with fitz.open(pdf_path) as doc:
+            for page in doc:
+                render_page(page, options["dpi"])
+                yield 0
+    return _timed_pages(pages())
+
+
+def _run_text_layer(pdf_path, layout, options, work_dir):
+    import fitz
+    from Functions.text_layer import extract_text_layer, has_usable_text_layer
+
+    def pages():
+        with fitz.open(pdf_path) as doc:
+            for page in doc:
+                usable, _ = has_usable_text_layer(page)
+                if not usable:
+                    yield 0
+                    continue
+                extracted = extract_text_layer(page)
+                yield len(extracted["texts"]) + len(extracted["tables"])
+    return _timed_pages(pages())
+
+
+def _run_cropper(pdf_path, layout, options, work_dir):
+    from crop_elements import PDFElementCropper
+
+    cropper = PDFElementCropper(output_dir=work_dir, dpi=options["dpi"], workers=options["workers"])
+    try:
+        return _timed_pages(len(page["crops"]) for page in cropper.iter_pages(pdf_path))
+    finally:
+        cropper.writer.close()
+
+
+def _run_detector(pdf_path, layout, options, work_dir):
+    import fitz
+    from pdf_element_detector_cv2 import PDFElementDetectorCV2
+
+    with fitz.open(pdf_path) as doc:
+        pages = doc.page_count
+
+    detector = PDFElementDetectorCV2(output_dir=work_dir, dpi=options["dpi"], workers=options["workers"])
+    start = time.perf_counter()
+    result = detector.process_document(pdf_path)
+    detector.writer.close()
+    elapsed = time.perf_counter() - start
+    # Pages are batched, so only the mean page latency is known
+    return pages, len(result["detections"]), [elapsed / max(pages, 1)] * pages
+
+
+def _run_regions(element_type):
+    def run(pdf_path, layout, options, work_dir):
+        from partition import process_formula_with_ocr, process_table_with_ocr
+
+        per_page = sum(1 for region_type, _ in layout if region_type == element_type)
+        crops = region_crops(pdf_path, layout, element_type, options["dpi"])
+        if not per_page:
+            return 0, 0, []
+
+        def pages():
+            for start in range(0, len(crops), per_page):
+                for crop in crops[start:start + per_page]:
+                    if element_type == "Table":
+                        process_table_with_ocr(crop, None, table_name="table")
+                    else:
+                        process_formula_with_ocr(crop, None, formula_name="formula")
+                yield per_page
+        return _timed_pages(pages())
+    return run
+
+
+def _run_pipeline(pdf_path, layout, options, work_dir):
+    from crop_elements import PDFElementCropper
+    from partition import process_formula_with_ocr, process_table_with_ocr
+
+    cropper = PDFElementCropper(output_dir=work_dir, dpi=options["dpi"], workers=options["workers"])
+    elements_dir = str(cropper.output_dir / Path(pdf_path).stem)
+
+    def pages():
+        for page in cropper.iter_pages(pdf_path):
+            for crop in page["crops"]:
+                if crop["type"] == "Table":
+                    process_table_with_ocr(crop["image"], elements_dir, table_name=crop["name"],
+                                           writer=cropper.writer)
+                elif crop["type"] == "Formula":
+                    process_formula_with_ocr(crop["image"], elements_dir, formula_name=crop["name"],
+                                             writer=cropper.writer)
+            yield len(page["crops"])
+    try:
+        return _timed_pages(pages())
+    finally:
+        cropper.writer.close()
+
+
+STAGE_RUNNERS = {
+    "render": _run_render,
+    "text_layer": _run_text_layer,
+    "cropper": _run_cropper,
+    "detector": _run_detector,
+    "table_ocr": _run_regions("Table"),
+    "formula": _run_regions("Formula"),
+    "pipeline": _run_pipeline,
+}
+
+
+def _percentiles_ms(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"p50_ms": 0.0, "p95_ms": 0.0}
+    return {"p50_ms": 1000 * float(np.percentile(values, 50)), "p95_ms": 1000 * float(np.percentile(values, 95))}
+
+
+def run_stage(stage: str, pdf_path: str, spec: Dict[str, Any], options: Dict[str, Any]) -> Dict[str, Any]:
+    """Run one stage over one document in this (fresh) process."""
+    import contextlib
+    import importlib
+    import io
+
+    from Functions import tracing
+
+    try:
+        for module in STAGE_MODULES.get(stage, ()):
+            importlib.import_module(module)
+    except ImportError as e:
+        return {"skipped": f"{type(e).__name__}: {e}"}
+
+    layout = page_layout(spec["tables"], spec["formulas"])
+    install_models(options["layout"], layout, options["real_ocr"], options["real_formula"])
+    tracer = tracing.enable()
+
+    with tempfile.TemporaryDirectory() as work_dir, contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        pages, elements, latencies = STAGE_RUNNERS[stage](pdf_path, layout, options, work_dir)
+        seconds = time.perf_counter() - start
+
+    spans: Dict[str, List[float]] = {}
+    for event in tracer.events:
+        if event["kind"] == "span":
+            spans.setdefault(event["name"], []).append(event["duration_us"] / 1e6)
+
+    return {
+        "pages": pages,
+        "elements": elements,
+        "seconds": seconds,
+        "pages_per_second": pages / seconds if seconds else 0.0,
+        "elements_per_second": elements / seconds if seconds else 0.0,
+        **{f"page_{name}": value for name, value in _percentiles_ms(latencies).items()},
+        "peak_rss_mb": peak_rss_mb(),
+        "spans": {name: {"count": len(values), **_percentiles_ms(values)} for name, values in sorted(spans.items())},
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float) -> List[str]:
+    """Stages whose pages/sec dropped by more than ``tolerance`` against the baseline."""
+    for key in ("dpi", "layout", "workers"):
+        if baseline["options"].get(key) != current["options"].get(key):
+            print(f"Warning: baseline was run with {key}={baseline['options'].get(key)}, "
+                  f"this run with {key}={current['options'].get(key)}")
+
+    regressions = []
+    print(f"\n{'document':<18} {'stage':<11} {'baseline p/s':>12} {'current p/s':>12} {'change':>8}")
+    for document, stages in current["results"].items():
+        for stage, stats in stages.items():
+            reference = baseline["results"].get(document, {}).get(stage)
+            if "skipped" in stats or not reference or not reference.get("pages_per_second"):
+                continue
+            change = stats["pages_per_second"] / reference["pages_per_second"] - 1
+            flag = ""
+            if change < -tolerance:
+                flag = "  REGRESSION"
+                regressions.append(f"{document}/{stage}")
+            print(f"{document:<18} {stage:<11} {reference['pages_per_second']:>12.2f} "
+                  f"{stats['pages_per_second']:>12.2f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the document pipeline on synthetic PDFs")
+    parser.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES, help="Stages to run")
+    parser.add_argument("--docs", nargs="+", default=[spec["name"] for spec in CORPUS],
+                        choices=[spec["name"] for spec in CORPUS], help="Corpus documents to use")
+    parser.add_argument("--pages", type=int, help="Pages per document (overrides the corpus)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic corpus")
+    parser.add_argument("--dpi", type=int, default=150, help="Render DPI")
+    parser.add_argument("--workers", type=int, default=1, help="Processes used by the cropper and detector")
+    parser.add_argument("--layout", default="stub",
+                        help="Layout model: 'stub' or a registered model whose weights are cached locally")
+    parser.add_argument("--real-ocr", action="store_true", help="Use PaddleOCR instead of the OCR stub")
+    parser.add_argument("--real-formula", action="store_true", help="Use FormulaProcessor instead of the formula stub")
+    parser.add_argument("--corpus-dir", help="Keep the generated PDFs in this directory")
+    parser.add_argument("--output", default="pipeline_benchmark.json", help="Where to write the results")
+    parser.add_argument("--compare", help="Baseline results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="Allowed relative pages/sec drop before a stage counts as a regression")
+    args = parser.parse_args()
+
+    if args.layout != "stub":
+        # Never download weights during a benchmark; missing weights fail instead
+        os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+    options = {"dpi": args.dpi, "workers": args.workers, "layout": args.layout,
+               "real_ocr": args.real_ocr, "real_formula": args.real_formula}
+    corpus = [dict(spec, pages=args.pages or spec["pages"]) for spec in CORPUS if spec["name"] in args.docs]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        corpus_dir = Path(args.corpus_dir or tmp_dir)
+        corpus_dir.mkdir(parents=True, exist_ok=True)
+
+        # A fresh process per stage keeps models, caches and peak RSS apart
+        context = multiprocessing.get_context("spawn")
+        results: Dict[str, Dict[str, Any]] = {}
+        for spec in corpus:
+            pdf_path = make_corpus_pdf(spec, str(corpus_dir / f"{spec['name']}.pdf"), args.seed)
+            results[spec["name"]] = {}
+            for stage in args.stages:
+                print(f"{spec['name']}: {stage}...")
+                with context.Pool(1) as pool:
+                    results[spec["name"]][stage] = pool.apply(run_stage, (stage, pdf_path, spec, options))
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                    "cpu_count": os.cpu_count()},
+        "options": {**options, "seed": args.seed},
+        "corpus": corpus,
+        "results": results,
+    }
+
+    print(f"\n{'document':<18} {'stage':<11} {'pages/s':>8} {'elems/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'RSS MB':>8}")
+    for document, stages in results.items():
+        for stage, stats in stages.items():
+            if "skipped" in stats:
+                print(f"{document:<18} {stage:<11} skipped ({stats['skipped']})")
+                continue
+            rss = f"{stats['peak_rss_mb']:.0f}" if stats["peak_rss_mb"] is not None else "n/a"
+            print(f"{document:<18} {stage:<11} {stats['pages_per_second']:>8.2f} {stats['elements_per_second']:>9.1f} "
+                  f"{stats['page_p50_ms']:>8.1f} {stats['page_p95_ms']:>8.1f} {rss:>8}")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+        print("\nNo regressions.")
+
+
+if __name__ == "__main__":
+    main()
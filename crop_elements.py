@@ -1,12 +1,20 @@
 import cv2
+import multiprocessing.util
 import os
+import queue
+import threading
 from pathlib import Path
 import time
 import numpy as np
 from datetime import timedelta
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 
-from Functions.pdf_partitioner import partition_pdf, _load_pdf_as_images
+from Functions import tracing
+from Functions.pdf_partitioner import _load_pdf_as_images
+from Functions.page_render import DETECTION_SIZE, FITZ_LOCK, fit_dpi, render_clip, render_page
+from Functions.parallel import map_page_ranges
+from Functions.shards import SHARD_FORMATS, open_shard_writer
+from Functions.writer import AsyncArtifactWriter, stats_delta, totals_summary
 
 class PDFElementCropper:
     def __init__(
@@ -14,16 +22,47 @@ class PDFElementCropper:
         output_dir: str = "Cropped_Elements",
         top_left_padding: int = 10,
         bottom_right_padding: int = 15,
-        dpi: int = 300
+        dpi: int = 300,
+        model_name: str = "yolox",
+        window: int = 2,
+        workers: int = 1,
+        two_resolution: bool = False,
+        save_crops: bool = True,
+        writer: Optional[AsyncArtifactWriter] = None,
+        output_format: str = "files"
     ):
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
         self.top_left_padding = top_left_padding
         self.bottom_right_padding = bottom_right_padding
         self.dpi = dpi
+        self.model_name = model_name
+        self.window = window
+        self.workers = workers
+        self.two_resolution = two_resolution
+        self.save_crops = save_crops
+        # Crops are encoded and written in the background; files are complete
+        # once iter_pages / process_pdf return (or after writer.flush())
+        self.writer = writer if writer is not None else AsyncArtifactWriter()
+        if output_format not in ("files",) + SHARD_FORMATS:
+            raise ValueError(f"output_format must be 'files' or one of {SHARD_FORMATS}.")
+        # "tar" / "parquet" pack each document's crops into a few shard files
+        self.output_format = output_format
+        # Writer activity of the pool workers, one entry per page range
+        self.worker_writer_stats: List[Dict[str, float]] = []
 
     def crop_with_padding(self, image, bbox: Dict, output_folder: str, filename: str) -> str:
         """Crop the specified coordinates from the image, apply padding, and save it."""
+        # Copied so the queued crop does not keep the whole page image alive
+        cropped_image = self.padded_crop(image, bbox).copy()
+
+        # Save cropped image
+        output_path = self.writer.write_image(os.path.join(output_folder, filename), cropped_image)
+        print(f"Cropped element saved to: {output_path}")
+        return output_path
+
+    def padded_crop(self, image: np.ndarray, bbox: Dict) -> np.ndarray:
+        """Return the padded element region as a view into ``image`` (no copy)."""
         # Extract coordinates
         x_min = int(bbox['x1'])
         y_min = int(bbox['y1'])
@@ -37,14 +76,29 @@ class PDFElementCropper:
         y_max_padded = min(image.shape[0], y_max + self.bottom_right_padding)
 
         # Crop the image
-        cropped_image = image[y_min_padded:y_max_padded, x_min_padded:x_max_padded]
+        return image[y_min_padded:y_max_padded, x_min_padded:x_max_padded]
 
-        # Save cropped image
-        output_path = os.path.join(output_folder, filename)
-        cv2.imwrite(output_path, cropped_image)
+    def crop_region(self, page, bbox: Dict, output_folder: str, filename: str) -> str:
+        """Re-render the padded element region of a PyMuPDF page at full DPI and save it.
+
+        Uses the same padding as ``crop_with_padding``; ``bbox`` is in pixels at ``self.dpi``.
+        """
+        cropped_image = self.padded_region(page, bbox)
+
+        output_path = self.writer.write_image(os.path.join(output_folder, filename), cropped_image)
         print(f"Cropped element saved to: {output_path}")
         return output_path
 
+    def padded_region(self, page, bbox: Dict) -> np.ndarray:
+        """Render the padded element region of a PyMuPDF page at full DPI."""
+        padding = (
+            self.top_left_padding,
+            self.top_left_padding,
+            self.bottom_right_padding * 2,
+            self.bottom_right_padding,
+        )
+        return render_clip(page, [bbox['x1'], bbox['y1'], bbox['x2'], bbox['y2']], self.dpi, padding)
+
     def _load_pdf_as_images(self, pdf_path: str) -> List[Any]:
         """Load PDF pages as CV2 images using the pdf_partitioner function."""
         # Get PIL images using the existing function
@@ -61,56 +115,316 @@ class PDFElementCropper:
         
         return cv2_images
 
-    def process_pdf(self, pdf_path: str):
-        """Process a PDF file and crop all detected elements."""
+    def _page_render_dpi(self, page) -> float:
+        """DPI for the detection render: full DPI, or just enough for the model input."""
+        if self.two_resolution:
+            return fit_dpi(page, DETECTION_SIZE, self.dpi)
+        return self.dpi
+
+    def _iter_rendered_pages(
+        self, pdf_path: str, page_numbers: Optional[range] = None
+    ) -> Iterator[Tuple[int, np.ndarray, float]]:
+        """Render pages on a background thread, one page at a time.
+
+        At most ``self.window`` rendered pages wait in the queue, so memory stays
+        bounded no matter how many pages the PDF has. Yields
+        ``(page_number, image, dpi)`` with the DPI the page was rendered at.
+        The renderer holds ``FITZ_LOCK`` for its PyMuPDF calls, so the consumer
+        can render regions from another document at the same time.
+        """
+        import fitz
+
+        pages = queue.Queue(maxsize=max(1, self.window))
+        stop = threading.Event()
+        done = object()
+
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce():
+            try:
+                with FITZ_LOCK:
+                    doc = fitz.open(pdf_path)
+                try:
+                    # An empty range means no pages, not all of them
+                    pages_to_render = range(1, doc.page_count + 1) if page_numbers is None else page_numbers
+                    for page_num in pages_to_render:
+                        with FITZ_LOCK:
+                            page = doc[page_num - 1]
+                            dpi = self._page_render_dpi(page)
+                            with tracing.document(Path(pdf_path).stem), tracing.page(page_num):
+                                image = render_page(page, dpi)
+                        if not put((page_num, image, dpi)):
+                            return
+                finally:
+                    with FITZ_LOCK:
+                        doc.close()
+            except Exception as e:
+                put(e)
+            finally:
+                put(done)
+
+        producer = threading.Thread(target=produce, name="pdf-page-renderer", daemon=True)
+        producer.start()
+        try:
+            while True:
+                item = pages.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            producer.join()
+
+    def _detect_page_elements(self, model, page_image, page_num: int, scale: float = 1.0) -> List[Dict]:
+        """Run the layout model on one page and return partition-style element dicts.
+
+        ``scale`` maps model coordinates to pixels at ``self.dpi``.
+        """
+        rgb_image = cv2.cvtColor(page_image, cv2.COLOR_BGR2RGB)
+        predictions = model.predict(rgb_image)
+
+        elements = []
+        for element in predictions.iter_elements():
+            elements.append({
+                'type': element.type or "Unknown",
+                'page_number': page_num,
+                'bbox': {
+                    'x1': element.bbox.x1 * scale,
+                    'y1': element.bbox.y1 * scale,
+                    'x2': element.bbox.x2 * scale,
+                    'y2': element.bbox.y2 * scale,
+                },
+                'confidence': element.prob,
+            })
+        return elements
+
+    def iter_pages(self, pdf_path: str, page_numbers: Optional[range] = None) -> Iterator[Dict[str, Any]]:
+        """Render, detect and crop one page at a time.
+
+        Yields one result per page as soon as its crops are cut, so callers can
+        start working on a page while the next one is still rendering. Every crop
+        carries its pixels as ``image`` (a copy cut from the page render, or a
+        full-DPI region render in two-resolution mode), so consumers need not
+        read anything back from disk. Crop numbering restarts on every page,
+        which keeps file names independent of other pages; ``process_pdf``
+        names its crops the same way on every path.
+
+        With ``save_crops`` the crops are also queued on ``self.writer``;
+        ``path`` is reserved immediately, and all files are complete once the
+        iterator is exhausted or closed. Without it ``path`` is None.
+
+        With ``workers`` > 1 the pages are sharded across a process pool; each worker
+        opens its own document and model session, and results still arrive in page
+        order.
+
+        With ``two_resolution`` pages are detected on renders sized to the model
+        input, and every element is re-rendered at full DPI from the PDF.
+
+        With a ``tar`` or ``parquet`` ``output_format`` no per-crop files are
+        written; instead each page's crops are appended to shards under
+        ``output_dir/<pdf name>`` when the caller asks for the next page.
+        ``ocr_text`` and ``latex`` values the caller has set on a crop by then
+        are stored with it.
+
+        Args:
+            pdf_path: Path to the PDF file
+            page_numbers: Optional range of 1-based pages to process
+
+        Yields:
+            Dict with ``page_number``, the detected ``elements`` and the
+            ``crops`` (each with ``type``, ``name``, ``image``, ``path``,
+            ``bbox`` and ``confidence``)
+        """
+        if self.output_format in SHARD_FORMATS:
+            yield from self._iter_pages_to_shards(pdf_path, page_numbers)
+        elif self.workers > 1 and page_numbers is None:
+            yield from self._iter_pages_parallel(pdf_path)
+        else:
+            yield from self._iter_pages_local(pdf_path, page_numbers)
+
+    def _iter_pages_to_shards(self, pdf_path: str, page_numbers: Optional[range]) -> Iterator[Dict[str, Any]]:
+        """Yield pages and append their crops, with any attached OCR results, to shards."""
+        pdf_filename = Path(pdf_path).stem
+        if self.workers > 1 and page_numbers is None:
+            pages = self._iter_pages_parallel(pdf_path)
+        else:
+            pages = self._iter_pages_local(pdf_path, page_numbers)
+
+        with open_shard_writer(
+            self.output_format,
+            str(self.output_dir / pdf_filename),
+            pdf_filename,
+            image_format="webp" if self.writer.webp_lossless else "png",
+            png_compression=self.writer.png_compression,
+        ) as shards:
+            for page_result in pages:
+                try:
+                    yield page_result
+                finally:
+                    for crop in page_result['crops']:
+                        bbox = crop['bbox']
+                        shards.write(
+                            crop['name'],
+                            image=crop['image'],
+                            metadata={
+                                'document': pdf_filename,
+                                'page_number': page_result['page_number'],
+                                'type': crop['type'],
+                                'bbox': [bbox['x1'], bbox['y1'], bbox['x2'], bbox['y2']],
+                                'confidence': crop['confidence'],
+                            },
+                            ocr_text=crop.get('ocr_text'),
+                            latex=crop.get('latex'),
+                        )
+        print(f"Shards: {shards.stats['samples']} crops in {shards.stats['shards']} "
+              f"{self.output_format} shard(s), index at {shards.index_path}")
+
+    def _iter_pages_local(self, pdf_path: str, page_numbers: Optional[range]) -> Iterator[Dict[str, Any]]:
+        """Render, detect and crop pages in this process; see ``iter_pages``."""
+        import fitz
+        from Functions.base import get_model
+
+        pdf_filename = Path(pdf_path).stem
+        model = get_model(self.model_name)
+        # The renderer thread has its own handle; crops are rendered from this one
+        clip_doc = fitz.open(pdf_path) if self.two_resolution else None
+
+        try:
+            yield from self._iter_cropped_pages(pdf_path, pdf_filename, model, clip_doc, page_numbers)
+        finally:
+            self.writer.flush()
+            if clip_doc is not None:
+                with FITZ_LOCK:
+                    clip_doc.close()
+
+    def _iter_cropped_pages(
+        self, pdf_path: str, pdf_filename: str, model, clip_doc, page_numbers: Optional[range]
+    ) -> Iterator[Dict[str, Any]]:
+        """Detect and crop the rendered pages; see ``iter_pages``."""
+        for page_num, page_image, page_dpi in self._iter_rendered_pages(pdf_path, page_numbers):
+            with tracing.document(pdf_filename), tracing.page(page_num):
+                page_result = self._crop_page(pdf_filename, model, clip_doc, page_num, page_image, page_dpi)
+            yield page_result
+
+    def _crop_page(
+        self, pdf_filename: str, model, clip_doc, page_num: int, page_image: np.ndarray, page_dpi: float
+    ) -> Dict[str, Any]:
+        """Detect and crop the elements of one rendered page."""
+        elements = self._detect_page_elements(model, page_image, page_num, self.dpi / page_dpi)
+        page_counts = {}
+        crops = []
+
+        for element in elements:
+            element_type = element['type']
+            page_counts[element_type] = page_counts.get(element_type, 0) + 1
+
+            filename = f"{pdf_filename}_page{page_num}_{element_type.lower()}_{page_counts[element_type]}.png"
+
+            try:
+                with tracing.span(tracing.CROP, type=element_type):
+                    if clip_doc is not None:
+                        # The page renderer thread uses PyMuPDF concurrently
+                        with FITZ_LOCK:
+                            cropped_image = self.padded_region(clip_doc[page_num - 1], element['bbox'])
+                    else:
+                        # A view would pin the whole page while the crop waits in the writer queue
+                        cropped_image = self.padded_crop(page_image, element['bbox']).copy()
+                if cropped_image.size == 0:
+                    raise ValueError(f"Empty crop for bbox {element['bbox']}")
+            except Exception as e:
+                print(f"Error processing {element_type} on page {page_num}: {str(e)}")
+                continue
+
+            path = None
+            if self.save_crops and self.output_format == "files":
+                path = self.writer.write_image(
+                    str(self.output_dir / pdf_filename / element_type / filename), cropped_image
+                )
+
+            crops.append({
+                'type': element_type,
+                'name': Path(filename).stem,
+                'image': cropped_image,
+                'path': path,
+                'bbox': element['bbox'],
+                'confidence': element['confidence'],
+            })
+
+        tracing.count("pages")
+        tracing.count("crops", len(crops))
+        return {'page_number': page_num, 'elements': elements, 'crops': crops}
+
+    def _iter_pages_parallel(self, pdf_path: str) -> Iterator[Dict[str, Any]]:
+        """Shard page ranges across a process pool and yield results in page order."""
+        import fitz
+
+        with fitz.open(pdf_path) as doc:
+            page_count = doc.page_count
+
+        for page_results, writer_stats in map_page_ranges(
+            _crop_page_range,
+            page_count,
+            self.workers,
+            initializer=_init_cropper_worker,
+            initargs=(self._worker_config(),),
+            task_args=(pdf_path,),
+        ):
+            self.worker_writer_stats.append(writer_stats)
+            yield from page_results
+
+    def _worker_config(self) -> Dict[str, Any]:
+        """Constructor arguments for the single-process cropper run in each worker."""
+        return {
+            'output_dir': str(self.output_dir),
+            'top_left_padding': self.top_left_padding,
+            'bottom_right_padding': self.bottom_right_padding,
+            'dpi': self.dpi,
+            'model_name': self.model_name,
+            'window': self.window,
+            'two_resolution': self.two_resolution,
+            # Shards are written by the parent process, which owns the page order
+            'save_crops': self.save_crops and self.output_format == "files",
+            'writer_options': self.writer.options,
+        }
+
+    def process_pdf(self, pdf_path: str, streaming: bool = False) -> Tuple[Dict[str, int], Path]:
+        """Process a PDF file and crop all detected elements.
+
+        Args:
+            pdf_path: Path to the PDF file
+            streaming: Render, detect and crop one page at a time instead of
+                rendering the whole document up front (always the case when
+                ``workers`` > 1, ``two_resolution`` is set or the output is sharded);
+                both detect and name crops the same way
+
+        Returns:
+            Tuple of (element counts per type, directory holding the crops)
+        """
         start_time = time.time()
         
         # Get the PDF filename without extension
         pdf_filename = Path(pdf_path).stem
         
-        # Get elements using partition_pdf
-        elements = partition_pdf(
-            filename=pdf_path,
-            dpi=self.dpi
-        )
-        
-        # Convert PDF to images
-        page_images = self._load_pdf_as_images(pdf_path)
-        
         # Create element type counters
         element_counts = {}
+        self.worker_writer_stats = []
         
-        # Process each page
-        for page_num, page_image in enumerate(page_images, 1):
-            # Get elements for this page
-            page_elements = [e for e in elements if e['page_number'] == page_num]
-            
-            for element in page_elements:
-                element_type = element['type']
-                
-                # Initialize counter for this element type
-                if element_type not in element_counts:
-                    element_counts[element_type] = 0
-                element_counts[element_type] += 1
-                
-                # Create type-specific output folder
-                output_folder = self.output_dir / pdf_filename / element_type
-                output_folder.mkdir(parents=True, exist_ok=True)
-                
-                # Create filename
-                filename = f"{pdf_filename}_page{page_num}_{element_type.lower()}_{element_counts[element_type]}.png"
-                
-                try:
-                    # Crop and save the element
-                    self.crop_with_padding(
-                        image=page_image,
-                        bbox=element['bbox'],
-                        output_folder=str(output_folder),
-                        filename=filename
-                    )
-                except Exception as e:
-                    print(f"Error processing {element_type} on page {page_num}: {str(e)}")
-                    continue
+        if streaming or self.workers > 1 or self.two_resolution or self.output_format != "files":
+            for page_result in self.iter_pages(pdf_path):
+                for crop in page_result['crops']:
+                    element_counts[crop['type']] = element_counts.get(crop['type'], 0) + 1
+        else:
+            self._process_pdf_in_memory(pdf_path, pdf_filename, element_counts)
+            self.writer.flush()
         
         # Print summary
         processing_time = time.time() - start_time
@@ -119,7 +433,58 @@ class PDFElementCropper:
         print("\nElements extracted:")
         for element_type, count in element_counts.items():
             print(f"  {element_type}: {count}")
+        if self.worker_writer_stats:
+            print(f"Writer: {totals_summary(self.worker_writer_stats, self.workers)}")
+        else:
+            print(f"Writer: {self.writer.summary()}")
         print(f"\nResults saved to: {self.output_dir / pdf_filename}")
+        
+        return element_counts, self.output_dir / pdf_filename
+
+    def _process_pdf_in_memory(self, pdf_path: str, pdf_filename: str, element_counts: Dict[str, int]):
+        """Render the whole document, then detect and crop every page from memory."""
+        from Functions.base import get_model
+
+        model = get_model(self.model_name)
+        page_images = self._load_pdf_as_images(pdf_path)
+
+        # Same detection and crop naming as iter_pages
+        for page_num, page_image in enumerate(page_images, 1):
+            with tracing.document(pdf_filename), tracing.page(page_num):
+                page_result = self._crop_page(pdf_filename, model, None, page_num, page_image, self.dpi)
+            for crop in page_result['crops']:
+                element_counts[crop['type']] = element_counts.get(crop['type'], 0) + 1
+
+# Per-process cropper used by the worker pool; each worker loads its own model session
+_worker_cropper: Optional[PDFElementCropper] = None
+
+def _close_cropper_worker():
+    """Drain and close the worker's writer, syncing it under ``fsync="close"``."""
+    if _worker_cropper is not None:
+        _worker_cropper.writer.close()
+
+def _init_cropper_worker(config: Dict[str, Any]):
+    """Create the cropper (and its layout model) once per worker process."""
+    global _worker_cropper
+    from Functions.base import get_model
+
+    config = dict(config)
+    writer_options = config.pop('writer_options', None)
+    if writer_options:
+        config['writer'] = AsyncArtifactWriter(**writer_options)
+    _worker_cropper = PDFElementCropper(**config)
+    get_model(_worker_cropper.model_name)
+    # Runs at worker exit (atexit does not), before the trace export
+    multiprocessing.util.Finalize(None, _close_cropper_worker, exitpriority=10)
+
+def _crop_page_range(page_numbers: range, pdf_path: str) -> Tuple[List[Dict[str, Any]], Dict[str, float]]:
+    """Render, detect and crop one shard of pages inside a worker process.
+
+    Returns the page results and the shard's writer activity.
+    """
+    before = _worker_cropper.writer.stats
+    page_results = list(_worker_cropper.iter_pages(pdf_path, page_numbers=page_numbers))
+    return page_results, stats_delta(before, _worker_cropper.writer.stats)
 
 def main():
     # Configuration
@@ -128,6 +493,7 @@ def main():
     DPI = 300
     TOP_LEFT_PADDING = 10
     BOTTOM_RIGHT_PADDING = 15
+    WORKERS = 1  # Processes used to render, detect and crop pages
 
     try:
         # Initialize cropper
@@ -135,7 +501,8 @@ def main():
             output_dir=OUTPUT_DIR,
             top_left_padding=TOP_LEFT_PADDING,
             bottom_right_padding=BOTTOM_RIGHT_PADDING,
-            dpi=DPI
+            dpi=DPI,
+            workers=WORKERS
         )
         
         # Process the PDF
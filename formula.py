@@ -1,53 +1,121 @@
 #! pip install transformers>=4.37.0 pillow optimum[onnxruntime]
 import os
 import time
+import cv2
+import numpy as np
 from PIL import Image
-from transformers import TrOCRProcessor
-from optimum.onnxruntime import ORTModelForVision2Seq
 from pathlib import Path
 from typing import Optional, Union, List, Tuple, Dict
 from contextlib import contextmanager
+from Functions import tracing
+from Functions.formula_decoding import (
+    DEFAULT_MAX_NEW_TOKENS,
+    DEFAULT_REPETITION_NGRAM,
+    count_generated_tokens,
+    finished_sequences,
+    generation_kwargs,
+    load_vision2seq_model,
+)
+from Functions.result_cache import ResultCache
 
 @contextmanager
 def timer(description: str) -> float:
-    """Context manager for timing code blocks."""
+    """Context manager for timing code blocks (also recorded as a trace span)."""
     start = time.perf_counter()
-    yield
+    with tracing.span(description):
+        yield
     elapsed = time.perf_counter() - start
     print(f"{description}: {elapsed:.3f} seconds")
 
 class FormulaProcessor:
     """A class to process mathematical formulas in images and convert them to LaTeX."""
     
-    def __init__(self):
-        """Initialize the FormulaProcessor with required models."""
+    def __init__(self, use_cache: bool = True, max_new_tokens: int = DEFAULT_MAX_NEW_TOKENS,
+                 max_time: Optional[float] = None,
+                 repetition_ngram: Optional[int] = DEFAULT_REPETITION_NGRAM,
+                 result_cache: Optional[ResultCache] = None):
+        """
+        Initialize the FormulaProcessor with required models.
+        
+        Args:
+            use_cache: Decode with the cached (past key values) decoder, exporting it if needed
+            max_new_tokens: Maximum number of LaTeX tokens generated per image
+            max_time: Optional time budget in seconds for decoding one image
+            repetition_ngram: Stop decoding when an n-gram of this size keeps repeating (None disables)
+            result_cache: Optional cache consulted before inference, keyed by crop pixels
+        """
+        self.model_name = 'breezedeus/pix2text-mfr'
         with timer("Model initialization"):
-            self.processor = TrOCRProcessor.from_pretrained('breezedeus/pix2text-mfr')
-            self.model = ORTModelForVision2Seq.from_pretrained('breezedeus/pix2text-mfr', use_cache=False)
+            from transformers import TrOCRProcessor
+
+            self.processor = TrOCRProcessor.from_pretrained(self.model_name)
+            self.model, self.use_cache = load_vision2seq_model(self.model_name, use_cache=use_cache)
+        self.generate_kwargs = generation_kwargs(max_new_tokens, max_time, repetition_ngram)
+        self.result_cache = result_cache
+        self.model_revision = getattr(self.model.config, '_commit_hash', None) or 'main'
+        self.decoding_params = {
+            'max_new_tokens': max_new_tokens,
+            'max_time': max_time,
+            'repetition_ngram': repetition_ngram
+        }
         self.timing_stats = {
             'total_processing_time': 0.0,
             'image_load_time': 0.0,
             'inference_time': 0.0,
-            'processed_images': 0
+            'generated_tokens': 0,
+            'processed_images': 0,
+            'cache_hits': 0,
+            'truncated': 0
         }
 
-    def process_single_formula(self, image_path: Union[str, Path]) -> Tuple[Optional[str], Dict[str, float]]:
-        """Process a single formula image and return LaTeX with timing information."""
-        timing = {'image_load': 0.0, 'inference': 0.0, 'total': 0.0}
+    def process_single_formula(self, image_or_path: Union[str, Path, np.ndarray]) -> Tuple[Optional[str], Dict[str, float]]:
+        """Process a single formula image (a path or an OpenCV image array) and return LaTeX with timing information."""
+        timing = {'image_load': 0.0, 'inference': 0.0, 'total': 0.0, 'tokens': 0, 'truncated': False}
         start_total = time.perf_counter()
         
         try:
             # Load and process image
             start_load = time.perf_counter()
-            image = Image.open(image_path).convert('RGB')
+            if isinstance(image_or_path, np.ndarray):
+                # In-memory crops come from OpenCV renders: BGR, BGRA or grayscale
+                if image_or_path.ndim == 2:
+                    conversion = cv2.COLOR_GRAY2RGB
+                elif image_or_path.shape[2] == 4:
+                    conversion = cv2.COLOR_BGRA2RGB
+                else:
+                    conversion = cv2.COLOR_BGR2RGB
+                image = Image.fromarray(cv2.cvtColor(image_or_path, conversion))
+            else:
+                image = Image.open(image_or_path).convert('RGB')
             timing['image_load'] = time.perf_counter() - start_load
             
+            # Unchanged crops are answered from the result cache
+            cache_key = None
+            if self.result_cache is not None:
+                cache_key = self.result_cache.make_key(image, self.model_name, self.model_revision, self.decoding_params)
+                latex_text = self.result_cache.get(cache_key)
+                if latex_text is not None:
+                    timing['total'] = time.perf_counter() - start_total
+                    self.timing_stats['total_processing_time'] += timing['total']
+                    self.timing_stats['image_load_time'] += timing['image_load']
+                    self.timing_stats['processed_images'] += 1
+                    self.timing_stats['cache_hits'] += 1
+                    return latex_text, timing
+            
             # Generate LaTeX
             start_inference = time.perf_counter()
-            pixel_values = self.processor(images=[image], return_tensors="pt").pixel_values
-            generated_ids = self.model.generate(pixel_values)
-            latex_text = self.processor.batch_decode(generated_ids, skip_special_tokens=True)[0]
+            with tracing.span(tracing.FORMULA_DECODE, images=1):
+                pixel_values = self.processor(images=[image], return_tensors="pt").pixel_values
+                generated_ids = self.model.generate(pixel_values, **self.generate_kwargs)
+                latex_text = self.processor.batch_decode(generated_ids, skip_special_tokens=True)[0]
             timing['inference'] = time.perf_counter() - start_inference
+            timing['tokens'] = count_generated_tokens(generated_ids, self.processor.tokenizer.pad_token_id)
+            # Truncated LaTeX (decoding budget or repetition stop) is returned but never cached
+            timing['truncated'] = not finished_sequences(generated_ids, self.processor.tokenizer.eos_token_id)[0]
+            if timing['truncated']:
+                self.timing_stats['truncated'] += 1
+            elif cache_key is not None:
+                self.result_cache.put(cache_key, latex_text)
             
             timing['total'] = time.perf_counter() - start_total
             
@@ -55,12 +123,14 @@ class FormulaProcessor:
             self.timing_stats['total_processing_time'] += timing['total']
             self.timing_stats['image_load_time'] += timing['image_load']
             self.timing_stats['inference_time'] += timing['inference']
+            self.timing_stats['generated_tokens'] += timing['tokens']
             self.timing_stats['processed_images'] += 1
             
             return latex_text, timing
             
         except Exception as e:
-            print(f"Error processing formula image {image_path}: {str(e)}")
+            name = 'in-memory crop' if isinstance(image_or_path, np.ndarray) else image_or_path
+            print(f"Error processing formula image {name}: {str(e)}")
             return None, timing
 
     def process_formula_batch(self, input_folder: Union[str, Path], output_folder: Union[str, Path]) -> List[str]:
@@ -103,8 +173,15 @@ class FormulaProcessor:
             print(f"Total batch processing time: {batch_time:.3f} seconds")
             print(f"Average processing time per image: {avg_time:.3f} seconds")
             print(f"Total images processed: {self.timing_stats['processed_images']}")
+            if self.result_cache is not None:
+                print(f"Result cache hits: {self.timing_stats['cache_hits']}")
+            if self.timing_stats['truncated']:
+                print(f"Truncated formulas (stopped before the end of the LaTeX): {self.timing_stats['truncated']}")
             print(f"Average image load time: {self.timing_stats['image_load_time'] / self.timing_stats['processed_images']:.3f} seconds")
             print(f"Average inference time: {self.timing_stats['inference_time'] / self.timing_stats['processed_images']:.3f} seconds")
+            if self.timing_stats['inference_time'] > 0:
+                print(f"Decoding speed: {self.timing_stats['generated_tokens'] / self.timing_stats['inference_time']:.1f} tokens/second "
+                      f"(KV cache {'on' if self.use_cache else 'off'})")
         
         return processed_files
 
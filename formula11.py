@@ -1,14 +1,24 @@
 #! pip install transformers>=4.37.0 pillow optimum[onnxruntime] tqdm
 import os
+import math
 import time
 import logging
+import threading
 import concurrent.futures
 from pathlib import Path
 from typing import Dict, List, Tuple, Optional
 from tqdm import tqdm
 from PIL import Image
-from transformers import TrOCRProcessor
-from optimum.onnxruntime import ORTModelForVision2Seq
+from Functions import tracing
+from Functions.formula_decoding import (
+    DEFAULT_MAX_NEW_TOKENS,
+    DEFAULT_REPETITION_NGRAM,
+    count_generated_tokens,
+    finished_sequences,
+    generation_kwargs,
+    load_vision2seq_model,
+)
+from Functions.result_cache import DEFAULT_CACHE_NAME, ResultCache
 
 # Configure logging
 def setup_logging(log_file="formula_processing.log"):
@@ -23,13 +33,14 @@ def setup_logging(log_file="formula_processing.log"):
     )
     return logging.getLogger("FormulaProcessor")
 
-# Initialize logger at module level but allow reconfiguration
-logger = setup_logging()
+# Handlers are only attached by main(), so importing this module has no side effects
+logger = logging.getLogger("FormulaProcessor")
 
 def time_function(description: str, func, *args, **kwargs):
     """Execute a function and time it."""
     start = time.perf_counter()
-    result = func(*args, **kwargs)
+    with tracing.span(description):
+        result = func(*args, **kwargs)
     elapsed = time.perf_counter() - start
     logger.info(f"{description}: {elapsed:.3f} seconds")
     return result, elapsed
@@ -37,10 +48,31 @@ def time_function(description: str, func, *args, **kwargs):
 class FormulaProcessor:
     """Class for processing mathematical formulas in images to LaTeX"""
     
-    def __init__(self, model_name='breezedeus/pix2text-mfr', use_fast=True):
-        """Initialize the processor with the specified model"""
+    def __init__(self, model_name='breezedeus/pix2text-mfr', use_fast=True, use_cache=True,
+                 max_new_tokens=DEFAULT_MAX_NEW_TOKENS, max_time=None,
+                 repetition_ngram=DEFAULT_REPETITION_NGRAM, result_cache: Optional[ResultCache] = None):
+        """
+        Initialize the processor with the specified model
+        
+        Args:
+            model_name: Hugging Face model id
+            use_fast: Whether to use fast tokenization
+            use_cache: Decode with the cached (past key values) decoder, exporting it if needed
+            max_new_tokens: Maximum number of LaTeX tokens generated per image
+            max_time: Optional time budget in seconds for one generate call
+            repetition_ngram: Stop decoding when an n-gram of this size keeps repeating (None disables)
+            result_cache: Optional cache consulted before inference, keyed by crop pixels
+        """
         self.model_name = model_name
         self.use_fast = use_fast
+        self.use_cache = use_cache
+        self.generate_kwargs = generation_kwargs(max_new_tokens, max_time, repetition_ngram)
+        self.result_cache = result_cache
+        self.decoding_params = {
+            'max_new_tokens': max_new_tokens,
+            'max_time': max_time,
+            'repetition_ngram': repetition_ngram
+        }
         self.processor = None
         self.model = None
         self.stats = {
@@ -49,19 +81,34 @@ class FormulaProcessor:
             'image_load_time': 0.0,
             'inference_time': 0.0,
             'file_write_time': 0.0,
+            'generated_tokens': 0,
             'images_processed': 0,
-            'images_failed': 0
+            'images_failed': 0,
+            'images_truncated': 0,
+            'cache_hits': 0,
+            'batches': []
         }
+        self._stats_lock = threading.Lock()
         self._initialize_model()
         
     def _initialize_model(self):
         """Initialize the OCR processor and model"""
         logger.info(f"Initializing model and processor ({self.model_name})...")
+        from transformers import TrOCRProcessor
+
         start_init = time.perf_counter()
         self.processor = TrOCRProcessor.from_pretrained(self.model_name, use_fast=self.use_fast)
-        self.model = ORTModelForVision2Seq.from_pretrained(self.model_name, use_cache=False)
+        self.model, self.use_cache = load_vision2seq_model(self.model_name, use_cache=self.use_cache)
+        self.model_revision = getattr(self.model.config, '_commit_hash', None) or 'main'
         self.stats['model_init_time'] = time.perf_counter() - start_init
-        logger.info(f"Model initialization: {self.stats['model_init_time']:.3f} seconds")
+        logger.info(f"Model initialization: {self.stats['model_init_time']:.3f} seconds "
+                    f"(KV cache {'on' if self.use_cache else 'off'})")
+    
+    def _cache_key(self, image: Image.Image) -> Optional[str]:
+        """Result cache key of an image, or None when no cache is configured"""
+        if self.result_cache is None:
+            return None
+        return self.result_cache.make_key(image, self.model_name, self.model_revision, self.decoding_params)
     
     def process_single_image(self, image_path: str, output_path: Optional[str] = None) -> Tuple[str, Dict[str, float]]:
         """
@@ -74,7 +121,7 @@ class FormulaProcessor:
         Returns:
             Tuple of (LaTeX text, timing dictionary)
         """
-        timing = {'load': 0.0, 'inference': 0.0, 'write': 0.0, 'total': 0.0}
+        timing = {'load': 0.0, 'inference': 0.0, 'write': 0.0, 'total': 0.0, 'tokens': 0, 'truncated': False}
         start_total = time.perf_counter()
         
         try:
@@ -82,15 +129,29 @@ class FormulaProcessor:
             start_load = time.perf_counter()
             image = Image.open(image_path).convert('RGB')
             timing['load'] = time.perf_counter() - start_load
-            self.stats['image_load_time'] += timing['load']
             
-            # Generate LaTeX
-            start_inference = time.perf_counter()
-            pixel_values = self.processor(images=[image], return_tensors="pt").pixel_values
-            generated_ids = self.model.generate(pixel_values)
-            latex_text = self.processor.batch_decode(generated_ids, skip_special_tokens=True)[0]
-            timing['inference'] = time.perf_counter() - start_inference
-            self.stats['inference_time'] += timing['inference']
+            # Unchanged crops are answered from the result cache
+            cache_key = self._cache_key(image)
+            latex_text = self.result_cache.get(cache_key) if cache_key else None
+            if latex_text is not None:
+                with self._stats_lock:
+                    self.stats['cache_hits'] += 1
+            else:
+                # Generate LaTeX
+                start_inference = time.perf_counter()
+                with tracing.span(tracing.FORMULA_DECODE, images=1):
+                    pixel_values = self.processor(images=[image], return_tensors="pt").pixel_values
+                    generated_ids = self.model.generate(pixel_values, **self.generate_kwargs)
+                    latex_text = self.processor.batch_decode(generated_ids, skip_special_tokens=True)[0]
+                timing['inference'] = time.perf_counter() - start_inference
+                timing['tokens'] = count_generated_tokens(generated_ids, self.processor.tokenizer.pad_token_id)
+                # Truncated LaTeX (decoding budget or repetition stop) is returned but never cached
+                timing['truncated'] = not finished_sequences(generated_ids, self.processor.tokenizer.eos_token_id)[0]
+                if timing['truncated']:
+                    with self._stats_lock:
+                        self.stats['images_truncated'] += 1
+                elif cache_key:
+                    self.result_cache.put(cache_key, latex_text)
             
             # Save LaTeX to file if output path is provided
             if output_path:
@@ -98,10 +159,9 @@ class FormulaProcessor:
                 with open(output_path, 'w', encoding='utf-8') as f:
                     f.write(latex_text)
                 timing['write'] = time.perf_counter() - start_write
-                self.stats['file_write_time'] += timing['write']
                 
             timing['total'] = time.perf_counter() - start_total
-            self.stats['images_processed'] += 1
+            self._record_success(timing['load'], timing['inference'], timing['write'], tokens=timing['tokens'])
             
             # Log success with timing details
             filename = os.path.basename(image_path)
@@ -115,9 +175,139 @@ class FormulaProcessor:
             
         except Exception as e:
             logger.error(f"Error processing {image_path}: {str(e)}")
-            self.stats['images_failed'] += 1
+            with self._stats_lock:
+                self.stats['images_failed'] += 1
             return None, timing
     
+    def _record_success(self, load_time: float, inference_time: float, write_time: float, count: int = 1,
+                        tokens: int = 0):
+        """Add timings of successfully processed images to the shared stats"""
+        with self._stats_lock:
+            self.stats['image_load_time'] += load_time
+            self.stats['inference_time'] += inference_time
+            self.stats['file_write_time'] += write_time
+            self.stats['generated_tokens'] += tokens
+            self.stats['images_processed'] += count
+    
+    @staticmethod
+    def _bucket_by_aspect_ratio(image_paths: List[str], batch_size: int) -> List[List[str]]:
+        """
+        Group images into batches of similar aspect ratio
+        
+        Wide formulas decode into long LaTeX strings, so batching images of similar
+        shape keeps sequences in a batch close in length and limits the padding
+        generated for the shorter ones. Only image headers are read here.
+        
+        Args:
+            image_paths: Paths to image files
+            batch_size: Maximum number of images per batch
+            
+        Returns:
+            List of batches, each a list of image paths
+        """
+        buckets: Dict[int, List[Tuple[float, str]]] = {}
+        for image_path in image_paths:
+            try:
+                with Image.open(image_path) as image:
+                    width, height = image.size
+                aspect_ratio = width / max(height, 1)
+            except Exception:
+                aspect_ratio = 1.0
+            bucket = round(math.log2(max(aspect_ratio, 1e-3)))
+            buckets.setdefault(bucket, []).append((aspect_ratio, image_path))
+        
+        batches = []
+        for bucket in sorted(buckets):
+            members = [path for _, path in sorted(buckets[bucket])]
+            for start in range(0, len(members), batch_size):
+                batches.append(members[start:start + batch_size])
+        return batches
+    
+    def process_image_batch(self, image_paths: List[str], output_folder: Optional[str] = None) -> List[Optional[str]]:
+        """
+        Convert several formula images to LaTeX with a single generate call
+        
+        Args:
+            image_paths: Paths to image files
+            output_folder: Optional folder to save one .tex file per image
+            
+        Returns:
+            List of LaTeX strings (None for images that failed), in input order
+        """
+        start_batch = time.perf_counter()
+        
+        start_load = time.perf_counter()
+        results = {}
+        images, loaded_paths, cache_keys = [], [], []
+        for image_path in image_paths:
+            try:
+                image = Image.open(image_path).convert('RGB')
+            except Exception as e:
+                logger.error(f"Error loading {image_path}: {str(e)}")
+                with self._stats_lock:
+                    self.stats['images_failed'] += 1
+                continue
+            # Only crops missing from the result cache go to the model
+            cache_key = self._cache_key(image)
+            latex_text = self.result_cache.get(cache_key) if cache_key else None
+            if latex_text is not None:
+                results[image_path] = latex_text
+                continue
+            images.append(image)
+            loaded_paths.append(image_path)
+            cache_keys.append(cache_key)
+        load_time = time.perf_counter() - start_load
+        cache_hits = len(results)
+        
+        inference_time, tokens = 0.0, 0
+        if images:
+            try:
+                start_inference = time.perf_counter()
+                with tracing.span(tracing.FORMULA_DECODE, images=len(images)):
+                    pixel_values = self.processor(images=images, return_tensors="pt").pixel_values
+                    generated_ids = self.model.generate(pixel_values, **self.generate_kwargs)
+                    latex_texts = self.processor.batch_decode(generated_ids, skip_special_tokens=True)
+                inference_time = time.perf_counter() - start_inference
+                tokens = count_generated_tokens(generated_ids, self.processor.tokenizer.pad_token_id)
+                results.update(zip(loaded_paths, latex_texts))
+                finished = finished_sequences(generated_ids, self.processor.tokenizer.eos_token_id)
+                for cache_key, latex_text, complete in zip(cache_keys, latex_texts, finished):
+                    if cache_key and complete:
+                        self.result_cache.put(cache_key, latex_text)
+                with self._stats_lock:
+                    self.stats['images_truncated'] += finished.count(False)
+            except Exception as e:
+                logger.error(f"Error processing batch of {len(images)} images: {str(e)}")
+                with self._stats_lock:
+                    self.stats['images_failed'] += len(images)
+        
+        if results:
+            write_time = 0.0
+            if output_folder:
+                start_write = time.perf_counter()
+                for image_path, latex_text in results.items():
+                    output_filename = os.path.splitext(os.path.basename(image_path))[0] + '.tex'
+                    with open(os.path.join(output_folder, output_filename), 'w', encoding='utf-8') as f:
+                        f.write(latex_text)
+                write_time = time.perf_counter() - start_write
+            
+            self._record_success(load_time, inference_time, write_time, count=len(results), tokens=tokens)
+            with self._stats_lock:
+                self.stats['cache_hits'] += cache_hits
+        
+        latency = time.perf_counter() - start_batch
+        batch_stats = {
+            'size': len(image_paths),
+            'latency': latency,
+            'images_per_second': len(results) / latency if latency > 0 else 0.0
+        }
+        with self._stats_lock:
+            self.stats['batches'].append(batch_stats)
+        logger.info(f"Processed batch of {batch_stats['size']} images "
+                    f"(latency: {latency:.3f}s, {batch_stats['images_per_second']:.2f} images/second)")
+        
+        return [results.get(image_path) for image_path in image_paths]
+    
     def _process_image_worker(self, args):
         """Worker function for parallel processing"""
         image_file, input_folder, output_folder = args
@@ -127,7 +317,8 @@ class FormulaProcessor:
         return self.process_single_image(image_path, output_path)
     
     def process_batch(self, input_folder: str, output_folder: str, show_progress: bool = True, 
-                     parallel: bool = True, max_workers: Optional[int] = None) -> Dict[str, float]:
+                     parallel: bool = True, max_workers: Optional[int] = None,
+                     batch_size: Optional[int] = None) -> Dict[str, float]:
         """
         Process all formula images in a folder and save LaTeX output
         
@@ -137,6 +328,8 @@ class FormulaProcessor:
             show_progress: Whether to show a progress bar
             parallel: Whether to process images in parallel
             max_workers: Maximum number of parallel workers (None = auto)
+            batch_size: If set, decode images in batches of this size, bucketed by
+                aspect ratio, with one generate call per batch (overrides parallel)
             
         Returns:
             Dictionary containing timing statistics
@@ -147,8 +340,12 @@ class FormulaProcessor:
             'image_load_time': 0.0,
             'inference_time': 0.0,
             'file_write_time': 0.0,
+            'generated_tokens': 0,
             'images_processed': 0,
-            'images_failed': 0
+            'images_failed': 0,
+            'images_truncated': 0,
+            'cache_hits': 0,
+            'batches': []
         })
         
         start_total = time.perf_counter()
@@ -167,7 +364,15 @@ class FormulaProcessor:
         
         logger.info(f"Found {len(image_files)} images to process")
         
-        if parallel and len(image_files) > 1:
+        if batch_size:
+            # Decode images in aspect-ratio buckets, one generate call per batch
+            image_paths = [os.path.join(input_folder, image_file) for image_file in image_files]
+            batches = self._bucket_by_aspect_ratio(image_paths, batch_size)
+            logger.info(f"Processing images in {len(batches)} batches of up to {batch_size}")
+            batch_iter = tqdm(batches, desc="Processing formula batches") if show_progress else batches
+            for batch in batch_iter:
+                self.process_image_batch(batch, output_folder)
+        elif parallel and len(image_files) > 1:
             # Process images in parallel
             logger.info(f"Processing images in parallel")
             with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
@@ -208,12 +413,22 @@ class FormulaProcessor:
             logger.info(f"Model initialization time: {self.stats['model_init_time']:.3f} seconds")
             logger.info(f"Total images processed: {self.stats['images_processed']}")
             logger.info(f"Failed images: {self.stats['images_failed']}")
+            if self.stats['images_truncated']:
+                logger.warning(f"Truncated images (stopped before the end of the LaTeX): {self.stats['images_truncated']}")
+            if self.result_cache is not None:
+                logger.info(f"Result cache hits: {self.stats['cache_hits']}")
             logger.info(f"Average time per image: {avg_time:.3f} seconds")
             logger.info(f"Average image load time: {self.stats['image_load_time'] / self.stats['images_processed']:.3f} seconds")
             logger.info(f"Average inference time: {self.stats['inference_time'] / self.stats['images_processed']:.3f} seconds")
             if self.stats['file_write_time'] > 0:
                 logger.info(f"Average file write time: {self.stats['file_write_time'] / self.stats['images_processed']:.3f} seconds")
             logger.info(f"Performance: {self.stats['images_processed'] / self.stats['total_time']:.2f} images/second")
+            if self.stats['inference_time'] > 0:
+                logger.info(f"Decoding speed: {self.stats['generated_tokens'] / self.stats['inference_time']:.1f} tokens/second")
+            if self.stats['batches']:
+                latencies = sorted(batch['latency'] for batch in self.stats['batches'])
+                logger.info(f"Batches: {len(latencies)}, "
+                          f"median batch latency: {latencies[len(latencies) // 2]:.3f} seconds")
             
             # Calculate theoretical vs. actual speedup from parallelization
             if self.stats['total_time'] > 0 and self.stats['images_processed'] > 1:
@@ -232,7 +447,8 @@ def find_input_folder(base_paths):
 
 def process_formulas(input_folder: str, output_folder: str, show_progress: bool = True, 
                     parallel: bool = True, max_workers: Optional[int] = None, 
-                    use_fast: bool = True) -> Dict[str, float]:
+                    use_fast: bool = True, batch_size: Optional[int] = None,
+                    cache_results: bool = True) -> Dict[str, float]:
     """
     Process mathematical formulas from images and convert to LaTeX.
     
@@ -246,20 +462,30 @@ def process_formulas(input_folder: str, output_folder: str, show_progress: bool
         parallel: Whether to process images in parallel
         max_workers: Maximum number of parallel workers (None = auto)
         use_fast: Whether to use fast tokenization
+        batch_size: If set, decode images in batches of this size
+        cache_results: Keep a result cache in the output folder so unchanged
+            images are not decoded again on later runs
         
     Returns:
         Dictionary containing timing statistics
     """
-    processor = FormulaProcessor(use_fast=use_fast)
-    return processor.process_batch(
-        input_folder=input_folder, 
-        output_folder=output_folder, 
-        show_progress=show_progress,
-        parallel=parallel,
-        max_workers=max_workers
-    )
+    result_cache = ResultCache(os.path.join(output_folder, DEFAULT_CACHE_NAME)) if cache_results else None
+    try:
+        processor = FormulaProcessor(use_fast=use_fast, result_cache=result_cache)
+        return processor.process_batch(
+            input_folder=input_folder, 
+            output_folder=output_folder, 
+            show_progress=show_progress,
+            parallel=parallel,
+            max_workers=max_workers,
+            batch_size=batch_size
+        )
+    finally:
+        if result_cache is not None:
+            result_cache.close()
 
 def main():
+    setup_logging()
     try:
         # Get absolute paths (makes paths more reliable)
         script_dir = Path(__file__).resolve().parent
@@ -306,7 +532,8 @@ def main():
             input_folder=str(input_folder), 
             output_folder=str(output_folder),
             parallel=True,  # Enable parallel processing
-            use_fast=True   # Use fast tokenization
+            use_fast=True,  # Use fast tokenization
+            batch_size=8    # Decode formulas in batches of 8
         )
         total_time = time.perf_counter() - start_total
         
@@ -1,220 +1,195 @@
 import time
 import os
+import cv2
 import numpy as np
 import pandas as pd
-import cv2
+from functools import partial
 from pathlib import Path
-from paddleocr import PaddleOCR
+from typing import Optional, Union
 from Functions.pdf_partitioner import partition_pdf, _load_pdf_as_images
+from Functions import tracing
+from Functions.engines import checkout_engine, register_engine
+from Functions.result_cache import DEFAULT_CACHE_NAME, ResultCache, package_version
+from Functions.table_structure import table_from_ocr
+from Functions.writer import AsyncArtifactWriter
 from crop_elements import PDFElementCropper
 from formula import FormulaProcessor
 
-def intersection(box1, box2):
-    """Calculate intersection of two boxes."""
-    x1 = max(box1[0], box2[0])
-    y1 = max(box1[1], box2[1])
-    x2 = min(box1[2], box2[2])
-    y2 = min(box1[3], box2[3])
-    
-    if x2 < x1 or y2 < y1:
-        return [0, 0, 0, 0]
-    return [x1, y1, x2, y2]
-
-def iou(box1, box2):
-    """Calculate Intersection over Union of two boxes."""
-    inter_box = intersection(box1, box2)
-    inter_area = max(0, inter_box[2] - inter_box[0]) * max(0, inter_box[3] - inter_box[1])
-    
-    area1 = (box1[2] - box1[0]) * (box1[3] - box1[1])
-    area2 = (box2[2] - box2[0]) * (box2[3] - box2[1])
-    
-    iou = inter_area / (area1 + area2 - inter_area + 1e-6)
-    return iou
-
-def non_max_suppression(boxes, scores, iou_threshold):
-    """Apply non-maximum suppression to boxes.
-    
-    Args:
-        boxes: List of boxes [x1, y1, x2, y2]
-        scores: List of confidence scores
-        iou_threshold: IoU threshold for suppression
-        
-    Returns:
-        List of indices of selected boxes
-    """
-    if not boxes:
-        return []
-    
-    # Convert to numpy arrays
-    boxes = np.array(boxes)
-    scores = np.array(scores)
-    
-    # Sort by score
-    idxs = np.argsort(scores)
-    pick = []
-    
-    while len(idxs) > 0:
-        # Pick the last box (highest score)
-        last = len(idxs) - 1
-        i = idxs[last]
-        pick.append(i)
-        
-        # Find IoU with rest of the boxes
-        overlap = np.array([iou(boxes[i], boxes[idxs[idx]]) for idx in range(last)])
-        
-        # Remove boxes with IoU > threshold
-        idxs = np.delete(idxs, np.concatenate(([last], np.where(overlap > iou_threshold)[0])))
-    
-    return pick
-
-def process_table_with_ocr(table_path: str, output_dir: str) -> None:
+# Formula model loads are expensive; share warm processors for the life of the process
+register_engine("formula", FormulaProcessor)
+
+# Settings that change the reconstructed table and therefore its cache key
+TABLE_OCR_PARAMS = {
+    'use_angle_cls': True,
+    'lang': 'en',
+    'iou_threshold': 0.1,
+    'cell_iou_threshold': 0.1
+}
+
+def process_table_with_ocr(table_image: Union[str, np.ndarray], output_dir: Optional[str],
+                           result_cache: Optional[ResultCache] = None,
+                           table_name: Optional[str] = None,
+                           writer: Optional[AsyncArtifactWriter] = None) -> Optional[pd.DataFrame]:
     """Process a table image with OCR and save as CSV.
     
     Args:
-        table_path: Path to the table image
-        output_dir: Directory to save CSV output
+        table_image: Table image as an OpenCV (BGR) array, or a path to one
+        output_dir: Directory to save CSV output (None to only return the table)
+        result_cache: Optional cache of table cells, consulted before running OCR
+        table_name: Base name of the CSV file (defaults to the image file name)
+        writer: Optional background writer for the CSV (written synchronously otherwise)
+    
+    Returns:
+        The reconstructed table, or None if OCR found nothing
     """
+    if isinstance(table_image, str):
+        table_name = table_name or os.path.splitext(os.path.basename(table_image))[0]
     try:
-        # Initialize OCR
-        ocr = PaddleOCR(use_angle_cls=True, lang='en')
-        
-        # Create output directory for CSVs
-        csv_folder = os.path.join(output_dir, 'csv_tables')
-        os.makedirs(csv_folder, exist_ok=True)
+        # Unchanged tables are answered from the result cache
+        image = cv2.imread(table_image) if isinstance(table_image, str) else table_image
+        cache_key = None
+        cells = None
+        if result_cache is not None:
+            cache_key = result_cache.make_key(image, 'paddleocr', package_version('paddleocr'), TABLE_OCR_PARAMS)
+            cells = result_cache.get(cache_key)
+            if cells is not None:
+                tracing.count("table_cache_hits")
         
-        # Run OCR
-        output = ocr.ocr(table_path)[0]
-        if not output:
-            print(f"No OCR output for table: {os.path.basename(table_path)}")
-            return
-
-        # Extract bounding boxes and text
-        boxes = [line[0] for line in output]
-        texts = [line[1][0] for line in output]
-        probabilities = [line[1][1] for line in output]
-
-        # Load image to get dimensions
-        image = cv2.imread(table_path)
-        image_height, image_width = image.shape[:2]
+        if cells is None:
+            # Run OCR on a warm engine from the shared pool
+            with checkout_engine("paddleocr") as ocr, tracing.span(tracing.OCR, table=table_name):
+                output = ocr.ocr(image)[0]
+            
+            # Rebuild the table grid
+            cells = []
+            if output:
+                table_df = table_from_ocr(output, image.shape[:2],
+                                          iou_threshold=TABLE_OCR_PARAMS['iou_threshold'],
+                                          cell_iou_threshold=TABLE_OCR_PARAMS['cell_iou_threshold'])
+                cells = table_df.values.tolist()
+            if cache_key is not None:
+                result_cache.put(cache_key, cells)
         
-        # Generate horizontal and vertical boxes
-        horiz_boxes = []
-        vert_boxes = []
-
-        for box in boxes:
-            x_h, x_v = 0, int(box[0][0])
-            y_h, y_v = int(box[0][1]), 0
-            width_h, width_v = image_width, int(box[2][0] - box[0][0])
-            height_h, height_v = int(box[2][1] - box[0][1]), image_height
-
-            horiz_boxes.append([x_h, y_h, x_h + width_h, y_h + height_h])
-            vert_boxes.append([x_v, y_v, x_v + width_v, y_v + height_v])
-
-        # Apply NMS
-        horiz_out = non_max_suppression(horiz_boxes, probabilities, iou_threshold=0.1)
-        vert_out = non_max_suppression(vert_boxes, probabilities, iou_threshold=0.1)
-
-        horiz_lines = np.sort(np.array(horiz_out))
-        vert_lines = np.sort(np.array(vert_out))
-
-        # Create table structure
-        out_array = [["" for _ in range(len(vert_lines))] for _ in range(len(horiz_lines))]
-        unordered_boxes = [vert_boxes[i][0] for i in vert_lines]
-        ordered_boxes = np.argsort(unordered_boxes)
-
-        # Fill table with text
-        for i in range(len(horiz_lines)):
-            for j in range(len(vert_lines)):
-                resultant = intersection(
-                    horiz_boxes[horiz_lines[i]], 
-                    vert_boxes[vert_lines[ordered_boxes[j]]]
-                )
-
-                for b in range(len(boxes)):
-                    the_box = [boxes[b][0][0], boxes[b][0][1], boxes[b][2][0], boxes[b][2][1]]
-                    if iou(resultant, the_box) > 0.1:
-                        out_array[i][j] = texts[b]
+        if not cells:
+            print(f"No OCR output for table: {table_name}")
+            return None
+        table_df = pd.DataFrame(cells)
+        if output_dir is None:
+            return table_df
 
         # Save as CSV
-        table_filename = os.path.basename(table_path)
-        csv_filename = f"{os.path.splitext(table_filename)[0]}.csv"
+        csv_folder = os.path.join(output_dir, 'csv_tables')
+        csv_filename = f"{table_name}.csv"
         csv_path = os.path.join(csv_folder, csv_filename)
-        pd.DataFrame(out_array).to_csv(csv_path, index=False, header=False)
+        if writer is not None:
+            writer.write_csv(csv_path, table_df, index=False, header=False)
+        else:
+            os.makedirs(csv_folder, exist_ok=True)
+            table_df.to_csv(csv_path, index=False, header=False)
         print(f"Saved CSV: {csv_filename} in {csv_folder}")
+        return table_df
         
     except Exception as e:
-        print(f"Error processing table {table_path}: {str(e)}")
+        print(f"Error processing table {table_name}: {str(e)}")
+        return None
 
-def process_formula_with_ocr(formula_path: str, output_dir: str) -> None:
+def process_formula_with_ocr(formula_image: Union[str, np.ndarray], output_dir: Optional[str],
+                             formula_name: Optional[str] = None,
+                             writer: Optional[AsyncArtifactWriter] = None) -> Optional[str]:
     """Process a formula image and convert to LaTeX.
     
     Args:
-        formula_path: Path to the formula image
-        output_dir: Directory to save LaTeX output
+        formula_image: Formula image as an OpenCV (BGR) array, or a path to one
+        output_dir: Directory to save LaTeX output (None to only return the LaTeX)
+        formula_name: Base name of the .tex file (defaults to the image file name)
+        writer: Optional background writer for the .tex file (written synchronously otherwise)
+    
+    Returns:
+        The LaTeX text, or None if the formula could not be recognized
     """
+    if isinstance(formula_image, str):
+        formula_name = formula_name or os.path.splitext(os.path.basename(formula_image))[0]
     try:
-        # Initialize formula processor
-        processor = FormulaProcessor()
-        
-        # Create output directory for LaTeX files
-        latex_folder = os.path.join(output_dir, 'latex_formulas')
-        os.makedirs(latex_folder, exist_ok=True)
-        
-        # Process formula
-        latex_text = processor.process_single_formula(formula_path)
-        if latex_text:
+        # Process formula on a warm processor from the shared pool
+        with checkout_engine("formula") as processor:
+            latex_text, _ = processor.process_single_formula(formula_image)
+        if latex_text and output_dir is not None:
+            latex_folder = os.path.join(output_dir, 'latex_formulas')
+            
             # Create output filename
-            formula_filename = os.path.basename(formula_path)
-            latex_filename = f"{os.path.splitext(formula_filename)[0]}.tex"
+            latex_filename = f"{formula_name}.tex"
             latex_path = os.path.join(latex_folder, latex_filename)
             
             # Save LaTeX
-            with open(latex_path, 'w', encoding='utf-8') as f:
-                f.write(latex_text)
+            if writer is not None:
+                writer.write_text(latex_path, latex_text)
+            else:
+                os.makedirs(latex_folder, exist_ok=True)
+                with open(latex_path, 'w', encoding='utf-8') as f:
+                    f.write(latex_text)
             print(f"Saved LaTeX: {latex_filename} in {latex_folder}")
-        else:
-            print(f"No LaTeX output for formula: {os.path.basename(formula_path)}")
+        elif not latex_text:
+            print(f"No LaTeX output for formula: {formula_name}")
+        return latex_text or None
             
     except Exception as e:
-        print(f"Error processing formula {formula_path}: {str(e)}")
+        print(f"Error processing formula {formula_name}: {str(e)}")
+        return None
 
 def main():
     # Configuration - edit these values
     input_pdf = "2501.00663v1.pdf"  # Path to the input PDF file
     output_dir = "extracted_elements1"  # Base output directory
+    output_format = "files"  # "files" for PNG/CSV/.tex files, "tar" or "parquet" for shards
+    
+    # One background writer owns all crops, CSVs and LaTeX files
+    writer = AsyncArtifactWriter(workers=2, png_compression=3)
     
     # Initialize cropper
     cropper = PDFElementCropper(
         output_dir=output_dir,
         top_left_padding=10,
         bottom_right_padding=15,
-        dpi=300
+        dpi=300,
+        writer=writer,
+        output_format=output_format
     )
+    # Shards carry the OCR results next to their crops instead of CSV/.tex files
+    sharded = output_format != "files"
+
+    # Results of unchanged crops are reused across runs
+    result_cache = ResultCache(os.path.join(output_dir, DEFAULT_CACHE_NAME))
+    register_engine("formula", partial(FormulaProcessor, result_cache=result_cache))
 
     # Record the start time
     start_time = time.time()
 
     try:
-        # Process PDF and get cropped elements
-        element_counts, elements_dir = cropper.process_pdf(input_pdf)
-        
-        # Process tables with OCR
-        tables_dir = elements_dir / "Table"
-        if tables_dir.exists():
-            print("\nProcessing tables with OCR...")
-            for table_file in tables_dir.glob("*.png"):
-                print(f"\nProcessing table: {table_file.name}")
-                process_table_with_ocr(str(table_file), str(elements_dir))
+        # Stream the PDF page by page so OCR on a page's tables and formulas
+        # starts while the next page is still rendering; crops are handed over
+        # in memory while their PNGs are written in the background
+        element_counts = {}
+        elements_dir = cropper.output_dir / Path(input_pdf).stem
         
-        # Process formulas with OCR
-        formulas_dir = elements_dir / "Formula"
-        if formulas_dir.exists():
-            print("\nProcessing formulas with OCR...")
-            for formula_file in formulas_dir.glob("*.png"):
-                print(f"\nProcessing formula: {formula_file.name}")
-                process_formula_with_ocr(str(formula_file), str(elements_dir))
+        for page_result in cropper.iter_pages(input_pdf):
+            # OCR time is attributed to the crop's document and page
+            with tracing.document(Path(input_pdf).stem), tracing.page(page_result['page_number']):
+                for crop in page_result['crops']:
+                    element_counts[crop['type']] = element_counts.get(crop['type'], 0) + 1
+                
+                    if crop['type'] == "Table":
+                        print(f"\nProcessing table: {crop['name']}")
+                        table_df = process_table_with_ocr(crop['image'], None if sharded else str(elements_dir),
+                                                          result_cache, table_name=crop['name'], writer=writer)
+                        if table_df is not None:
+                            crop['ocr_text'] = table_df.to_csv(index=False, header=False)
+                    elif crop['type'] == "Formula":
+                        print(f"\nProcessing formula: {crop['name']}")
+                        crop['latex'] = process_formula_with_ocr(crop['image'], None if sharded else str(elements_dir),
+                                                                 formula_name=crop['name'], writer=writer)
         
-        # Record the end time and print summary
+        # Wait for the remaining outputs, then record the end time and print summary
+        writer.close()
         end_time = time.time()
         elapsed_time = end_time - start_time
         
@@ -223,10 +198,16 @@ def main():
         print("Elements extracted:")
         for element_type, count in element_counts.items():
             print(f"  {element_type}: {count}")
+        cache_stats = result_cache.stats
+        print(f"Result cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+        print(f"Writer: {writer.summary()}")
         print(f"\nResults saved in: {elements_dir}")
         
     except Exception as e:
         print(f"Error during processing: {str(e)}")
+    finally:
+        writer.close()
+        result_cache.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file